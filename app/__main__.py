@@ -0,0 +1,262 @@
+# __main__.py
+"""
+Обработка видео без графического интерфейса (для cron, systemd и серверов без дисплея).
+
+    python -m app process --videos /data/video --siz-model siz.pt --yolo-model yolov5s.torchscript \\
+        --db /data/reports.fdb --summary run.json
+
+Обслуживание хранилища снимков: перенос снимков из BLOB отчетов, удаление полноразмерных
+снимков старше срока хранения и файлов, на которые не ссылается ни один отчет.
+
+    python -m app compact --db /data/reports.fdb --retention-days 90
+
+Выгрузка отчетов в отдельные PDF (report_<id>.pdf) пулом процессов:
+
+    python -m app export --db /data/reports.fdb --output-dir /data/pdf --date-from 2025-04-01
+
+Qt не загружается, torch, OpenCV и reportlab импортируются только командами, которым они нужны.
+Сводка запуска в JSON печатается последней строкой вывода и, если указан --summary, пишется в файл.
+Коды завершения: 0 - успешно, 1 - ошибка обработки или нечитаемые видеофайлы, 2 - неверные параметры,
+3 - обработка остановлена сигналом (прогресс файлов сохранен в журнале).
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from .database import compact_photo_store, connect_database, database_file_path, move_photos_to_store
+from .metrics import MetricsSettings, start_metrics, stop_metrics
+from .photo_store import PhotoStore
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 3
+
+def _check_paths(args):
+    """Сообщение о первом отсутствующем входном пути или None"""
+    if not os.path.isdir(args.videos):
+        return f"Директория с видео не найдена: {args.videos}"
+    for path in (args.siz_model, args.yolo_model):
+        if not os.path.isfile(path):
+            return f"Файл модели не найден: {path}"
+    if not os.path.isfile(database_file_path(args.db)):
+        return f"Файл БД не найден: {args.db}"
+    return None
+
+def _photo_store(args):
+    if args.photo_store:
+        return PhotoStore(args.photo_store)
+    return PhotoStore.for_database(database_file_path(args.db))
+
+def _processing_options(args):
+    # Отложенный импорт: video_processor загружает torch и OpenCV
+    from .backends import InferenceSettings
+    from .video_processor import ProcessingOptions
+
+    return ProcessingOptions(
+        crop_people=args.crop_people,
+        workers=args.workers,
+        pipelined=args.pipelined,
+        batch_size=args.batch_size,
+        inference=InferenceSettings(backend=args.backend, intra_op_threads=args.threads),
+        incremental=not args.no_incremental,
+        reprocess_outdated=args.reprocess_outdated,
+        metrics=MetricsSettings(path=args.metrics_file, port=args.metrics_port,
+                                profile=args.profile, profile_path=args.profile_output),
+    )
+
+def _write_summary(result, path):
+    text = json.dumps(result, ensure_ascii=False, indent=2, default=str)
+    if path:
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    print(json.dumps(result, ensure_ascii=False, default=str))
+
+def run_process(args):
+    """Команда process: обработка директории с видео; возвращает код завершения"""
+    error = _check_paths(args)
+    if error:
+        print(error, file=sys.stderr)
+        return EXIT_USAGE
+
+    cancel_event = threading.Event()
+
+    def on_signal(signum, frame):
+        print(f"Получен сигнал {signum}, обработка останавливается")
+        cancel_event.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    result = {'status': 'failed', 'videos': os.path.abspath(args.videos), 'db': args.db,
+              'started_at': datetime.now().isoformat(timespec='seconds')}
+    started = time.perf_counter()
+    metrics = start_metrics()
+    conn = None
+    try:
+        options = _processing_options(args)
+        # Отложенный импорт: video_processor загружает torch и OpenCV
+        from .video_processor import process_videos
+
+        conn = connect_database(args.db, args.user, args.password)
+        photo_store = _photo_store(args)
+        summary = process_videos(args.yolo_model, args.siz_model, args.videos, conn, options,
+                                 photo_store=photo_store, cancel_event=cancel_event)
+        result['summary'] = summary
+        if summary['cancelled']:
+            result['status'] = 'cancelled'
+        elif summary['failed_files']:
+            result['error'] = f"Не прочитано видеофайлов: {summary['failed_files']}"
+        else:
+            result['status'] = 'ok'
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        print(f"Ошибка обработки: {str(e)}", file=sys.stderr)
+    finally:
+        if conn is not None:
+            conn.close()
+        stop_metrics()
+
+    result['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    result['elapsed_seconds'] = time.perf_counter() - started
+    result['metrics'] = metrics.snapshot()
+    try:
+        _write_summary(result, args.summary)
+    except OSError as e:
+        print(f"Ошибка записи сводки: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+    return {'ok': EXIT_OK, 'cancelled': EXIT_CANCELLED}.get(result['status'], EXIT_FAILED)
+
+def run_compact(args):
+    """Команда compact: обслуживание хранилища снимков; возвращает код завершения"""
+    if not os.path.isfile(database_file_path(args.db)):
+        print(f"Файл БД не найден: {args.db}", file=sys.stderr)
+        return EXIT_USAGE
+
+    result = {'status': 'failed', 'db': args.db, 'started_at': datetime.now().isoformat(timespec='seconds')}
+    conn = None
+    try:
+        conn = connect_database(args.db, args.user, args.password)
+        photo_store = _photo_store(args)
+        result['moved_photos'] = move_photos_to_store(conn, photo_store)
+        result.update(compact_photo_store(conn, photo_store, args.retention_days))
+        result['status'] = 'ok'
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        print(f"Ошибка обслуживания хранилища снимков: {str(e)}", file=sys.stderr)
+    finally:
+        if conn is not None:
+            conn.close()
+
+    result['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    try:
+        _write_summary(result, args.summary)
+    except OSError as e:
+        print(f"Ошибка записи сводки: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+    return EXIT_OK if result['status'] == 'ok' else EXIT_FAILED
+
+def _export_filters(args):
+    """Фильтры get_reports_page из параметров команды export"""
+    filters = {'workshop_number': args.workshop, 'camera_id': args.camera, 'violation_type': args.type}
+    if args.date_from:
+        filters['date_from'] = datetime.strptime(args.date_from, '%Y-%m-%d')
+    if args.date_to:
+        filters['date_to'] = datetime.strptime(args.date_to, '%Y-%m-%d') + timedelta(days=1)
+    return filters
+
+def run_export(args):
+    """Команда export: выгрузка отчетов в отдельные PDF; возвращает код завершения"""
+    if not os.path.isfile(database_file_path(args.db)):
+        print(f"Файл БД не найден: {args.db}", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        filters = _export_filters(args)
+    except ValueError as e:
+        print(f"Неверная дата (ожидается ГГГГ-ММ-ДД): {str(e)}", file=sys.stderr)
+        return EXIT_USAGE
+
+    result = {'status': 'failed', 'db': args.db, 'output_dir': os.path.abspath(args.output_dir),
+              'started_at': datetime.now().isoformat(timespec='seconds')}
+    try:
+        # Отложенный импорт: reportlab нужен только для выгрузки
+        from .report_generator import export_reports_parallel
+
+        paths = export_reports_parallel(args.db, args.user, args.password, args.output_dir,
+                                        _photo_store(args).root, args.workers, **filters)
+        result['exported'] = len(paths)
+        result['status'] = 'ok'
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        print(f"Ошибка выгрузки отчетов: {str(e)}", file=sys.stderr)
+
+    result['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    try:
+        _write_summary(result, args.summary)
+    except OSError as e:
+        print(f"Ошибка записи сводки: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+    return EXIT_OK if result['status'] == 'ok' else EXIT_FAILED
+
+def _add_database_arguments(parser):
+    parser.add_argument('--db', required=True, help="Путь к БД или строка подключения (sqlite:///..., firebird://...)")
+    parser.add_argument('--user', default=os.environ.get('ISC_USER', 'SYSDBA'))
+    parser.add_argument('--password', default=os.environ.get('ISC_PASSWORD', 'masterkey'))
+    parser.add_argument('--photo-store', help="Директория снимков (по умолчанию <путь к БД>.photos)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app', description="Детекция нарушений СИЗ без интерфейса")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    process = commands.add_parser('process', help="Обработка видеофайлов директории и запись нарушений в БД")
+    process.add_argument('--videos', required=True, help="Директория с видео CAMERAn_ЧЧ:ММ:СС.ДД.ММ.ГГГГ.mp4")
+    process.add_argument('--siz-model', required=True, help="Модель СИЗ (TorchScript или ONNX)")
+    process.add_argument('--yolo-model', required=True, help="Детектор людей YOLOv5 (TorchScript, ONNX или .pt)")
+    _add_database_arguments(process)
+    process.add_argument('--workers', type=int, default=1, help="Число процессов-обработчиков")
+    process.add_argument('--pipelined', action='store_true', help="Конвейерная обработка в одном процессе")
+    process.add_argument('--batch-size', type=int, default=8)
+    process.add_argument('--crop-people', action='store_true', help="Классифицировать СИЗ по вырезкам людей")
+    process.add_argument('--backend', default='auto', choices=('auto', 'torchscript', 'onnx'))
+    process.add_argument('--threads', type=int, default=0, help="Потоки инференса (0 - по умолчанию)")
+    process.add_argument('--no-incremental', action='store_true', help="Не пропускать обработанные файлы")
+    process.add_argument('--reprocess-outdated', action='store_true',
+                         help="Заново обработать файлы, обработанные другой версией моделей")
+    process.add_argument('--metrics-file', help="Файл метрик во время обработки (.json или формат Prometheus)")
+    process.add_argument('--metrics-port', type=int, help="Порт HTTP метрик на 127.0.0.1")
+    process.add_argument('--profile', choices=('cprofile', 'torch'), help="Профилирование запуска")
+    process.add_argument('--profile-output', help="Файл результата профилирования")
+    process.add_argument('--summary', help="Файл для сводки запуска в JSON")
+
+    compact = commands.add_parser('compact', help="Перенос снимков из BLOB отчетов и очистка хранилища снимков")
+    _add_database_arguments(compact)
+    compact.add_argument('--retention-days', type=int,
+                         help="Удалить полноразмерные снимки отчетов старше стольких дней (миниатюры остаются)")
+    compact.add_argument('--summary', help="Файл для сводки в JSON")
+
+    export = commands.add_parser('export', help="Выгрузка отчетов в отдельные PDF (report_<id>.pdf)")
+    _add_database_arguments(export)
+    export.add_argument('--output-dir', required=True, help="Директория для файлов PDF")
+    export.add_argument('--workers', type=int, help="Число процессов выгрузки (по умолчанию - число ядер)")
+    export.add_argument('--workshop', type=int, help="Только отчеты цеха с этим номером")
+    export.add_argument('--camera', type=int, help="Только отчеты камеры")
+    export.add_argument('--type', help="Только нарушения этого типа")
+    export.add_argument('--date-from', help="Начало периода, ГГГГ-ММ-ДД")
+    export.add_argument('--date-to', help="Конец периода (включительно), ГГГГ-ММ-ДД")
+    export.add_argument('--summary', help="Файл для сводки в JSON")
+
+    args = parser.parse_args(argv)
+    if args.command == 'compact':
+        return run_compact(args)
+    if args.command == 'export':
+        return run_export(args)
+    return run_process(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
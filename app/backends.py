@@ -0,0 +1,299 @@
+# backends.py
+import abc
+import os
+import zipfile
+import cv2
+import torch
+import numpy as np
+from dataclasses import dataclass
+from .model_utils import load_siz_model, preprocess_frames
+
+# Класс "person" в COCO и порог уверенности детектора людей
+PERSON_CLASS = 0
+DETECTION_CONFIDENCE = 0.5
+NMS_IOU_THRESHOLD = 0.45
+
+# Переменная окружения с путем к локальной копии репозитория ultralytics/yolov5
+YOLOV5_REPO_ENV = 'YOLOV5_REPO'
+
+BACKENDS = ('auto', 'torchscript', 'onnx')
+
+@dataclass(frozen=True)
+class InferenceSettings:
+    """Выбор движка инференса и число потоков"""
+    # 'auto' - по расширению файла (.onnx - ONNX Runtime), 'torchscript' или 'onnx'
+    backend: str = 'auto'
+    # Потоки внутри одной операции и между операциями (0 - значение движка по умолчанию)
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    # Оптимизированный вариант модели СИЗ из app.model_export ('int8', 'frozen'); None - исходная модель
+    siz_variant: str = None
+
+def resolve_backend(model_path, settings):
+    """Движок для файла модели с учетом настроек"""
+    if settings.backend not in BACKENDS:
+        raise ValueError(f"Неизвестный движок инференса: {settings.backend}")
+    if settings.backend != 'auto':
+        return settings.backend
+    return 'onnx' if model_path.lower().endswith('.onnx') else 'torchscript'
+
+def configure_torch_threads(settings):
+    """Применяет число потоков к torch (межоперационные потоки задаются только до первого инференса)"""
+    if settings.intra_op_threads > 0:
+        torch.set_num_threads(settings.intra_op_threads)
+    if settings.inter_op_threads > 0:
+        try:
+            torch.set_num_interop_threads(settings.inter_op_threads)
+        except RuntimeError:
+            pass
+
+def create_onnx_session(model_path, settings):
+    """Сессия ONNX Runtime на CPU с заданным числом потоков"""
+    # Необязательная зависимость: нужна только при выборе движка onnx
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if settings.intra_op_threads > 0:
+        options.intra_op_num_threads = settings.intra_op_threads
+    if settings.inter_op_threads > 0:
+        options.inter_op_num_threads = settings.inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+def is_torchscript_file(path):
+    """Проверяет, является ли файл архивом TorchScript (а не обычным чекпойнтом torch.save)"""
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return any('/code/' in name for name in archive.namelist())
+
+def letterbox(image, size):
+    """
+    Масштабирование с сохранением пропорций и дополнением до квадрата size x size, как в YOLOv5.
+    Возвращает (изображение, коэффициент масштаба, (сдвиг x, сдвиг y)).
+    """
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = cv2.resize(
+        image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (pad_x, pad_y)
+
+def non_max_suppression(boxes, scores, iou_threshold):
+    """Подавление немаксимумов; возвращает индексы оставленных рамок по убыванию уверенности"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        intersection = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = intersection / (areas[i] + areas[order[1:]] - intersection + 1e-9)
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+class TorchScriptClassifier:
+    """Классификатор СИЗ на TorchScript"""
+
+    def __init__(self, model_path, settings):
+        configure_torch_threads(settings)
+        self.model = load_siz_model(model_path, settings.siz_variant)
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+class OnnxClassifier:
+    """Классификатор СИЗ на ONNX Runtime (CPU)"""
+
+    def __init__(self, model_path, settings):
+        self.session = create_onnx_session(model_path, settings)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        if isinstance(batch, torch.Tensor):
+            batch = batch.numpy()
+        return self.session.run(None, {self.input_name: batch})[0]
+
+def load_classifier(model_path, settings=None):
+    """Загрузка классификатора СИЗ выбранным движком"""
+    settings = settings or InferenceSettings()
+    if resolve_backend(model_path, settings) == 'onnx':
+        return OnnxClassifier(model_path, settings)
+    return TorchScriptClassifier(model_path, settings)
+
+class TorchHubDetector:
+    """
+    Детектор людей на основе модели YOLOv5, загруженной через torch.hub из локальной копии
+    репозитория ultralytics/yolov5 (без обращения к сети).
+    """
+
+    def __init__(self, model_path, repo=None):
+        repo = repo or os.environ.get(YOLOV5_REPO_ENV)
+        if repo is None:
+            # Копия репозитория, сохраненная torch.hub при первой загрузке, позволяет работать без сети
+            cached_repo = os.path.join(torch.hub.get_dir(), 'ultralytics_yolov5_master')
+            repo = cached_repo if os.path.isdir(cached_repo) else None
+
+        if not repo:
+            raise RuntimeError(
+                f"Для чекпойнта {os.path.basename(model_path)} нужна локальная копия репозитория "
+                f"ultralytics/yolov5 (переменная окружения {YOLOV5_REPO_ENV}). Экспортируйте детектор "
+                "в TorchScript или ONNX (python export.py --weights yolov5s.pt --include torchscript onnx) "
+                "и укажите экспортированный файл"
+            )
+        self.model = torch.hub.load(repo, 'custom', path=model_path, source='local')
+
+        # Установка параметров для YOLO
+        self.model.conf = DETECTION_CONFIDENCE
+        self.model.classes = [PERSON_CLASS]
+
+    def detect(self, frames):
+        """Детекция людей; возвращает по кадру массив (N, 6): x1, y1, x2, y2, уверенность, класс"""
+        results = self.model(list(frames))
+        return [detections.cpu().numpy() for detections in results.xyxy]
+
+class ExportedYoloDetector(abc.ABC):
+    """
+    Общая часть детекторов по экспортированной модели YOLOv5
+    (выход (N, K, 5 + классов): cx, cy, w, h, objectness, вероятности классов).
+    """
+
+    def __init__(self, image_size=640):
+        self.image_size = image_size
+        self.max_batch = None
+
+    @abc.abstractmethod
+    def _run(self, batch):
+        """Прогон пакета (N, 3, S, S) float32 через модель; возвращает numpy (N, K, 5 + классов)"""
+
+    def _postprocess(self, predictions, scale, pad):
+        scores = predictions[:, 4] * predictions[:, 5 + PERSON_CLASS]
+        predictions = predictions[scores > DETECTION_CONFIDENCE]
+        scores = scores[scores > DETECTION_CONFIDENCE]
+        if len(predictions) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+
+        cx, cy, w, h = predictions[:, :4].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        keep = non_max_suppression(boxes, scores, NMS_IOU_THRESHOLD)
+        boxes, scores = boxes[keep], scores[keep]
+
+        # Возвращаем рамки в координаты исходного кадра
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / scale
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / scale
+        classes = np.full((len(boxes), 1), PERSON_CLASS, dtype=np.float32)
+        return np.hstack([boxes, scores[:, None], classes]).astype(np.float32)
+
+    def detect(self, frames):
+        """Детекция людей; возвращает по кадру массив (N, 6): x1, y1, x2, y2, уверенность, класс"""
+        if len(frames) == 0:
+            return []
+
+        batch = np.empty((len(frames), 3, self.image_size, self.image_size), dtype=np.float32)
+        transforms = []
+        for i, frame in enumerate(frames):
+            image, scale, pad = letterbox(frame, self.image_size)
+            # BGR -> RGB, HWC -> CHW, [0, 1]
+            batch[i] = image[..., ::-1].transpose(2, 0, 1) / 255.0
+            transforms.append((scale, pad))
+
+        # Экспорт с фиксированным размером пакета 1 обрабатывается по одному кадру;
+        # ограничение запоминается только после неудачного пакетного вызова
+        if self.max_batch is None:
+            try:
+                predictions = self._run(batch)
+            except Exception:
+                if len(frames) == 1:
+                    raise
+                self.max_batch = 1
+                predictions = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(frames))])
+        elif len(frames) <= self.max_batch:
+            predictions = self._run(batch)
+        else:
+            predictions = np.concatenate([
+                self._run(batch[i:i + self.max_batch]) for i in range(0, len(frames), self.max_batch)])
+
+        return [self._postprocess(p, scale, pad) for p, (scale, pad) in zip(predictions, transforms)]
+
+class TorchScriptDetector(ExportedYoloDetector):
+    """Детектор людей по экспорту YOLOv5 в TorchScript (export.py --include torchscript), без сети"""
+
+    def __init__(self, model_path, settings, image_size=640):
+        super().__init__(image_size)
+        configure_torch_threads(settings)
+        self.model = torch.jit.load(model_path, map_location='cpu')
+        self.model.eval()
+
+    def _run(self, batch):
+        with torch.no_grad():
+            output = self.model(torch.from_numpy(batch))
+        if isinstance(output, (tuple, list)):
+            output = output[0]
+        return output.numpy()
+
+class OnnxDetector(ExportedYoloDetector):
+    """Детектор людей по экспорту YOLOv5 в ONNX (export.py --include onnx) на ONNX Runtime"""
+
+    def __init__(self, model_path, settings, image_size=None):
+        self.session = create_onnx_session(model_path, settings)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Размер входа берется из модели, если он зафиксирован при экспорте
+        if image_size is None:
+            size = model_input.shape[-1]
+            image_size = size if isinstance(size, int) else 640
+        super().__init__(image_size)
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+def load_detector(model_path, settings=None):
+    """
+    Загрузка детектора людей: ONNX - через ONNX Runtime, экспорт TorchScript - напрямую,
+    чекпойнт .pt - через torch.hub из локальной копии репозитория YOLOv5
+    """
+    settings = settings or InferenceSettings()
+    if resolve_backend(model_path, settings) == 'onnx':
+        return OnnxDetector(model_path, settings)
+    if is_torchscript_file(model_path):
+        return TorchScriptDetector(model_path, settings)
+    configure_torch_threads(settings)
+    return TorchHubDetector(model_path)
+
+def check_backend_parity(torchscript_path, onnx_path, kind='siz', frames=None, atol=1e-3, settings=None):
+    """
+    Сравнивает выходы TorchScript и ONNX Runtime для одной модели (kind: 'siz' или 'yolo').
+    Без переданных кадров используются случайные изображения с фиксированным зерном.
+    Возвращает (совпадают ли выходы, максимальное расхождение).
+    """
+    settings = settings or InferenceSettings()
+    if frames is None:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(4)]
+
+    if kind == 'siz':
+        batch = preprocess_frames(frames).clone()
+        reference = np.asarray(TorchScriptClassifier(torchscript_path, settings)(batch))
+        candidate = np.asarray(OnnxClassifier(onnx_path, settings)(batch))
+        max_diff = float(np.abs(reference - candidate).max())
+        return max_diff <= atol, max_diff
+
+    reference = TorchScriptDetector(torchscript_path, settings).detect(frames)
+    candidate = OnnxDetector(onnx_path, settings).detect(frames)
+    max_diff = 0.0
+    for ref, cand in zip(reference, candidate):
+        if ref.shape != cand.shape:
+            return False, float('inf')
+        if len(ref):
+            max_diff = max(max_diff, float(np.abs(ref - cand).max()))
+    return max_diff <= atol, max_diff
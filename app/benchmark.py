@@ -0,0 +1,265 @@
+# benchmark.py
+"""
+Замеры производительности.
+
+    python -m app.benchmark writes --db reports.fdb --rows 500
+сравнивает запись отчетов по одному (add_report) и пакетами (ReportWriter).
+
+    python -m app.benchmark pipeline --cameras 2 --seconds 60 --output result.json
+замеряет process_videos на синтетических видео с моделями-заглушками и БД SQLite в памяти:
+кадров в секунду, время стадий (декодирование, YOLO, СИЗ, кодирование снимков, запись в БД)
+и пиковую память процесса. Работает без сети и GPU; результаты в JSON можно сравнивать между запусками.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from .database import (connect_database, create_memory_database, add_report, add_workshop, add_camera,
+                       get_all_workshops, delete_reports_by_type, ReportWriter)
+from .metrics import start_metrics, stop_metrics
+
+# Тип нарушения, которым помечаются строки замеров; они удаляются после замера
+BENCHMARK_VIOLATION = 'BENCHMARK'
+
+def _first_camera(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT CAMERA_ID FROM CAMERAS")
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError("Для замера записи в БД нужна хотя бы одна камера")
+    return row[0]
+
+def _delete_benchmark_rows(conn):
+    # Удаление через database: строки замера вычитаются и из агрегатов нарушений
+    delete_reports_by_type(conn, BENCHMARK_VIOLATION)
+
+def benchmark_report_writes(conn, rows=500, batch_rows=50, photo_size=60000):
+    """
+    Замер записи rows отчетов со снимком photo_size байт двумя способами:
+    по одному с фиксацией каждого и пакетами по batch_rows строк.
+    """
+    camera_id = _first_camera(conn)
+    photo_data = os.urandom(photo_size)
+    start_time = datetime.now()
+    result = {'rows': rows, 'batch_rows': batch_rows, 'photo_size': photo_size}
+
+    try:
+        started = time.perf_counter()
+        for i in range(rows):
+            add_report(conn, camera_id, start_time + timedelta(seconds=i), BENCHMARK_VIOLATION,
+                       photo_data=photo_data)
+        result['single_seconds'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ReportWriter(conn, batch_rows=batch_rows, flush_seconds=float('inf')) as writer:
+            for i in range(rows):
+                writer.add(camera_id, start_time + timedelta(seconds=i), BENCHMARK_VIOLATION,
+                           photo_data=photo_data)
+        result['batched_seconds'] = time.perf_counter() - started
+    finally:
+        _delete_benchmark_rows(conn)
+
+    result['single_rows_per_second'] = rows / result['single_seconds']
+    result['batched_rows_per_second'] = rows / result['batched_seconds']
+    result['speedup'] = result['single_seconds'] / result['batched_seconds']
+    return result
+
+def generate_synthetic_videos(directory, cameras=2, seconds=60, fps=25, size=(640, 360),
+                              start_time=datetime(2025, 4, 6, 8, 0, 0)):
+    """
+    Синтетические записи камер CAMERAn_ЧЧ:ММ:СС.ДД.ММ.ГГГГ.mp4: шумный фон и яркий
+    прямоугольник-"человек", который проходит через кадр первые 10 секунд каждых 20.
+    Возвращает список путей к файлам.
+    """
+    # Отложенный импорт: замер записи в БД не требует OpenCV
+    import cv2
+    import numpy as np
+
+    width, height = size
+    paths = []
+    for camera_id in range(1, cameras + 1):
+        filename = f"CAMERA{camera_id}_{start_time:%H:%M:%S}.{start_time:%d.%m.%Y}.mp4"
+        path = os.path.join(directory, filename)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        background = np.random.default_rng(camera_id).integers(0, 120, (height, width, 3), dtype=np.uint8)
+        for index in range(int(seconds * fps)):
+            frame = background.copy()
+            current_time = index / fps
+            if current_time % 20 < 10:
+                x = int(current_time % 10 / 10 * (width - 80))
+                cv2.rectangle(frame, (x, height // 4), (x + 80, height // 4 + 160), (255, 255, 255), -1)
+            writer.write(frame)
+        writer.release()
+        paths.append(path)
+    return paths
+
+def create_stub_models(directory):
+    """
+    Модели-заглушки TorchScript с интерфейсом настоящих: детектор с выходом экспорта YOLOv5
+    (человек в центре кадра, если в нем есть яркая область) и классификатор СИЗ.
+    Небольшие свертки дают стабильную вычислительную нагрузку. Возвращает (путь YOLO, путь СИЗ).
+    """
+    import torch
+
+    class StubDetector(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.features = torch.nn.Conv2d(3, 8, 3, stride=4, padding=1)
+
+        def forward(self, x):
+            features = self.features(x).mean(dim=(1, 2, 3))
+            bright = (x.amax(dim=(1, 2, 3)) > 0.95).float()
+            out = torch.zeros(x.shape[0], 1, 85)
+            out[:, 0, 0] = 320.0
+            out[:, 0, 1] = 320.0
+            out[:, 0, 2] = 100.0
+            out[:, 0, 3] = 200.0
+            out[:, 0, 4] = bright * 0.9 + features * 0.0
+            out[:, 0, 5] = 0.9
+            return out
+
+    class StubClassifier(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.features = torch.nn.Conv2d(3, 16, 3, padding=1)
+
+        def forward(self, x):
+            features = self.features(x).mean(dim=(1, 2, 3))
+            brightness = x.mean(dim=(1, 2, 3))
+            helmet = torch.sigmoid(4.0 * brightness + features * 0.0)
+            uniform = torch.sigmoid(-4.0 * brightness)
+            return torch.stack([helmet, uniform], dim=1)
+
+    torch.manual_seed(0)
+    yolo_path = os.path.join(directory, 'yolo_stub.torchscript')
+    siz_path = os.path.join(directory, 'siz_stub.pt')
+    torch.jit.script(StubDetector().eval()).save(yolo_path)
+    torch.jit.script(StubClassifier().eval()).save(siz_path)
+    return yolo_path, siz_path
+
+def _environment():
+    import cv2
+    import torch
+
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'opencv': cv2.__version__,
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+    }
+
+def benchmark_pipeline(cameras=2, seconds=60, fps=25, options=None, work_dir=None):
+    """
+    Замер process_videos на синтетических видео с моделями-заглушками и БД SQLite в памяти.
+    Загрузка и прогрев моделей в замер не входят. Возвращает словарь с окружением,
+    параметрами и результатами: кадров видео в секунду, сводка обработки,
+    время стадий и счетчики кадров (metrics.RunMetrics) и пиковая память процесса.
+    """
+    # Отложенный импорт: замер записи в БД не требует torch и OpenCV
+    from .model_registry import clear_models, get_siz_model, get_yolo_model
+    from .video_processor import ProcessingOptions, process_videos
+
+    options = options or ProcessingOptions(incremental=False)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = work_dir or temp_dir
+        video_dir = os.path.join(work_dir, 'videos')
+        os.makedirs(video_dir, exist_ok=True)
+        generate_synthetic_videos(video_dir, cameras, seconds, fps)
+        yolo_path, siz_path = create_stub_models(work_dir)
+
+        conn = create_memory_database()
+        add_workshop(conn, 1)
+        workshop_id = get_all_workshops(conn)[0][0]
+        for camera_id in range(1, cameras + 1):
+            add_camera(conn, camera_id, workshop_id)
+
+        clear_models()
+        get_yolo_model(yolo_path, options.inference)
+        get_siz_model(siz_path, options.inference)
+
+        metrics = start_metrics()
+        started = time.perf_counter()
+        try:
+            summary = process_videos(yolo_path, siz_path, video_dir, conn, options)
+        finally:
+            stop_metrics()
+            conn.close()
+        elapsed = time.perf_counter() - started
+
+    video_frames = int(cameras * seconds * fps)
+    return {
+        'environment': _environment(),
+        'parameters': {'cameras': cameras, 'seconds': seconds, 'fps': fps,
+                       'pipelined': options.pipelined, 'batch_size': options.batch_size,
+                       'workers': options.workers, 'crop_people': options.crop_people},
+        'results': {
+            'elapsed_seconds': elapsed,
+            'video_frames': video_frames,
+            'frames_per_second': video_frames / elapsed,
+            'realtime_factor': cameras * seconds / elapsed,
+            'summary': summary,
+            'stages': metrics.summary(),
+            'counters': dict(metrics.counters),
+            # ru_maxrss в Linux в килобайтах
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    }
+
+def _write_result(result, output):
+    text = json.dumps(result, ensure_ascii=False, indent=2, default=str)
+    print(text)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    writes = commands.add_parser('writes', help="Запись отчетов: по одному и пакетами")
+    writes.add_argument('--db', required=True, help="Путь к БД")
+    writes.add_argument('--user', default='SYSDBA')
+    writes.add_argument('--password', default='masterkey')
+    writes.add_argument('--rows', type=int, default=500)
+    writes.add_argument('--batch-rows', type=int, default=50)
+    writes.add_argument('--output', help="Файл для результата в JSON")
+
+    pipeline = commands.add_parser('pipeline', help="Обработка синтетических видео с моделями-заглушками")
+    pipeline.add_argument('--cameras', type=int, default=2)
+    pipeline.add_argument('--seconds', type=float, default=60)
+    pipeline.add_argument('--fps', type=int, default=25)
+    pipeline.add_argument('--pipelined', action='store_true')
+    pipeline.add_argument('--batch-size', type=int, default=8)
+    pipeline.add_argument('--crop-people', action='store_true')
+    pipeline.add_argument('--work-dir', help="Директория для видео и моделей (по умолчанию временная)")
+    pipeline.add_argument('--output', help="Файл для результата в JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'pipeline':
+        from .video_processor import ProcessingOptions
+
+        options = ProcessingOptions(pipelined=args.pipelined, batch_size=args.batch_size,
+                                    crop_people=args.crop_people, incremental=False)
+        _write_result(benchmark_pipeline(args.cameras, args.seconds, args.fps, options, args.work_dir),
+                      args.output)
+        return 0
+
+    conn = connect_database(args.db, args.user, args.password)
+    try:
+        result = benchmark_report_writes(conn, args.rows, args.batch_rows)
+    finally:
+        conn.close()
+
+    _write_result(result, args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,226 @@
-import firebird.driver as fdb
 import os
 import logging
-from datetime import datetime
+import re
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from .db_backends import BACKENDS, backend_for, parse_connection_string
+from .metrics import timed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Кэш справочника камер: путь к файлу БД -> {номер камеры: номер цеха}, общий для соединений
+# одной базы; базы в памяти (без пути) кэшируются по самому соединению.
+# Сбрасывается при изменении камер или цехов через этот модуль и при новом подключении.
+_camera_workshops = {}
+_memory_camera_workshops = weakref.WeakKeyDictionary()
+_camera_workshops_lock = threading.Lock()
+
+# Миграции схемы: (версия, описание). DDL каждой версии задается хранилищем
+# (db_backends), миграции применяются по порядку, номер последней хранится в SCHEMA_VERSION.
+SCHEMA_MIGRATIONS = [
+    (1, "Индексы отчетов по времени и камере"),
+    (2, "Снимки во внешнем хранилище и миниатюры"),
+    (3, "Журнал обработанных видеофайлов"),
+    (4, "Агрегаты нарушений по часам и дням"),
+    (5, "Рамка нарушителя в отчете"),
+    (6, "Время последней проверки СИЗ в отметке прогресса файла"),
+]
+
+# Снимки в хранилище, измененные недавно, не удаляются при уплотнении:
+# их отчеты могут быть еще не зафиксированы
+PHOTO_STORE_GRACE_SECONDS = 3600
+
+# Неудачная запись буфера отчетов повторяется столько раз (через flush_seconds, при закрытии -
+# через FLUSH_RETRY_SECONDS), прежде чем незаписанные отчеты отбрасываются с записью в лог
+FLUSH_RETRIES = 3
+FLUSH_RETRY_SECONDS = 1.0
+
+# Транзакция записи отчетов, столкнувшаяся с одновременной записью тех же строк агрегатов
+# другим соединением (поток наблюдения и обработка видео), повторяется с нарастающей паузой
+CONFLICT_RETRIES = 3
+CONFLICT_RETRY_SECONDS = 0.1
+
+INSERT_REPORT_SQL = (
+    "INSERT INTO REPORTS (CAMERA_ID, VIOLATION_TIME, VIOLATION_TYPE, PHOTO, PHOTO_HASH, THUMBNAIL, "
+    "BOX_X1, BOX_Y1, BOX_X2, BOX_Y2) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Агрегаты нарушений: таблица по длительности периода. Обновляются в той же транзакции,
+# что и вставка или удаление отчетов, поэтому сводки не зависят от размера REPORTS.
+STATS_TABLES = {'hour': 'VIOLATION_STATS_HOURLY', 'day': 'VIOLATION_STATS_DAILY'}
+
+# Смены для сводок: (название, час начала, длительность в часах)
+SHIFTS = (
+    ("Смена 1", 0, 8),
+    ("Смена 2", 8, 8),
+    ("Смена 3", 16, 8),
+)
+
+# Журнал обработанных видеофайлов: одна строка на файл. LAST_CHECK_TIME - секунда видео
+# последней проверки СИЗ до отметки LAST_FRAME: продолженная обработка сохраняет окно ожидания
+LEDGER_COLUMNS = ('FILE_NAME', 'FILE_SIZE', 'FILE_MTIME', 'CONTENT_HASH', 'LAST_FRAME',
+                  'COMPLETED', 'MODEL_VERSION', 'PROCESSED_AT', 'LAST_CHECK_TIME')
+
+def _read_blob(value):
+    """Байты BLOB: драйвер возвращает большие BLOB потоком, маленькие - байтами"""
+    if value is None or isinstance(value, bytes):
+        return value
+    if hasattr(value, 'read'):
+        data = value.read()
+        value.close()
+        return data
+    return bytes(value)
+
+def _report_row(camera_id, violation_time, violation_type, photo_data, thumbnail=None, box=None,
+                photo_store=None):
+    """
+    Строка REPORTS: при заданном хранилище снимок уходит в него, в строке остается хэш.
+    box - рамка нарушителя (x1, y1, x2, y2) или None при классификации всего кадра.
+    """
+    box = tuple(box) if box is not None else (None, None, None, None)
+    if photo_store is not None and photo_data is not None:
+        return (camera_id, violation_time, violation_type, None, photo_store.put(photo_data), thumbnail, *box)
+    return (camera_id, violation_time, violation_type, photo_data, None, thumbnail, *box)
+
+def _table_exists(conn, table_name):
+    return backend_for(conn).table_exists(conn, table_name)
+
+def _period_start(violation_time, period):
+    start = violation_time.replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if period == 'day' else start
+
+def _stats_deltas(reports):
+    """Приращения агрегатов: (период, начало периода, камера, тип) -> число отчетов"""
+    deltas = Counter()
+    for camera_id, violation_time, violation_type in reports:
+        for period in STATS_TABLES:
+            deltas[period, _period_start(violation_time, period), camera_id, violation_type] += 1
+    return deltas
+
+def _apply_stats(conn, cur, deltas, sign=1):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) приращения из агрегатов в текущей транзакции.
+    Прибавление - одним запросом хранилища с созданием строки (см. StorageBackend.stats_upsert_sql).
+    """
+    backend = backend_for(conn)
+    for (period, period_start, camera_id, violation_type), count in deltas.items():
+        table = STATS_TABLES[period]
+        if sign > 0:
+            cur.execute(backend.stats_upsert_sql(table), (period_start, camera_id, violation_type, count))
+        else:
+            cur.execute(
+                f"UPDATE {table} SET VIOLATION_COUNT = VIOLATION_COUNT - ? "
+                "WHERE PERIOD_START = ? AND CAMERA_ID = ? AND VIOLATION_TYPE = ?",
+                (count, period_start, camera_id, violation_type)
+            )
+
+def _run_transaction(conn, write):
+    """
+    Выполняет write(cur) и фиксирует транзакцию. При конфликте с одновременной записью
+    другого соединения транзакция откатывается и повторяется до CONFLICT_RETRIES раз.
+    """
+    backend = backend_for(conn)
+    for attempt in range(CONFLICT_RETRIES + 1):
+        try:
+            write(conn.cursor())
+            conn.commit()
+            return
+        except Exception as e:
+            conn.rollback()
+            if attempt == CONFLICT_RETRIES or not backend.is_conflict(e):
+                raise
+            time.sleep(CONFLICT_RETRY_SECONDS * (attempt + 1))
+
+def _backfill_violation_stats(conn):
+    """
+    Заполнение агрегатов по уже накопленным отчетам при миграции. Агрегаты пересчитываются
+    с нуля, поэтому после сбоя миграцию можно повторить.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT CAMERA_ID, VIOLATION_TIME, VIOLATION_TYPE FROM REPORTS")
+    deltas = Counter()
+    while True:
+        rows = cur.fetchmany(1000)
+        if not rows:
+            break
+        deltas.update(_stats_deltas(rows))
+    for table in STATS_TABLES.values():
+        cur.execute(f"DELETE FROM {table}")
+    _apply_stats(conn, cur, deltas)
+    conn.commit()
+
+# Заполнение новых таблиц данными после DDL миграции
+_MIGRATION_DATA = {4: _backfill_violation_stats}
+
+def get_schema_version(conn):
+    """Номер последней примененной миграции (0 для базы без миграций)"""
+    if not _table_exists(conn, 'SCHEMA_VERSION'):
+        return 0
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(VERSION) FROM SCHEMA_VERSION")
+    result = cur.fetchone()
+    return result[0] or 0
+
+def migrate_database(conn):
+    """Применение недостающих миграций схемы; каждая миграция фиксируется отдельно"""
+    cur = conn.cursor()
+    if not _table_exists(conn, 'SCHEMA_VERSION'):
+        cur.execute("CREATE TABLE SCHEMA_VERSION (VERSION INTEGER NOT NULL)")
+        conn.commit()
+
+    backend = backend_for(conn)
+    current = get_schema_version(conn)
+    for version, description in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Миграция схемы {version}: {description}")
+        try:
+            for statement in backend.migrations[version]:
+                # Таблицы, столбцы и индексы, созданные прерванной попыткой миграции
+                # (DDL SQLite фиксируется сразу), не создаются повторно
+                table = re.match(r'\s*CREATE TABLE (\w+)', statement)
+                if table and _table_exists(conn, table.group(1)):
+                    continue
+                index = re.match(r'\s*CREATE (?:UNIQUE |ASCENDING |DESCENDING )*INDEX (?:IF NOT EXISTS )?(\w+)',
+                                 statement)
+                if index and backend.index_exists(conn, index.group(1)):
+                    continue
+                column = re.match(r'\s*ALTER TABLE (\w+) ADD (?:COLUMN )?(\w+)', statement)
+                if column and backend.column_exists(conn, *column.groups()):
+                    continue
+                cur.execute(statement)
+            # DDL должен быть зафиксирован до использования новых объектов
+            conn.commit()
+            if version in _MIGRATION_DATA:
+                _MIGRATION_DATA[version](conn)
+            cur.execute("INSERT INTO SCHEMA_VERSION (VERSION) VALUES (?)", (version,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            # Версия не записана: миграция будет повторена при следующем подключении
+            logger.error(f"Ошибка миграции схемы {version}, она будет повторена при следующем подключении: "
+                         f"{str(e)}")
+            raise
+
+def database_file_path(path):
+    """Путь к файлу базы по строке подключения (без префикса хранилища)"""
+    return parse_connection_string(path)[1]
+
 def create_database(path, user, password):
-    """Создание новой базы данных с необходимыми таблицами"""
+    """
+    Создание новой базы данных с необходимыми таблицами.
+    path - путь к файлу или строка подключения ('sqlite:///...', 'firebird://...');
+    хранилище выбирается по ней (см. db_backends.parse_connection_string).
+    """
     try:
-        path = os.path.abspath(path)
-        logger.info(f"Создание БД: {path}")
+        backend, path = parse_connection_string(path)
+        logger.info(f"Создание БД ({backend.name}): {path}")
         
         os.makedirs(os.path.dirname(path), exist_ok=True)
         
@@ -18,74 +228,13 @@ def create_database(path, user, password):
             logger.warning(f"Файл БД {path} уже существует, удаляем...")
             os.remove(path)
         
-        connection_string = f"localhost/3050:{path}"
-        con = fdb.create_database(
-            connection_string,
-            user=user,
-            password=password
-        )
-        
+        con = backend.create(path, user, password)
         cur = con.cursor()
-        
-        cur.execute("""
-            CREATE TABLE WORKSHOPS (
-                WORKSHOP_ID INTEGER PRIMARY KEY,
-                WORKSHOP_NUMBER INTEGER NOT NULL UNIQUE
-            )
-        """)
-        
-        cur.execute("""
-            CREATE TABLE CAMERAS (
-                CAMERA_ID INTEGER PRIMARY KEY,
-                WORKSHOP_ID INTEGER NOT NULL REFERENCES WORKSHOPS(WORKSHOP_ID)
-            )
-        """)
-        
-        cur.execute("""
-            CREATE TABLE REPORTS (
-                REPORT_ID INTEGER PRIMARY KEY,
-                CAMERA_ID INTEGER NOT NULL REFERENCES CAMERAS(CAMERA_ID),
-                VIOLATION_TIME TIMESTAMP NOT NULL,
-                VIOLATION_TYPE VARCHAR(100) NOT NULL,  -- Увеличено до 100 символов
-                PHOTO BLOB SUB_TYPE 0 SEGMENT SIZE 16384
-            )
-        """)
-        
-        cur.execute("CREATE SEQUENCE GEN_WORKSHOP_ID")
-        cur.execute("CREATE SEQUENCE GEN_CAMERA_ID")
-        cur.execute("CREATE SEQUENCE GEN_REPORT_ID")
-        
-        cur.execute("""
-            CREATE TRIGGER WORKSHOPS_BI FOR WORKSHOPS
-            ACTIVE BEFORE INSERT POSITION 0
-            AS
-            BEGIN
-                IF (NEW.WORKSHOP_ID IS NULL) THEN
-                    NEW.WORKSHOP_ID = NEXT VALUE FOR GEN_WORKSHOP_ID;
-            END
-        """)
-        
-        cur.execute("""
-            CREATE TRIGGER CAMERAS_BI FOR CAMERAS
-            ACTIVE BEFORE INSERT POSITION 0
-            AS
-            BEGIN
-                IF (NEW.CAMERA_ID IS NULL) THEN
-                    NEW.CAMERA_ID = NEXT VALUE FOR GEN_CAMERA_ID;
-            END
-        """)
-        
-        cur.execute("""
-            CREATE TRIGGER REPORTS_BI FOR REPORTS
-            ACTIVE BEFORE INSERT POSITION 0
-            AS
-            BEGIN
-                IF (NEW.REPORT_ID IS NULL) THEN
-                    NEW.REPORT_ID = NEXT VALUE FOR GEN_REPORT_ID;
-            END
-        """)
+        for statement in backend.schema:
+            cur.execute(statement)
         
         con.commit()
+        migrate_database(con)
         con.close()
         logger.info("БД создана успешно")
         return True
@@ -93,24 +242,159 @@ def create_database(path, user, password):
         logger.error(f"Ошибка при создании БД: {str(e)}")
         return False
 
+def create_memory_database():
+    """База SQLite в памяти с полной схемой: для замеров и проверок без файла БД и сервера"""
+    backend = BACKENDS['sqlite']
+    conn = backend.connect(':memory:', None, None)
+    cur = conn.cursor()
+    for statement in backend.schema:
+        cur.execute(statement)
+    conn.commit()
+    migrate_database(conn)
+    return conn
+
 def connect_database(path, user, password):
-    """Подключение к существующей базе данных"""
-    path = os.path.abspath(path)
+    """Подключение к существующей базе данных (путь к файлу или строка подключения)"""
+    backend, path = parse_connection_string(path)
     if not os.path.exists(path):
         raise FileNotFoundError(f"Database file not found: {path}")
     
-    logger.info(f"Подключение к БД: {path}")
+    logger.info(f"Подключение к БД ({backend.name}): {path}")
+    invalidate_camera_workshops()
     try:
-        connection_string = f"localhost/3050:{path}"
-        return fdb.connect(
-            connection_string,
-            user=user,
-            password=password
-        )
+        conn = backend.connect(path, user, password)
+        migrate_database(conn)
+        return conn
     except Exception as e:
         logger.error(f"Ошибка подключения к БД: {str(e)}")
         raise
 
+class ConnectionPool:
+    """
+    Пул соединений с одной базой. Каждый поток (обработка видео, окно отчетов,
+    выгрузка PDF) берет себе отдельное соединение и возвращает его после работы.
+    Соединение, простоявшее дольше ping_after_seconds, перед выдачей проверяется
+    запросом к базе; сломанные соединения закрываются и заменяются новыми.
+    После fork/spawn соединения родительского процесса не используются.
+    """
+
+    def __init__(self, path, user, password, max_size=4, timeout=30.0, ping_after_seconds=30.0):
+        self.backend, self.path = parse_connection_string(path)
+        self.target = path
+        self.user = user
+        self.password = password
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after_seconds = ping_after_seconds
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = []
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._migrated = False
+        self._closed = False
+
+    def _connect(self):
+        # Первое соединение проверяет и обновляет схему, остальные открываются напрямую
+        if not self._migrated:
+            conn = connect_database(self.target, self.user, self.password)
+            self._migrated = True
+            return conn
+        return self.backend.connect(self.path, self.user, self.password)
+
+    def _is_alive(self, conn):
+        try:
+            cur = conn.cursor()
+            cur.execute(self.backend.ping_sql)
+            cur.fetchall()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _check_process(self):
+        # Соединения, унаследованные от родительского процесса, принадлежат ему
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle = []
+            self._slots = threading.BoundedSemaphore(self.max_size)
+            self._local = threading.local()
+
+    def acquire(self):
+        """Выдает соединение в монопольное пользование; вернуть через release"""
+        with self._lock:
+            self._check_process()
+            slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Нет свободных соединений с БД ({self.max_size} заняты)")
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, released_at = self._idle.pop()
+                if time.monotonic() - released_at < self.ping_after_seconds or self._is_alive(conn):
+                    return conn
+                logger.warning("Соединение с БД потеряно, переподключение")
+                self._close_quietly(conn)
+            return self._connect()
+        except Exception:
+            slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Возвращает соединение в пул; сломанное соединение закрывается"""
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._lock:
+            if not broken and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+        if conn is not None:
+            self._close_quietly(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение на время блока with. Вложенные блоки в том же потоке
+        получают то же соединение.
+        """
+        current = getattr(self._local, 'conn', None)
+        if current is not None:
+            yield current
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            # Ошибка могла быть вызвана обрывом связи: такое соединение в пул не возвращается
+            broken = not self._is_alive(conn)
+            raise
+        finally:
+            self._local.conn = None
+            self.release(conn, broken)
+
+    def close(self):
+        """Закрывает свободные соединения; выданные закрываются при возврате"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
 def add_workshop(conn, workshop_number):
     """Добавление нового цеха в базу данных"""
     cur = conn.cursor()
@@ -118,6 +402,7 @@ def add_workshop(conn, workshop_number):
         cur.execute("INSERT INTO WORKSHOPS (WORKSHOP_NUMBER) VALUES (?)", 
                     (workshop_number,))
         conn.commit()
+        invalidate_camera_workshops()
         return True
     except Exception as e:
         logger.error(f"Ошибка добавления цеха: {str(e)}")
@@ -130,29 +415,176 @@ def add_camera(conn, camera_id, workshop_id):
         cur.execute("INSERT INTO CAMERAS (CAMERA_ID, WORKSHOP_ID) VALUES (?, ?)", 
                     (camera_id, workshop_id))
         conn.commit()
+        invalidate_camera_workshops()
         return True
     except Exception as e:
         logger.error(f"Ошибка добавления камеры: {str(e)}")
         return False
 
-def add_report(conn, camera_id, violation_time, violation_type, photo_path):
-    """Добавление отчета о нарушении в базу данных"""
+def add_report(conn, camera_id, violation_time, violation_type, photo_path=None, photo_data=None,
+               thumbnail=None, photo_store=None, box=None):
+    """
+    Добавление отчета о нарушении в базу данных.
+    Фото передается путем к файлу (photo_path) или готовыми байтами JPEG (photo_data).
+    Если задано хранилище photo_store, снимок сохраняется в нем, а не в BLOB отчета.
+    """
     try:
-        with open(photo_path, 'rb') as f:
-            photo_data = f.read()
+        if photo_data is None:
+            with open(photo_path, 'rb') as f:
+                photo_data = f.read()
         
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO REPORTS (CAMERA_ID, VIOLATION_TIME, VIOLATION_TYPE, PHOTO) "
-            "VALUES (?, ?, ?, ?)",
-            (camera_id, violation_time, violation_type, photo_data)
-        )
-        conn.commit()
+        row = _report_row(camera_id, violation_time, violation_type, photo_data, thumbnail, box, photo_store)
+
+        def write(cur):
+            cur.execute(INSERT_REPORT_SQL, row)
+            _apply_stats(conn, cur, _stats_deltas([(camera_id, violation_time, violation_type)]))
+
+        _run_transaction(conn, write)
         return True
     except Exception as e:
         logger.error(f"Ошибка добавления отчета: {str(e)}")
         return False
 
+def add_reports_batch(conn, reports, photo_store=None, ledger_rows=()):
+    """
+    Пакетное добавление отчетов одной транзакцией.
+    reports - последовательность кортежей
+    (camera_id, violation_time, violation_type, photo_data[, thumbnail[, рамка нарушителя]]).
+    ledger_rows - записи журнала обработанных файлов (LEDGER_COLUMNS), фиксируемые
+    в той же транзакции: отметка о прогрессе не опережает записанные отчеты.
+    """
+    if not reports and not ledger_rows:
+        return True
+
+    def write(cur):
+        if reports:
+            cur.executemany(INSERT_REPORT_SQL, rows)
+            _apply_stats(conn, cur, _stats_deltas(report[:3] for report in reports))
+        for row in ledger_rows:
+            _save_ledger_row(cur, row)
+
+    try:
+        with timed('db_write'):
+            rows = [_report_row(*report, photo_store=photo_store) for report in reports]
+            _run_transaction(conn, write)
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка пакетного добавления отчетов ({len(reports)}): {str(e)}")
+        return False
+
+class ReportWriter:
+    """
+    Буферизованная запись отчетов: нарушения накапливаются и записываются
+    одной транзакцией каждые batch_rows строк или flush_seconds секунд, а также при закрытии.
+    Если пакет не записался, отчеты записываются по одному, чтобы ошибочная строка не теряла
+    остальные; незаписанные отчеты и отметки журнала остаются в буфере до следующей попытки
+    (временная блокировка, обрыв связи) и отбрасываются после FLUSH_RETRIES неудач.
+    """
+
+    def __init__(self, conn, batch_rows=50, flush_seconds=5.0, photo_store=None):
+        self.conn = conn
+        self.photo_store = photo_store
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.pending = []
+        self.checkpoints = {}
+        self.first_pending_time = None
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+
+    def add(self, camera_id, violation_time, violation_type, photo_path=None, photo_data=None, thumbnail=None,
+            box=None):
+        """
+        Добавляет отчет в буфер (фото - путь к файлу или байты JPEG, миниатюра - байты JPEG,
+        box - рамка нарушителя на снимке)
+        """
+        if photo_data is None:
+            with open(photo_path, 'rb') as f:
+                photo_data = f.read()
+        if not self.pending and not self.checkpoints:
+            self.first_pending_time = time.monotonic()
+        self.pending.append((camera_id, violation_time, violation_type, photo_data, thumbnail, box))
+        self.flush_if_due()
+        return True
+
+    def checkpoint(self, ledger_row):
+        """
+        Отметка о прогрессе обработки файла (запись журнала, LEDGER_COLUMNS).
+        Записывается вместе со следующим пакетом отчетов; из нескольких отметок
+        одного файла сохраняется последняя.
+        """
+        if not self.pending and not self.checkpoints:
+            self.first_pending_time = time.monotonic()
+        self.checkpoints[ledger_row[0]] = ledger_row
+        self.flush_if_due()
+
+    def delete_reports(self, camera_id, time_from, time_to):
+        """Записывает буфер и удаляет отчеты камеры за период (см. delete_reports_between)"""
+        self.flush()
+        return delete_reports_between(self.conn, camera_id, time_from, time_to)
+
+    def flush_if_due(self):
+        """Записывает буфер, если он заполнен или ждет дольше flush_seconds"""
+        if not self.pending and not self.checkpoints:
+            return
+        waited = time.monotonic() - self.first_pending_time
+        # После неудачной записи следующая попытка - не раньше чем через flush_seconds
+        if waited >= self.flush_seconds or (len(self.pending) >= self.batch_rows and not self.retries):
+            self.flush()
+
+    def flush(self):
+        """Записывает все накопленные отчеты одной транзакцией; False, если что-то не записано"""
+        if not self.pending and not self.checkpoints:
+            return True
+        reports, self.pending = self.pending, []
+        checkpoints, self.checkpoints = self.checkpoints, {}
+        if add_reports_batch(self.conn, reports, self.photo_store, list(checkpoints.values())):
+            self.written += len(reports)
+            self.retries = 0
+            return True
+
+        kept = []
+        for report in reports:
+            if add_reports_batch(self.conn, [report], self.photo_store):
+                self.written += 1
+            else:
+                kept.append(report)
+        if not kept and add_reports_batch(self.conn, [], self.photo_store, list(checkpoints.values())):
+            self.retries = 0
+            return True
+
+        self.retries += 1
+        if self.retries < FLUSH_RETRIES:
+            self.pending = kept + self.pending
+            self.checkpoints = {**checkpoints, **self.checkpoints}
+            self.first_pending_time = time.monotonic()
+            return False
+
+        for camera_id, violation_time, violation_type, *_ in kept:
+            logger.error(f"Отчет не записан и отброшен: камера {camera_id}, {violation_time}, {violation_type}")
+        self.failed += len(kept)
+        self.retries = 0
+        # Отметки журнала записываются и без отброшенных отчетов: иначе повторная обработка
+        # файла продублировала бы уже записанные отчеты
+        if not add_reports_batch(self.conn, [], self.photo_store, list(checkpoints.values())):
+            logger.error(f"Отметки журнала обработки не записаны: {', '.join(checkpoints)}")
+        return False
+
+    def close(self):
+        """Записывает буфер, повторяя неудачную запись до FLUSH_RETRIES раз"""
+        while not self.flush():
+            if not self.pending and not self.checkpoints:
+                return False
+            time.sleep(FLUSH_RETRY_SECONDS)
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 def get_all_workshops(conn):
     """Получение списка всех цехов"""
     cur = conn.cursor()
@@ -171,6 +603,32 @@ def get_workshop_by_camera(conn, camera_id):
     result = cur.fetchone()
     return result[0] if result else None
 
+def get_camera_workshops(conn):
+    """
+    Справочник камер: {номер камеры: номер цеха}.
+    Загружается одним запросом и кэшируется до изменения камер или цехов.
+    """
+    path = backend_for(conn).database_path(conn)
+    cache, key = (_camera_workshops, path) if path else (_memory_camera_workshops, conn)
+    with _camera_workshops_lock:
+        directory = cache.get(key)
+        if directory is None:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT c.CAMERA_ID, w.WORKSHOP_NUMBER
+                FROM CAMERAS c
+                JOIN WORKSHOPS w ON c.WORKSHOP_ID = w.WORKSHOP_ID
+            """)
+            directory = dict(cur.fetchall())
+            cache[key] = directory
+        return directory
+
+def invalidate_camera_workshops():
+    """Сброс кэша справочника камер"""
+    with _camera_workshops_lock:
+        _camera_workshops.clear()
+        _memory_camera_workshops.clear()
+
 def get_all_reports(conn):
     """Получение всех отчетов с информацией о цехе"""
     cur = conn.cursor()
@@ -183,15 +641,274 @@ def get_all_reports(conn):
     """)
     return cur.fetchall()
 
-def get_report_photo(conn, report_id):
-    """Получение фото отчета по ID"""
+def get_reports_page(conn, page_size=100, after=None, date_from=None, date_to=None,
+                     workshop_number=None, camera_id=None, violation_type=None):
+    """
+    Страница отчетов с информацией о цехе, новые сверху.
+    Постраничный выбор по ключу: after - (VIOLATION_TIME, REPORT_ID) последней строки
+    предыдущей страницы, поэтому стоимость запроса не растет с номером страницы.
+    Фильтры: период [date_from, date_to), номер цеха, номер камеры, подстрока типа нарушения.
+    """
+    conditions = []
+    params = []
+    if after is not None:
+        after_time, after_id = after
+        conditions.append("(r.VIOLATION_TIME < ? OR (r.VIOLATION_TIME = ? AND r.REPORT_ID < ?))")
+        params.extend([after_time, after_time, after_id])
+    if date_from is not None:
+        conditions.append("r.VIOLATION_TIME >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("r.VIOLATION_TIME < ?")
+        params.append(date_to)
+    if workshop_number is not None:
+        conditions.append("w.WORKSHOP_NUMBER = ?")
+        params.append(workshop_number)
+    if camera_id is not None:
+        conditions.append("r.CAMERA_ID = ?")
+        params.append(camera_id)
+    if violation_type:
+        conditions.append("r.VIOLATION_TYPE LIKE ?")
+        params.append(f"%{violation_type}%")
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT r.REPORT_ID, r.CAMERA_ID, r.VIOLATION_TIME, r.VIOLATION_TYPE, w.WORKSHOP_NUMBER 
+        FROM REPORTS r
+        JOIN CAMERAS c ON r.CAMERA_ID = c.CAMERA_ID
+        JOIN WORKSHOPS w ON c.WORKSHOP_ID = w.WORKSHOP_ID
+        {where}
+        ORDER BY r.VIOLATION_TIME DESC, r.REPORT_ID DESC
+        {backend_for(conn).limit(page_size)}
+    """, params)
+    return cur.fetchall()
+
+def get_report_photo(conn, report_id, photo_store=None):
+    """
+    Получение фото отчета по ID (из BLOB отчета или из хранилища снимков).
+    Если полноразмерный снимок удален по сроку хранения (compact_photo_store), возвращается миниатюра.
+    """
     cur = conn.cursor()
-    cur.execute("SELECT PHOTO FROM REPORTS WHERE REPORT_ID = ?", (report_id,))
+    cur.execute("SELECT PHOTO, PHOTO_HASH, THUMBNAIL FROM REPORTS WHERE REPORT_ID = ?", (report_id,))
     result = cur.fetchone()
-    if result:
-        blob_reader = result[0]
-        photo_data = blob_reader.read()
-        blob_reader.close()
-        return photo_data
-    else:
+    if not result:
         return None
+    photo_data, photo_hash = _read_blob(result[0]), result[1]
+    if photo_data is None and photo_hash and photo_store is not None:
+        photo_data = photo_store.get(photo_hash)
+    if photo_data is None:
+        return _read_blob(result[2])
+    return photo_data
+
+def get_report_thumbnail(conn, report_id):
+    """Получение миниатюры снимка отчета по ID"""
+    cur = conn.cursor()
+    cur.execute("SELECT THUMBNAIL FROM REPORTS WHERE REPORT_ID = ?", (report_id,))
+    result = cur.fetchone()
+    return _read_blob(result[0]) if result else None
+
+def move_photos_to_store(conn, photo_store, batch_size=100):
+    """
+    Перенос снимков из BLOB отчетов в хранилище снимков порциями по batch_size.
+    Место в файле БД освобождается после резервного копирования и восстановления (gbak).
+    Возвращает число перенесенных снимков.
+    """
+    moved = 0
+    cur = conn.cursor()
+    while True:
+        cur.execute(f"""
+            SELECT REPORT_ID, PHOTO FROM REPORTS
+            WHERE PHOTO IS NOT NULL AND PHOTO_HASH IS NULL
+            {backend_for(conn).limit(batch_size)}
+        """)
+        rows = [(report_id, _read_blob(photo)) for report_id, photo in cur.fetchall()]
+        if not rows:
+            return moved
+        cur.executemany(
+            "UPDATE REPORTS SET PHOTO = NULL, PHOTO_HASH = ? WHERE REPORT_ID = ?",
+            [(photo_store.put(photo), report_id) for report_id, photo in rows]
+        )
+        conn.commit()
+        moved += len(rows)
+
+def compact_photo_store(conn, photo_store, retention_days=None):
+    """
+    Обслуживание хранилища снимков.
+    При заданном retention_days у отчетов старше этого срока удаляются полноразмерные снимки
+    (метаданные и миниатюры остаются), затем из хранилища удаляются снимки,
+    на которые не ссылается ни один отчет.
+    """
+    result = {'released_reports': 0, 'deleted_files': 0, 'freed_bytes': 0}
+    cur = conn.cursor()
+    if retention_days is not None:
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        cur.execute(
+            "UPDATE REPORTS SET PHOTO = NULL, PHOTO_HASH = NULL "
+            "WHERE VIOLATION_TIME < ? AND (PHOTO IS NOT NULL OR PHOTO_HASH IS NOT NULL)",
+            (cutoff,)
+        )
+        result['released_reports'] = cur.rowcount
+        conn.commit()
+
+    cur.execute("SELECT DISTINCT PHOTO_HASH FROM REPORTS WHERE PHOTO_HASH IS NOT NULL")
+    referenced = {row[0] for row in cur.fetchall()}
+    grace_limit = time.time() - PHOTO_STORE_GRACE_SECONDS
+    for photo_hash in list(photo_store.iter_hashes()):
+        if photo_hash in referenced:
+            continue
+        if os.path.getmtime(photo_store.path_for(photo_hash)) > grace_limit:
+            continue
+        result['freed_bytes'] += photo_store.delete(photo_hash)
+        result['deleted_files'] += 1
+    logger.info(f"Уплотнение хранилища снимков: {result}")
+    return result
+
+def _save_ledger_row(cur, row):
+    # Обновление или вставка без диалектного UPSERT: одинаково для всех хранилищ
+    cur.execute(
+        f"UPDATE PROCESSED_FILES SET {', '.join(f'{column} = ?' for column in LEDGER_COLUMNS[1:])} "
+        "WHERE FILE_NAME = ?",
+        tuple(row[1:]) + (row[0],)
+    )
+    if cur.rowcount == 0:
+        cur.execute(
+            f"INSERT INTO PROCESSED_FILES ({', '.join(LEDGER_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in LEDGER_COLUMNS)})",
+            tuple(row)
+        )
+
+def get_processed_files(conn):
+    """Журнал обработанных файлов: имя файла -> кортеж значений LEDGER_COLUMNS"""
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(LEDGER_COLUMNS)} FROM PROCESSED_FILES")
+    return {row[0]: tuple(row) for row in cur.fetchall()}
+
+def save_processed_file(conn, row):
+    """Сохраняет запись журнала обработанных файлов (кортеж значений LEDGER_COLUMNS)"""
+    cur = conn.cursor()
+    try:
+        _save_ledger_row(cur, row)
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Ошибка записи журнала обработки {row[0]}: {str(e)}")
+        return False
+
+def delete_reports_between(conn, camera_id, time_from, time_to):
+    """
+    Удаляет отчеты камеры за период [time_from, time_to) перед повторной обработкой
+    видеофайла. Снимки в хранилище удаляются позже при уплотнении (compact_photo_store).
+    Возвращает число удаленных отчетов.
+    """
+    return _delete_reports(conn, "CAMERA_ID = ? AND VIOLATION_TIME >= ? AND VIOLATION_TIME < ?",
+                           (camera_id, time_from, time_to))
+
+def delete_reports_by_type(conn, violation_type):
+    """Удаляет все отчеты с типом нарушения violation_type; возвращает их число"""
+    return _delete_reports(conn, "VIOLATION_TYPE = ?", (violation_type,))
+
+def _delete_reports(conn, where, params):
+    """Удаление отчетов по условию с вычитанием их из агрегатов в той же транзакции"""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT CAMERA_ID, VIOLATION_TIME, VIOLATION_TYPE FROM REPORTS WHERE {where}", params)
+        _apply_stats(conn, cur, _stats_deltas(cur.fetchall()), sign=-1)
+        cur.execute(f"DELETE FROM REPORTS WHERE {where}", params)
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
+    except Exception:
+        conn.rollback()
+        raise
+
+def _stats_source(date_from, date_to):
+    """Дневные агрегаты, если границы периода совпадают с началом суток, иначе часовые"""
+    aligned = all(value is None or value == _period_start(value, 'day') for value in (date_from, date_to))
+    return STATS_TABLES['day' if aligned else 'hour']
+
+def _stats_filters(date_from=None, date_to=None, workshop_number=None, camera_id=None, violation_type=None):
+    conditions = []
+    params = []
+    if date_from is not None:
+        conditions.append("s.PERIOD_START >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("s.PERIOD_START < ?")
+        params.append(date_to)
+    if workshop_number is not None:
+        conditions.append("w.WORKSHOP_NUMBER = ?")
+        params.append(workshop_number)
+    if camera_id is not None:
+        conditions.append("s.CAMERA_ID = ?")
+        params.append(camera_id)
+    if violation_type is not None:
+        conditions.append("s.VIOLATION_TYPE = ?")
+        params.append(violation_type)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+def get_top_cameras(conn, date_from=None, date_to=None, limit=10, workshop_number=None, violation_type=None):
+    """
+    Камеры с наибольшим числом нарушений за период [date_from, date_to) по агрегатам.
+    Возвращает список (камера, номер цеха, число нарушений) по убыванию числа.
+    """
+    where, params = _stats_filters(date_from, date_to, workshop_number, None, violation_type)
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT s.CAMERA_ID, w.WORKSHOP_NUMBER, SUM(s.VIOLATION_COUNT)
+        FROM {_stats_source(date_from, date_to)} s
+        JOIN CAMERAS c ON s.CAMERA_ID = c.CAMERA_ID
+        JOIN WORKSHOPS w ON c.WORKSHOP_ID = w.WORKSHOP_ID
+        {where}
+        GROUP BY s.CAMERA_ID, w.WORKSHOP_NUMBER
+        HAVING SUM(s.VIOLATION_COUNT) > 0
+        ORDER BY 3 DESC, 1
+        {backend_for(conn).limit(limit)}
+    """, params)
+    return cur.fetchall()
+
+def get_violation_trend(conn, period='day', date_from=None, date_to=None, workshop_number=None,
+                        camera_id=None, violation_type=None):
+    """
+    Динамика нарушений по часам (period='hour') или дням (period='day').
+    Возвращает список (начало периода, тип нарушения, число нарушений) по возрастанию времени.
+    """
+    where, params = _stats_filters(date_from, date_to, workshop_number, camera_id, violation_type)
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT s.PERIOD_START, s.VIOLATION_TYPE, SUM(s.VIOLATION_COUNT)
+        FROM {STATS_TABLES[period]} s
+        JOIN CAMERAS c ON s.CAMERA_ID = c.CAMERA_ID
+        JOIN WORKSHOPS w ON c.WORKSHOP_ID = w.WORKSHOP_ID
+        {where}
+        GROUP BY s.PERIOD_START, s.VIOLATION_TYPE
+        HAVING SUM(s.VIOLATION_COUNT) > 0
+        ORDER BY s.PERIOD_START, s.VIOLATION_TYPE
+    """, params)
+    return cur.fetchall()
+
+def get_shift_summary(conn, day, shifts=SHIFTS, workshop_number=None):
+    """
+    Сводка нарушений по сменам суток day (datetime.date или datetime) по часовым агрегатам.
+    Возвращает список (смена, номер цеха, тип нарушения, число нарушений).
+    """
+    day_start = datetime(day.year, day.month, day.day)
+    summary = []
+    cur = conn.cursor()
+    for name, start_hour, hours in shifts:
+        shift_start = day_start + timedelta(hours=start_hour)
+        where, params = _stats_filters(shift_start, shift_start + timedelta(hours=hours), workshop_number)
+        cur.execute(f"""
+            SELECT w.WORKSHOP_NUMBER, s.VIOLATION_TYPE, SUM(s.VIOLATION_COUNT)
+            FROM {STATS_TABLES['hour']} s
+            JOIN CAMERAS c ON s.CAMERA_ID = c.CAMERA_ID
+            JOIN WORKSHOPS w ON c.WORKSHOP_ID = w.WORKSHOP_ID
+            {where}
+            GROUP BY w.WORKSHOP_NUMBER, s.VIOLATION_TYPE
+            HAVING SUM(s.VIOLATION_COUNT) > 0
+            ORDER BY w.WORKSHOP_NUMBER, s.VIOLATION_TYPE
+        """, params)
+        summary.extend((name,) + tuple(row) for row in cur.fetchall())
+    return summary
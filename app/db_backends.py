@@ -0,0 +1,439 @@
+# db_backends.py
+import abc
+import os
+import sqlite3
+import weakref
+from datetime import datetime
+
+# Префиксы строки подключения и расширения файлов, по которым выбирается хранилище
+SQLITE_PREFIX = 'sqlite:///'
+FIREBIRD_PREFIX = 'firebird://'
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# Агрегаты нарушений по часам и дням (одинаковый DDL для всех хранилищ)
+STATS_TABLES_DDL = [
+    f"""
+        CREATE TABLE {table} (
+            PERIOD_START TIMESTAMP NOT NULL,
+            CAMERA_ID INTEGER NOT NULL,
+            VIOLATION_TYPE VARCHAR(100) NOT NULL,
+            VIOLATION_COUNT INTEGER NOT NULL,
+            PRIMARY KEY (PERIOD_START, CAMERA_ID, VIOLATION_TYPE)
+        )
+    """
+    for table in ('VIOLATION_STATS_HOURLY', 'VIOLATION_STATS_DAILY')
+]
+
+class StorageBackend(abc.ABC):
+    """
+    Диалект хранилища отчетов: создание и открытие базы, базовая схема,
+    DDL миграций и отличия синтаксиса запросов. Функции app.database
+    работают с соединением любого хранилища и берут отличия отсюда.
+    """
+    name = None
+    # Базовая схема (таблицы WORKSHOPS, CAMERAS, REPORTS) и DDL миграций по номерам версий
+    schema = []
+    migrations = {}
+    # Запрос проверки живости соединения
+    ping_sql = None
+    # Фрагменты текста ошибок одновременной записи тех же строк другим соединением
+    conflict_markers = ()
+
+    @abc.abstractmethod
+    def create(self, path, user, password):
+        """Создает файл базы и возвращает соединение с ним"""
+
+    @abc.abstractmethod
+    def connect(self, path, user, password):
+        """Открывает соединение с существующей базой"""
+
+    @abc.abstractmethod
+    def table_exists(self, conn, table_name):
+        """Есть ли в базе таблица table_name"""
+
+    @abc.abstractmethod
+    def column_exists(self, conn, table_name, column_name):
+        """Есть ли в таблице table_name столбец column_name"""
+
+    @abc.abstractmethod
+    def index_exists(self, conn, index_name):
+        """Есть ли в базе индекс index_name"""
+
+    @abc.abstractmethod
+    def database_path(self, conn):
+        """Путь к файлу базы соединения (пустая строка для базы в памяти)"""
+
+    @abc.abstractmethod
+    def limit(self, rows):
+        """Ограничение числа строк в конце SELECT"""
+
+    @abc.abstractmethod
+    def stats_upsert_sql(self, table):
+        """
+        Прибавление к строке агрегата с ее созданием при отсутствии одним запросом.
+        Параметры: начало периода, камера, тип нарушения, приращение.
+        """
+
+    def is_conflict(self, error):
+        """Ошибка одновременной записи (блокировка, конфликт обновления): транзакцию можно повторить"""
+        message = str(error).lower()
+        return any(marker in message for marker in self.conflict_markers)
+
+class FirebirdBackend(StorageBackend):
+    """Сервер Firebird (localhost/3050)"""
+    name = 'firebird'
+    ping_sql = "SELECT 1 FROM RDB$DATABASE"
+    conflict_markers = ('update conflicts with concurrent update', 'lock conflict', 'deadlock',
+                        'violation of primary or unique key')
+
+    schema = [
+        """
+            CREATE TABLE WORKSHOPS (
+                WORKSHOP_ID INTEGER PRIMARY KEY,
+                WORKSHOP_NUMBER INTEGER NOT NULL UNIQUE
+            )
+        """,
+        """
+            CREATE TABLE CAMERAS (
+                CAMERA_ID INTEGER PRIMARY KEY,
+                WORKSHOP_ID INTEGER NOT NULL REFERENCES WORKSHOPS(WORKSHOP_ID)
+            )
+        """,
+        """
+            CREATE TABLE REPORTS (
+                REPORT_ID INTEGER PRIMARY KEY,
+                CAMERA_ID INTEGER NOT NULL REFERENCES CAMERAS(CAMERA_ID),
+                VIOLATION_TIME TIMESTAMP NOT NULL,
+                VIOLATION_TYPE VARCHAR(100) NOT NULL,  -- Увеличено до 100 символов
+                PHOTO BLOB SUB_TYPE 0 SEGMENT SIZE 16384
+            )
+        """,
+        "CREATE SEQUENCE GEN_WORKSHOP_ID",
+        "CREATE SEQUENCE GEN_CAMERA_ID",
+        "CREATE SEQUENCE GEN_REPORT_ID",
+        """
+            CREATE TRIGGER WORKSHOPS_BI FOR WORKSHOPS
+            ACTIVE BEFORE INSERT POSITION 0
+            AS
+            BEGIN
+                IF (NEW.WORKSHOP_ID IS NULL) THEN
+                    NEW.WORKSHOP_ID = NEXT VALUE FOR GEN_WORKSHOP_ID;
+            END
+        """,
+        """
+            CREATE TRIGGER CAMERAS_BI FOR CAMERAS
+            ACTIVE BEFORE INSERT POSITION 0
+            AS
+            BEGIN
+                IF (NEW.CAMERA_ID IS NULL) THEN
+                    NEW.CAMERA_ID = NEXT VALUE FOR GEN_CAMERA_ID;
+            END
+        """,
+        """
+            CREATE TRIGGER REPORTS_BI FOR REPORTS
+            ACTIVE BEFORE INSERT POSITION 0
+            AS
+            BEGIN
+                IF (NEW.REPORT_ID IS NULL) THEN
+                    NEW.REPORT_ID = NEXT VALUE FOR GEN_REPORT_ID;
+            END
+        """,
+    ]
+
+    migrations = {
+        1: [
+            # Порядок индекса совпадает с сортировкой списка отчетов (новые сверху)
+            "CREATE DESCENDING INDEX IDX_REPORTS_TIME ON REPORTS (VIOLATION_TIME, REPORT_ID)",
+            "CREATE DESCENDING INDEX IDX_REPORTS_CAMERA_TIME ON REPORTS (CAMERA_ID, VIOLATION_TIME)",
+        ],
+        2: [
+            "ALTER TABLE REPORTS ADD PHOTO_HASH VARCHAR(64)",
+            "ALTER TABLE REPORTS ADD THUMBNAIL BLOB SUB_TYPE 0 SEGMENT SIZE 4096",
+            "CREATE INDEX IDX_REPORTS_PHOTO_HASH ON REPORTS (PHOTO_HASH)",
+        ],
+        3: [
+            """
+                CREATE TABLE PROCESSED_FILES (
+                    FILE_NAME VARCHAR(255) NOT NULL PRIMARY KEY,
+                    FILE_SIZE BIGINT NOT NULL,
+                    FILE_MTIME DOUBLE PRECISION NOT NULL,
+                    CONTENT_HASH VARCHAR(64) NOT NULL,
+                    LAST_FRAME BIGINT NOT NULL,
+                    COMPLETED SMALLINT NOT NULL,
+                    MODEL_VERSION VARCHAR(100) NOT NULL,
+                    PROCESSED_AT TIMESTAMP NOT NULL
+                )
+            """,
+        ],
+        4: STATS_TABLES_DDL,
+        5: [
+            "ALTER TABLE REPORTS ADD BOX_X1 INTEGER",
+            "ALTER TABLE REPORTS ADD BOX_Y1 INTEGER",
+            "ALTER TABLE REPORTS ADD BOX_X2 INTEGER",
+            "ALTER TABLE REPORTS ADD BOX_Y2 INTEGER",
+        ],
+        6: [
+            "ALTER TABLE PROCESSED_FILES ADD LAST_CHECK_TIME DOUBLE PRECISION",
+        ],
+    }
+
+    def create(self, path, user, password):
+        # Драйвер Firebird нужен только при работе с этим хранилищем
+        import firebird.driver as fdb
+
+        return fdb.create_database(f"localhost/3050:{path}", user=user, password=password)
+
+    def connect(self, path, user, password):
+        import firebird.driver as fdb
+
+        return fdb.connect(f"localhost/3050:{path}", user=user, password=password)
+
+    def table_exists(self, conn, table_name):
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM RDB$RELATIONS WHERE RDB$RELATION_NAME = ?",
+            (table_name.upper(),)
+        )
+        return cur.fetchone() is not None
+
+    def column_exists(self, conn, table_name, column_name):
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM RDB$RELATION_FIELDS WHERE RDB$RELATION_NAME = ? AND RDB$FIELD_NAME = ?",
+            (table_name.upper(), column_name.upper())
+        )
+        return cur.fetchone() is not None
+
+    def index_exists(self, conn, index_name):
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM RDB$INDICES WHERE RDB$INDEX_NAME = ?", (index_name.upper(),))
+        return cur.fetchone() is not None
+
+    def __init__(self):
+        # Путь к базе по соединению: MON$DATABASE читается один раз, а не при каждом обращении к кэшу
+        self._database_paths = weakref.WeakKeyDictionary()
+
+    def database_path(self, conn):
+        path = self._database_paths.get(conn)
+        if path is None:
+            cur = conn.cursor()
+            cur.execute("SELECT MON$DATABASE_NAME FROM MON$DATABASE")
+            path = self._database_paths[conn] = cur.fetchone()[0].strip()
+        return path
+
+    def limit(self, rows):
+        return f"ROWS {int(rows)}"
+
+    def stats_upsert_sql(self, table):
+        # UPDATE OR INSERT ... MATCHING только заменяет значение, для приращения нужен MERGE
+        return (
+            f"MERGE INTO {table} T USING (SELECT CAST(? AS TIMESTAMP) AS PERIOD_START, "
+            "CAST(? AS INTEGER) AS CAMERA_ID, CAST(? AS VARCHAR(100)) AS VIOLATION_TYPE, "
+            "CAST(? AS INTEGER) AS DELTA FROM RDB$DATABASE) S "
+            "ON T.PERIOD_START = S.PERIOD_START AND T.CAMERA_ID = S.CAMERA_ID "
+            "AND T.VIOLATION_TYPE = S.VIOLATION_TYPE "
+            "WHEN MATCHED THEN UPDATE SET VIOLATION_COUNT = T.VIOLATION_COUNT + S.DELTA "
+            "WHEN NOT MATCHED THEN INSERT (PERIOD_START, CAMERA_ID, VIOLATION_TYPE, VIOLATION_COUNT) "
+            "VALUES (S.PERIOD_START, S.CAMERA_ID, S.VIOLATION_TYPE, S.DELTA)"
+        )
+
+# Время в SQLite хранится строкой фиксированной ширины: строки сравниваются в том же порядке,
+# что и моменты времени. Преобразование выполняют только соединения SQLiteBackend, глобальные
+# адаптеры и конвертеры модуля sqlite3 не меняются. В datetime читаются только столбцы времени
+# схемы (по имени столбца результата), остальные текстовые значения возвращаются как есть.
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+SQLITE_TIMESTAMP_COLUMNS = frozenset({'VIOLATION_TIME', 'PERIOD_START', 'PROCESSED_AT'})
+
+def _adapt_value(value):
+    return value.strftime(SQLITE_TIMESTAMP_FORMAT) if isinstance(value, datetime) else value
+
+def _adapt_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {name: _adapt_value(value) for name, value in parameters.items()}
+    return tuple(_adapt_value(value) for value in parameters)
+
+def _timestamp_indexes(description):
+    return tuple(i for i, column in enumerate(description) if column[0].upper() in SQLITE_TIMESTAMP_COLUMNS)
+
+def _convert_row(cursor, row):
+    indexes = (cursor.timestamp_indexes() if isinstance(cursor, _SQLiteCursor)
+               else _timestamp_indexes(cursor.description))
+    if not indexes:
+        return row
+    values = list(row)
+    for i in indexes:
+        if isinstance(values[i], str):
+            values[i] = datetime.fromisoformat(values[i])
+    return tuple(values)
+
+class _SQLiteCursor(sqlite3.Cursor):
+    _timestamp_indexes = None
+
+    def execute(self, sql, parameters=()):
+        self._timestamp_indexes = None
+        return super().execute(sql, _adapt_parameters(parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        self._timestamp_indexes = None
+        return super().executemany(sql, (_adapt_parameters(parameters) for parameters in seq_of_parameters))
+
+    def timestamp_indexes(self):
+        """Номера столбцов времени в результате текущего запроса (вычисляются один раз на запрос)"""
+        if self._timestamp_indexes is None:
+            self._timestamp_indexes = _timestamp_indexes(self.description)
+        return self._timestamp_indexes
+
+class SQLiteConnection(sqlite3.Connection):
+    """Соединение SQLiteBackend: параметры datetime записываются строкой, столбцы времени читаются как datetime"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.row_factory = _convert_row
+
+    def cursor(self, factory=_SQLiteCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class SQLiteBackend(StorageBackend):
+    """Встроенная база SQLite в режиме WAL: без сервера, для небольших установок, замеров и проверок"""
+    name = 'sqlite'
+    ping_sql = "SELECT 1"
+    conflict_markers = ('database is locked', 'unique constraint failed')
+
+    schema = [
+        """
+            CREATE TABLE WORKSHOPS (
+                WORKSHOP_ID INTEGER PRIMARY KEY,
+                WORKSHOP_NUMBER INTEGER NOT NULL UNIQUE
+            )
+        """,
+        """
+            CREATE TABLE CAMERAS (
+                CAMERA_ID INTEGER PRIMARY KEY,
+                WORKSHOP_ID INTEGER NOT NULL REFERENCES WORKSHOPS(WORKSHOP_ID)
+            )
+        """,
+        # INTEGER PRIMARY KEY заполняется автоматически, последовательности и триггеры не нужны
+        """
+            CREATE TABLE REPORTS (
+                REPORT_ID INTEGER PRIMARY KEY,
+                CAMERA_ID INTEGER NOT NULL REFERENCES CAMERAS(CAMERA_ID),
+                VIOLATION_TIME TIMESTAMP NOT NULL,
+                VIOLATION_TYPE VARCHAR(100) NOT NULL,
+                PHOTO BLOB
+            )
+        """,
+    ]
+
+    migrations = {
+        1: [
+            "CREATE INDEX IF NOT EXISTS IDX_REPORTS_TIME ON REPORTS (VIOLATION_TIME DESC, REPORT_ID DESC)",
+            "CREATE INDEX IF NOT EXISTS IDX_REPORTS_CAMERA_TIME ON REPORTS (CAMERA_ID, VIOLATION_TIME DESC)",
+        ],
+        2: [
+            "ALTER TABLE REPORTS ADD COLUMN PHOTO_HASH VARCHAR(64)",
+            "ALTER TABLE REPORTS ADD COLUMN THUMBNAIL BLOB",
+            "CREATE INDEX IF NOT EXISTS IDX_REPORTS_PHOTO_HASH ON REPORTS (PHOTO_HASH)",
+        ],
+        3: [
+            """
+                CREATE TABLE PROCESSED_FILES (
+                    FILE_NAME VARCHAR(255) NOT NULL PRIMARY KEY,
+                    FILE_SIZE BIGINT NOT NULL,
+                    FILE_MTIME DOUBLE PRECISION NOT NULL,
+                    CONTENT_HASH VARCHAR(64) NOT NULL,
+                    LAST_FRAME BIGINT NOT NULL,
+                    COMPLETED SMALLINT NOT NULL,
+                    MODEL_VERSION VARCHAR(100) NOT NULL,
+                    PROCESSED_AT TIMESTAMP NOT NULL
+                )
+            """,
+        ],
+        4: STATS_TABLES_DDL,
+        5: [
+            "ALTER TABLE REPORTS ADD COLUMN BOX_X1 INTEGER",
+            "ALTER TABLE REPORTS ADD COLUMN BOX_Y1 INTEGER",
+            "ALTER TABLE REPORTS ADD COLUMN BOX_X2 INTEGER",
+            "ALTER TABLE REPORTS ADD COLUMN BOX_Y2 INTEGER",
+        ],
+        6: [
+            "ALTER TABLE PROCESSED_FILES ADD COLUMN LAST_CHECK_TIME DOUBLE PRECISION",
+        ],
+    }
+
+    def _open(self, path):
+        # Соединение используется и потоком записи нарушений, поэтому без привязки к потоку
+        conn = sqlite3.connect(path, check_same_thread=False, factory=SQLiteConnection)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def create(self, path, user, password):
+        return self._open(path)
+
+    def connect(self, path, user, password):
+        return self._open(path)
+
+    def table_exists(self, conn, table_name):
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND UPPER(name) = ?",
+            (table_name.upper(),)
+        )
+        return cur.fetchone() is not None
+
+    def column_exists(self, conn, table_name, column_name):
+        cur = conn.cursor()
+        cur.execute(f"PRAGMA table_info({table_name})")
+        return any(row[1].upper() == column_name.upper() for row in cur.fetchall())
+
+    def index_exists(self, conn, index_name):
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND UPPER(name) = ?",
+            (index_name.upper(),)
+        )
+        return cur.fetchone() is not None
+
+    def database_path(self, conn):
+        cur = conn.cursor()
+        cur.execute("PRAGMA database_list")
+        return next(row[2] for row in cur.fetchall() if row[1] == 'main')
+
+    def limit(self, rows):
+        return f"LIMIT {int(rows)}"
+
+    def stats_upsert_sql(self, table):
+        return (
+            f"INSERT INTO {table} (PERIOD_START, CAMERA_ID, VIOLATION_TYPE, VIOLATION_COUNT) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (PERIOD_START, CAMERA_ID, VIOLATION_TYPE) "
+            "DO UPDATE SET VIOLATION_COUNT = VIOLATION_COUNT + excluded.VIOLATION_COUNT"
+        )
+
+BACKENDS = {backend.name: backend for backend in (FirebirdBackend(), SQLiteBackend())}
+
+def parse_connection_string(target):
+    """
+    Хранилище и путь к файлу базы по строке подключения:
+    'sqlite:///путь', 'firebird://путь' или путь к файлу (.db/.sqlite - SQLite, иначе Firebird).
+    """
+    if target.startswith(SQLITE_PREFIX):
+        return BACKENDS['sqlite'], os.path.abspath(target[len(SQLITE_PREFIX):])
+    if target.startswith(FIREBIRD_PREFIX):
+        return BACKENDS['firebird'], os.path.abspath(target[len(FIREBIRD_PREFIX):])
+    if target.lower().endswith(SQLITE_EXTENSIONS):
+        return BACKENDS['sqlite'], os.path.abspath(target)
+    return BACKENDS['firebird'], os.path.abspath(target)
+
+def backend_for(conn):
+    """Хранилище, к которому относится соединение"""
+    if isinstance(conn, sqlite3.Connection):
+        return BACKENDS['sqlite']
+    return BACKENDS['firebird']
@@ -1,11 +1,20 @@
 import sys
 import os
+import threading
+from datetime import datetime, time, timedelta
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, 
                              QFileDialog, QLineEdit, QLabel, QMessageBox, QDialog, 
-                             QListWidget, QComboBox, QInputDialog, QHBoxLayout, QListWidgetItem)
-from PyQt5.QtCore import Qt
-from .database import create_database, connect_database, add_workshop, add_camera, get_all_workshops, get_all_reports, get_report_photo
-from .report_generator import generate_report_pdf
+                             QListView, QComboBox, QInputDialog, QHBoxLayout, QDateEdit, QCheckBox,
+                             QProgressBar, QTableWidget, QTableWidgetItem, QTabWidget)
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QDate, QThread, pyqtSignal
+from .database import create_database, ConnectionPool, database_file_path, add_workshop, add_camera, get_all_workshops, get_reports_page, get_report_photo
+from .database import get_top_cameras, get_violation_trend, get_shift_summary
+from .report_generator import generate_report_pdf, export_reports_pdf
+from .photo_store import PhotoStore
+
+# Варианты фильтра по типу нарушения (совпадают с model_utils.VIOLATION_TYPES;
+# модуль не импортируется, чтобы не загружать torch и OpenCV при открытии окна)
+VIOLATION_FILTERS = ("Отсутствует каска", "Отсутствует спецовка")
 
 class LoginWindow(QMainWindow):
     def __init__(self):
@@ -22,7 +31,7 @@ class LoginWindow(QMainWindow):
         self.password_edit = QLineEdit("masterkey")
         self.password_edit.setEchoMode(QLineEdit.Password)
         
-        layout.addWidget(QLabel("Путь к БД (.fdb):"))
+        layout.addWidget(QLabel("Путь к БД (.fdb - Firebird, .db - SQLite):"))
         layout.addWidget(self.db_path_edit)
         layout.addWidget(QLabel("Пользователь:"))
         layout.addWidget(self.user_edit)
@@ -44,9 +53,10 @@ class LoginWindow(QMainWindow):
         layout.addWidget(browse_btn)
         
     def browse_db_path(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Создать файл БД", "", "Firebird Database (*.fdb)")
+        path, _ = QFileDialog.getSaveFileName(self, "Создать файл БД", "",
+                                              "Firebird Database (*.fdb);;SQLite Database (*.db *.sqlite)")
         if path:
-            if not path.endswith('.fdb'):
+            if not path.lower().endswith(('.fdb', '.db', '.sqlite', '.sqlite3')):
                 path += '.fdb'
             self.db_path_edit.setText(path)
             
@@ -59,7 +69,8 @@ class LoginWindow(QMainWindow):
             QMessageBox.critical(self, "Ошибка", "Укажите путь для создания БД")
             return
             
-        if ':' in path:
+        # Префикс хранилища (sqlite:///) допустим, удаленный адрес сервера - нет
+        if ':' in database_file_path(path):
             QMessageBox.critical(self, "Ошибка", 
                 "Для создания базы данных используйте локальный путь\n"
                 "Пример: /home/nikita/neyro.fdb")
@@ -68,7 +79,8 @@ class LoginWindow(QMainWindow):
         try:
             success = create_database(path, user, password)
             if success:
-                self.conn = connect_database(path, user, password)
+                self.pool = ConnectionPool(path, user, password)
+                self.photo_store = PhotoStore.for_database(database_file_path(path))
                 self.open_main_window()
             else:
                 QMessageBox.critical(self, "Ошибка", "Не удалось создать БД")
@@ -81,22 +93,97 @@ class LoginWindow(QMainWindow):
         password = self.password_edit.text()
         
         try:
-            self.conn = connect_database(path, user, password)
+            # Каждое окно и обработка видео берут из пула отдельное соединение;
+            # первое соединение сразу проверяет путь, пароль и схему БД
+            self.pool = ConnectionPool(path, user, password)
+            with self.pool.connection():
+                pass
+            # Снимки новых нарушений хранятся рядом с БД, а не в BLOB отчетов
+            self.photo_store = PhotoStore.for_database(database_file_path(path))
             self.open_main_window()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка подключения: {str(e)}")
             
     def open_main_window(self):
-        self.main_window = MainWindow(self.conn)
+        self.main_window = MainWindow(self.pool, self.photo_store)
         self.main_window.show()
         self.hide()
 
+class ProcessingWorker(QThread):
+    """
+    Обработка видео в фоновом потоке, чтобы окно не блокировалось.
+    Соединение с БД берется из пула на время обработки; ход обработки и итог
+    передаются в окно сигналами, остановка - через cancel().
+    """
+    
+    file_progress = pyqtSignal(int, int, str)
+    status = pyqtSignal(dict)
+    completed = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, pool, yolo_model_path, model_path, video_dir, photo_store=None):
+        super().__init__()
+        self.pool = pool
+        self.yolo_model_path = yolo_model_path
+        self.model_path = model_path
+        self.video_dir = video_dir
+        self.photo_store = photo_store
+        self.cancel_event = threading.Event()
+        
+    def cancel(self):
+        """Остановка после текущего пакета кадров; прогресс файла сохраняется в журнале"""
+        self.cancel_event.set()
+        
+    def run(self):
+        # Отложенный импорт, чтобы избежать ранней загрузки OpenCV
+        from .video_processor import process_videos
+        
+        try:
+            with self.pool.connection() as conn:
+                summary = process_videos(
+                    self.yolo_model_path, self.model_path, self.video_dir, conn,
+                    progress=self.file_progress.emit, photo_store=self.photo_store,
+                    cancel_event=self.cancel_event, on_status=self.status.emit)
+            self.completed.emit(summary)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class ExportWorker(QThread):
+    """Выгрузка отчетов по фильтрам в многостраничный PDF в фоновом потоке"""
+    
+    progress = pyqtSignal(int)
+    completed = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, pool, output_path, filters, photo_store=None):
+        super().__init__()
+        self.pool = pool
+        self.output_path = output_path
+        self.filters = filters
+        self.photo_store = photo_store
+        
+    def run(self):
+        try:
+            with self.pool.connection() as conn:
+                exported = export_reports_pdf(conn, self.output_path, self.photo_store,
+                                              progress=self.progress.emit, **self.filters)
+            self.completed.emit(exported)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
 class MainWindow(QMainWindow):
-    def __init__(self, conn):
+    def __init__(self, pool, photo_store=None):
         super().__init__()
         self.setWindowTitle("Детекция нарушений СИЗ")
-        self.setFixedSize(400, 450)
-        self.conn = conn
+        self.setFixedSize(400, 600)
+        self.pool = pool
+        self.photo_store = photo_store
         
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -104,7 +191,9 @@ class MainWindow(QMainWindow):
         
         buttons = [
             ("Посмотреть отчет", self.view_reports),
+            ("Статистика", self.view_stats),
             ("Подключиться к камерам", self.connect_cameras),
+            ("Наблюдение с камер", self.toggle_streaming),
             ("Выбрать модель СИЗ", self.select_model),
             ("Выбрать модель YOLO", self.select_yolo_model),
             ("Добавить камеру", self.add_camera),
@@ -116,35 +205,106 @@ class MainWindow(QMainWindow):
             btn = QPushButton(text)
             btn.clicked.connect(handler)
             layout.addWidget(btn)
+            if handler == self.start_processing:
+                self.start_btn = btn
+        
+        # Ход фоновой обработки: файлы, скорость, нарушения, оставшееся время
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(0)
+        self.file_label = QLabel("")
+        self.status_label = QLabel("")
+        self.cancel_btn = QPushButton("Остановить обработку")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        for widget in (self.progress_bar, self.file_label, self.status_label, self.cancel_btn):
+            layout.addWidget(widget)
+        self.worker = None
             
         self.video_dir = None
         self.model_path = None
         self.yolo_model_path = None
+        self.stream_processor = None
+        self.stream_conn = None
         
     def view_reports(self):
         try:
-            reports = get_all_reports(self.conn)
-            if not reports:
+            with self.pool.connection() as conn:
+                has_reports = bool(get_reports_page(conn, page_size=1))
+            if not has_reports:
                 QMessageBox.information(self, "Отчеты", "Нет доступных отчетов")
                 return
                 
-            self.reports_window = ReportsWindow(reports, self.conn)
+            self.reports_window = ReportsWindow(self.pool, self.photo_store)
             self.reports_window.show()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка получения отчетов: {str(e)}")
         
+    def view_stats(self):
+        try:
+            self.stats_window = StatsWindow(self.pool)
+            self.stats_window.show()
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка получения статистики: {str(e)}")
+        
     def connect_cameras(self):
         self.video_dir = QFileDialog.getExistingDirectory(self, "Выберите директорию с видео")
         if self.video_dir:
             QMessageBox.information(self, "Успех", f"Директория выбрана: {self.video_dir}")
         
+    def toggle_streaming(self):
+        """Запуск и остановка наблюдения за камерами в реальном времени"""
+        if self.stream_processor:
+            self.stop_streaming()
+            QMessageBox.information(self, "Наблюдение", "Наблюдение с камер остановлено")
+            return
+
+        if not self.model_path or not self.yolo_model_path:
+            QMessageBox.critical(self, "Ошибка", "Сначала выберите модели СИЗ и YOLO")
+            return
+        sources_path, _ = QFileDialog.getOpenFileName(
+            self, "Выберите список камер", "", "Список камер (*.json)")
+        if not sources_path:
+            return
+
+        # Отложенный импорт, чтобы избежать ранней загрузки OpenCV
+        from .streaming import StreamProcessor, load_camera_sources
+        try:
+            # Запись нарушений потоков идет по отдельному соединению на все время наблюдения
+            self.stream_conn = self.pool.acquire()
+            self.stream_processor = StreamProcessor(
+                self.yolo_model_path, self.model_path, load_camera_sources(sources_path),
+                self.stream_conn, photo_store=self.photo_store)
+            self.stream_processor.start()
+            QMessageBox.information(self, "Наблюдение",
+                                    f"Запущено камер: {len(self.stream_processor.captures)}. "
+                                    "Повторное нажатие остановит наблюдение")
+        except Exception as e:
+            self.stop_streaming()
+            QMessageBox.critical(self, "Ошибка", f"Ошибка запуска наблюдения: {str(e)}")
+
+    def stop_streaming(self):
+        if self.stream_processor:
+            self.stream_processor.stop()
+            self.stream_processor = None
+        if self.stream_conn is not None:
+            self.pool.release(self.stream_conn)
+            self.stream_conn = None
+
+    def closeEvent(self, event):
+        self.stop_streaming()
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        super().closeEvent(event)
+
     def select_model(self):
         self.model_path, _ = QFileDialog.getOpenFileName(self, "Выберите модель СИЗ", "", "Model Files (*.pt)")
         if self.model_path:
             QMessageBox.information(self, "Успех", f"Модель СИЗ выбрана: {os.path.basename(self.model_path)}")
             
     def select_yolo_model(self):
-        self.yolo_model_path, _ = QFileDialog.getOpenFileName(self, "Выберите модель YOLO", "", "Model Files (*.pt)")
+        self.yolo_model_path, _ = QFileDialog.getOpenFileName(self, "Выберите модель YOLO", "", "Model Files (*.pt *.torchscript)")
         if self.yolo_model_path:
             QMessageBox.information(self, "Успех", f"Модель YOLO выбрана: {os.path.basename(self.yolo_model_path)}")
         
@@ -152,14 +312,16 @@ class MainWindow(QMainWindow):
         number, ok = QInputDialog.getInt(self, "Добавить цех", "Номер цеха:")
         if ok:
             try:
-                add_workshop(self.conn, number)
+                with self.pool.connection() as conn:
+                    add_workshop(conn, number)
                 QMessageBox.information(self, "Успех", "Цех добавлен")
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Ошибка добавления: {str(e)}")
                 
     def add_camera(self):
         try:
-            workshops = get_all_workshops(self.conn)
+            with self.pool.connection() as conn:
+                workshops = get_all_workshops(conn)
             if not workshops:
                 QMessageBox.critical(self, "Ошибка", "Сначала добавьте цех")
                 return
@@ -200,10 +362,10 @@ class MainWindow(QMainWindow):
             camera_id = int(camera_id)
             workshop_number = int(workshop_text.split()[-1])
             
-            workshops = get_all_workshops(self.conn)
-            workshop_id = next(w[0] for w in workshops if w[1] == workshop_number)
-            
-            add_camera(self.conn, camera_id, workshop_id)
+            with self.pool.connection() as conn:
+                workshops = get_all_workshops(conn)
+                workshop_id = next(w[0] for w in workshops if w[1] == workshop_number)
+                add_camera(conn, camera_id, workshop_id)
             QMessageBox.information(self, "Успех", "Камера добавлена")
             dialog.close()
         except ValueError:
@@ -212,9 +374,8 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Ошибка", f"Ошибка добавления: {str(e)}")
         
     def start_processing(self):
-        # Отложенный импорт, чтобы избежать ранней загрузки OpenCV
-        from .video_processor import process_videos
-        
+        if self.worker is not None:
+            return
         if not self.model_path:
             QMessageBox.critical(self, "Ошибка", "Сначала выберите модель СИЗ")
             return
@@ -225,53 +386,232 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Ошибка", "Сначала выберите директорию с видео")
             return
             
+        self.worker = ProcessingWorker(self.pool, self.yolo_model_path, self.model_path,
+                                       self.video_dir, self.photo_store)
+        self.worker.file_progress.connect(self.on_file_progress)
+        self.worker.status.connect(self.on_status)
+        self.worker.completed.connect(self.on_processing_completed)
+        self.worker.failed.connect(self.on_processing_failed)
+        self.worker.finished.connect(self.on_worker_finished)
+        
+        self.progress_bar.setValue(0)
+        self.file_label.setText("Подготовка...")
+        self.status_label.setText("")
+        self.start_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.worker.start()
+        
+    def cancel_processing(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.file_label.setText("Остановка после текущего пакета...")
+            
+    def on_file_progress(self, done, total, filename):
+        self.file_label.setText(f"Обработано {done} из {total}: {filename}")
+        
+    def on_status(self, status):
+        if status['frames_total']:
+            self.progress_bar.setValue(int(1000 * status['frames_done'] / status['frames_total']))
+        self.status_label.setText(
+            f"{status['fps']:.0f} кадр/с, нарушений: {status['violations']}, "
+            f"осталось: {format_duration(status['eta_seconds'])}")
+        
+    def on_processing_completed(self, summary):
+        if summary.get('cancelled'):
+            QMessageBox.information(self, "Остановлено",
+                                    f"Обработка остановлена. Найдено нарушений: {summary['violations']}")
+            return
+        self.progress_bar.setValue(self.progress_bar.maximum())
+        QMessageBox.information(self, "Успех",
+                                f"Обработка видео завершена. Файлов: {summary['files']}, "
+                                f"пропущено: {summary['skipped']}, нарушений: {summary['violations']}")
+        
+    def on_processing_failed(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Ошибка обработки: {message}")
+        
+    def on_worker_finished(self):
+        self.worker = None
+        self.start_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+
+class ReportsModel(QAbstractListModel):
+    """
+    Список отчетов, подгружаемый страницами по мере прокрутки.
+    Ошибка чтения страницы останавливает подгрузку и передается сигналом failed.
+    """
+    
+    PAGE_SIZE = 200
+    failed = pyqtSignal(str)
+    
+    def __init__(self, pool, filters=None):
+        super().__init__()
+        self.pool = pool
+        self.filters = filters or {}
+        self.rows = []
+        self.has_more = True
+        
+    def set_filters(self, filters):
+        self.beginResetModel()
+        self.filters = filters
+        self.rows = []
+        self.has_more = True
+        self.endResetModel()
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        report = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return (f"Цех {report[4]}, Камера {report[1]}, "
+                    f"{report[2].strftime('%Y-%m-%d %H:%M:%S')}, "
+                    f"{report[3]}")
+        if role == Qt.UserRole:
+            return report
+        return None
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+    
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        after = (self.rows[-1][2], self.rows[-1][0]) if self.rows else None
+        # Соединение берется на время чтения страницы, открытое окно его не удерживает.
+        # Исключение из fetchMore (вызывается Qt) завершило бы приложение
         try:
-            process_videos(self.yolo_model_path, self.model_path, self.video_dir, self.conn)
-            QMessageBox.information(self, "Успех", "Обработка видео завершена")
+            with self.pool.connection() as conn:
+                page = get_reports_page(conn, self.PAGE_SIZE, after, **self.filters)
         except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка обработки: {str(e)}")
+            self.has_more = False
+            self.failed.emit(str(e))
+            return
+        self.has_more = len(page) == self.PAGE_SIZE
+        if not page:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        self.rows.extend(page)
+        self.endInsertRows()
 
 class ReportsWindow(QDialog):
-    def __init__(self, reports, conn):
+    def __init__(self, pool, photo_store=None):
         super().__init__()
         self.setWindowTitle("Отчеты")
-        self.setFixedSize(600, 400)
-        self.conn = conn
-        self.reports = reports
+        self.setFixedSize(700, 450)
+        self.pool = pool
+        self.photo_store = photo_store
         
         layout = QVBoxLayout(self)
-        self.list_widget = QListWidget()
-        
-        for report in reports:
-            item_text = (f"Цех {report[4]}, Камера {report[1]}, "
-                         f"{report[2].strftime('%Y-%m-%d %H:%M:%S')}, "
-                         f"{report[3]}")
-            item = QListWidgetItem(item_text)
-            item.setData(Qt.UserRole, report[0])
-            self.list_widget.addItem(item)
-            
-        self.list_widget.itemDoubleClicked.connect(self.generate_report)
-        layout.addWidget(self.list_widget)
         
-    def generate_report(self, item):
-        report_id = item.data(Qt.UserRole)
+        filter_layout = QHBoxLayout()
+        self.workshop_combo = QComboBox()
+        self.workshop_combo.addItem("Все цеха", None)
+        with pool.connection() as conn:
+            workshops = get_all_workshops(conn)
+        for _, workshop_number in workshops:
+            self.workshop_combo.addItem(f"Цех {workshop_number}", workshop_number)
+        self.camera_edit = QLineEdit()
+        self.camera_edit.setPlaceholderText("Камера")
+        self.type_combo = QComboBox()
+        self.type_combo.addItem("Все нарушения", None)
+        for violation in VIOLATION_FILTERS:
+            self.type_combo.addItem(violation, violation)
+        self.period_check = QCheckBox("Период")
+        self.date_from_edit = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.date_to_edit = QDateEdit(QDate.currentDate())
+        for date_edit in (self.date_from_edit, self.date_to_edit):
+            date_edit.setCalendarPopup(True)
+        apply_btn = QPushButton("Применить")
+        apply_btn.clicked.connect(self.apply_filters)
+        self.export_btn = QPushButton("Выгрузить PDF")
+        self.export_btn.clicked.connect(self.export_reports)
+        
+        for widget in (self.workshop_combo, self.camera_edit, self.type_combo,
+                       self.period_check, self.date_from_edit, self.date_to_edit, apply_btn,
+                       self.export_btn):
+            filter_layout.addWidget(widget)
+        layout.addLayout(filter_layout)
+        self.export_worker = None
+        
+        # Отчеты подгружаются страницами при прокрутке списка
+        self.model = ReportsModel(pool)
+        # Сообщение показывается после возврата из fetchMore, а не внутри обработки прокрутки
+        self.model.failed.connect(
+            lambda message: QMessageBox.critical(self, "Ошибка", f"Ошибка получения отчетов: {message}"),
+            Qt.QueuedConnection)
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setModel(self.model)
+        self.list_view.doubleClicked.connect(self.generate_report)
+        layout.addWidget(self.list_view)
+        
+    def apply_filters(self):
+        filters = {
+            'workshop_number': self.workshop_combo.currentData(),
+            'violation_type': self.type_combo.currentData(),
+        }
+        camera_text = self.camera_edit.text().strip()
+        if camera_text:
+            if not camera_text.isdigit():
+                QMessageBox.critical(self, "Ошибка", "Номер камеры должен быть целым числом")
+                return
+            filters['camera_id'] = int(camera_text)
+        if self.period_check.isChecked():
+            filters['date_from'] = datetime.combine(self.date_from_edit.date().toPyDate(), time.min)
+            filters['date_to'] = datetime.combine(self.date_to_edit.date().toPyDate(), time.min) + timedelta(days=1)
+        try:
+            self.model.set_filters(filters)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка получения отчетов: {str(e)}")
+        
+    def export_reports(self):
+        """Выгрузка всех отчетов по примененным фильтрам в один PDF"""
+        if self.export_worker is not None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Выгрузить отчеты", "reports.pdf", "PDF (*.pdf)")
+        if not path:
+            return
+        
+        self.export_worker = ExportWorker(self.pool, path, dict(self.model.filters), self.photo_store)
+        self.export_worker.progress.connect(
+            lambda exported: self.export_btn.setText(f"Выгружено: {exported}"))
+        self.export_worker.completed.connect(lambda exported: self.on_export_completed(path, exported))
+        self.export_worker.failed.connect(
+            lambda message: QMessageBox.critical(self, "Ошибка", f"Ошибка выгрузки: {message}"))
+        self.export_worker.finished.connect(self.on_export_finished)
+        self.export_btn.setEnabled(False)
+        self.export_worker.start()
+        
+    def on_export_completed(self, path, exported):
+        if not exported:
+            QMessageBox.information(self, "Выгрузка", "Нет отчетов для выгрузки")
+            return
+        QMessageBox.information(self, "Выгрузка", f"Выгружено отчетов: {exported}\n{path}")
+        
+    def on_export_finished(self):
+        self.export_worker = None
+        self.export_btn.setText("Выгрузить PDF")
+        self.export_btn.setEnabled(True)
+        
+    def generate_report(self, index):
+        report = index.data(Qt.UserRole)
         try:
-            report = next((r for r in self.reports if r[0] == report_id), None)
             if not report:
                 QMessageBox.critical(self, "Ошибка", "Данные отчета не найдены")
                 return
                 
-            photo_data = get_report_photo(self.conn, report_id)
+            report_id = report[0]
+            with self.pool.connection() as conn:
+                photo_data = get_report_photo(conn, report_id, self.photo_store)
             
             if not photo_data:
                 QMessageBox.critical(self, "Ошибка", "Фото отчета не найдено")
                 return
                 
-            temp_img_path = f"temp_report_{report_id}.jpg"
-            with open(temp_img_path, 'wb') as f:
-                f.write(photo_data)
-                
-            # Генерируем PDF
+            # Генерируем PDF (снимок передается из памяти, без временного файла)
             pdf_path = f"report_{report_id}.pdf"
             
             # Используем оригинальные данные отчета
@@ -281,7 +621,7 @@ class ReportsWindow(QDialog):
             violation_type = report[3]    # VIOLATION_TYPE
             
             generate_report_pdf(
-                image_path=temp_img_path,
+                photo_data=photo_data,
                 workshop_number=workshop_number,
                 camera_id=camera_id,
                 violation_time=violation_time,
@@ -296,11 +636,80 @@ class ReportsWindow(QDialog):
             else:
                 os.system(f'xdg-open "{pdf_path}"')
                 
-            os.remove(temp_img_path)
-                
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка генерации отчета: {str(e)}")
 
+class StatsWindow(QDialog):
+    """Сводки нарушений по агрегатам: камеры-лидеры, динамика по дням и сводка по сменам"""
+    
+    PERIODS = (("7 дней", 7), ("30 дней", 30), ("90 дней", 90))
+    
+    def __init__(self, pool):
+        super().__init__()
+        self.setWindowTitle("Статистика нарушений")
+        self.setFixedSize(600, 450)
+        self.pool = pool
+        
+        layout = QVBoxLayout(self)
+        
+        filter_layout = QHBoxLayout()
+        self.period_combo = QComboBox()
+        for text, days in self.PERIODS:
+            self.period_combo.addItem(text, days)
+        self.shift_date_edit = QDateEdit(QDate.currentDate())
+        self.shift_date_edit.setCalendarPopup(True)
+        refresh_btn = QPushButton("Обновить")
+        refresh_btn.clicked.connect(self.refresh)
+        filter_layout.addWidget(QLabel("Период:"))
+        filter_layout.addWidget(self.period_combo)
+        filter_layout.addWidget(QLabel("Смены за:"))
+        filter_layout.addWidget(self.shift_date_edit)
+        filter_layout.addWidget(refresh_btn)
+        layout.addLayout(filter_layout)
+        
+        self.top_table = self._create_table(("Камера", "Цех", "Нарушений"))
+        self.trend_table = self._create_table(("День", "Нарушение", "Количество"))
+        self.shift_table = self._create_table(("Смена", "Цех", "Нарушение", "Количество"))
+        tabs = QTabWidget()
+        tabs.addTab(self.top_table, "Камеры")
+        tabs.addTab(self.trend_table, "По дням")
+        tabs.addTab(self.shift_table, "По сменам")
+        layout.addWidget(tabs)
+        
+        self.refresh()
+        
+    @staticmethod
+    def _create_table(headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+    
+    @staticmethod
+    def _fill_table(table, rows):
+        table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for column, value in enumerate(row):
+                table.setItem(row_index, column, QTableWidgetItem(str(value)))
+                
+    def refresh(self):
+        # Границы периода по началу суток: запросы идут по дневным агрегатам
+        date_to = datetime.combine(QDate.currentDate().toPyDate(), time.min) + timedelta(days=1)
+        date_from = date_to - timedelta(days=self.period_combo.currentData())
+        try:
+            with self.pool.connection() as conn:
+                top_cameras = get_top_cameras(conn, date_from, date_to)
+                trend = get_violation_trend(conn, 'day', date_from, date_to)
+                shifts = get_shift_summary(conn, self.shift_date_edit.date().toPyDate())
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка получения статистики: {str(e)}")
+            return
+        self._fill_table(self.top_table, top_cameras)
+        self._fill_table(self.trend_table, [(start.strftime('%Y-%m-%d'), violation, count)
+                                            for start, violation, count in trend])
+        self._fill_table(self.shift_table, shifts)
+
 def start_app():
     if sys.platform.startswith('linux'):
         os.environ['QT_QPA_PLATFORM'] = 'xcb'
@@ -0,0 +1,111 @@
+# ledger.py
+import hashlib
+import os
+from dataclasses import dataclass, replace
+from datetime import datetime
+from .database import get_processed_files
+
+# Объем начала и конца файла, по которому считается отпечаток содержимого
+FINGERPRINT_CHUNK = 1 << 20
+
+def file_fingerprint(path, chunk_size=FINGERPRINT_CHUNK):
+    """
+    Отпечаток содержимого файла: SHA-256 от размера, первого и последнего chunk_size байт.
+    Многогигабайтные записи не читаются целиком; дописанный или замененный файл
+    меняет размер или края, а копия с новым временем изменения дает тот же отпечаток.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+def model_version(yolo_model_path, siz_model_path, settings=None):
+    """Версия пары моделей для журнала: отпечатки файлов YOLO и СИЗ и вариант модели СИЗ"""
+    version = f"yolo:{file_fingerprint(yolo_model_path)[:16]};siz:{file_fingerprint(siz_model_path)[:16]}"
+    if settings is not None and settings.siz_variant:
+        version += f"+{settings.siz_variant}"
+    return version
+
+@dataclass
+class LedgerEntry:
+    """Запись журнала обработанных файлов (таблица PROCESSED_FILES)"""
+    file_name: str
+    file_size: int
+    file_mtime: float
+    content_hash: str
+    last_frame: int = 0
+    completed: bool = False
+    model_version: str = ''
+    # Секунда видео последней проверки СИЗ до last_frame (None - проверок не было)
+    last_check_time: float = None
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], row[4], bool(row[5]), row[6], row[8])
+
+    def row(self, last_frame=None, completed=False, last_check_time=None):
+        """Кортеж LEDGER_COLUMNS с отметкой о прогрессе обработки"""
+        if last_frame is None:
+            last_frame = self.last_frame
+        if last_check_time is None:
+            last_check_time = self.last_check_time
+        return (self.file_name, self.file_size, self.file_mtime, self.content_hash,
+                int(last_frame), int(completed), self.model_version, datetime.now(), last_check_time)
+
+@dataclass
+class FilePlan:
+    """Файл к обработке: с какого кадра начинать и нужно ли удалить отчеты прошлой обработки"""
+    filename: str
+    camera_id: int
+    video_start_time: datetime
+    start_frame: int
+    entry: LedgerEntry
+    # Отчеты от start_frame до конца файла удаляются: они записаны прошлой,
+    # прерванной или устаревшей обработкой и будут найдены заново
+    reset: bool = False
+
+def plan_files(conn, video_dir, videos, version, reprocess_outdated=False):
+    """
+    Сверяет видеофайлы (имя, камера, время начала) с журналом.
+    Неизмененные полностью обработанные файлы пропускаются; прерванные продолжаются
+    с последней отметки; измененные и новые обрабатываются с начала. Файлы,
+    обработанные другой версией моделей, обрабатываются заново только при reprocess_outdated.
+    Возвращает (список FilePlan, число пропущенных файлов).
+    """
+    ledger = {name: LedgerEntry.from_row(row) for name, row in get_processed_files(conn).items()}
+    plans = []
+    skipped = 0
+    for filename, camera_id, video_start_time in videos:
+        path = os.path.join(video_dir, filename)
+        stat = os.stat(path)
+        old = ledger.get(filename)
+
+        # Отпечаток считается, только если размер или время изменения не совпали с журналом
+        if old and old.file_size == stat.st_size and old.file_mtime == stat.st_mtime:
+            content_hash = old.content_hash
+        else:
+            content_hash = file_fingerprint(path)
+        entry = LedgerEntry(filename, stat.st_size, stat.st_mtime, content_hash, model_version=version)
+
+        if old is None:
+            plans.append(FilePlan(filename, camera_id, video_start_time, 0, entry))
+            continue
+        if old.content_hash != content_hash:
+            print(f"Файл изменен, обрабатывается заново: {filename}")
+            plans.append(FilePlan(filename, camera_id, video_start_time, 0, entry, reset=True))
+            continue
+
+        if old.model_version != version and reprocess_outdated:
+            print(f"Файл обработан другой версией моделей, обрабатывается заново: {filename}")
+            plans.append(FilePlan(filename, camera_id, video_start_time, 0, entry, reset=True))
+        elif old.completed:
+            skipped += 1
+        else:
+            print(f"Продолжение обработки {filename} с кадра {old.last_frame}")
+            entry = replace(entry, last_frame=old.last_frame, last_check_time=old.last_check_time)
+            plans.append(FilePlan(filename, camera_id, video_start_time, old.last_frame, entry, reset=True))
+    return plans, skipped
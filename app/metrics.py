@@ -0,0 +1,285 @@
+# metrics.py
+"""
+Метрики обработки: время стадий с гистограммами задержек и счетчики кадров.
+
+Метрики собираются, пока в процессе включен RunMetrics (start_metrics); без него
+timed() и count() ничего не делают. Во время обработки их можно выгружать в файл
+(JSON или текстовый формат Prometheus) и отдавать по HTTP на локальном адресе
+(MetricsExporter), а весь запуск - профилировать cProfile или профилировщиком torch.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Стадии обработки, время которых замеряется
+STAGES = ('decode', 'yolo', 'siz', 'encode', 'db_write')
+
+# Счетчики: декодированные кадры, выбранные политикой выборки, отсеянные фильтром движения,
+# кадры с людьми и записанные нарушения
+COUNTERS = ('decoded_frames', 'sampled_frames', 'gated_frames', 'detected_frames', 'violations')
+
+# Верхние границы корзин гистограмм времени стадий (секунды)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Префикс имен метрик в формате Prometheus
+PROMETHEUS_PREFIX = 'siz_'
+
+@dataclass
+class MetricsSettings:
+    """Выгрузка метрик и профилирование запуска обработки"""
+    # Файл метрик, перезаписываемый во время обработки: .json - JSON, иначе текстовый формат Prometheus
+    path: str = None
+    # Порт HTTP на 127.0.0.1 (/metrics - Prometheus, /metrics.json - JSON); None - не запускать
+    port: int = None
+    # Интервал (секунды) между записями файла метрик
+    interval_seconds: float = 15.0
+    # Профилирование запуска: None, 'cprofile' или 'torch'
+    profile: str = None
+    # Файл результата профилирования (по умолчанию run.pstats / run_trace.json)
+    profile_path: str = None
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.port or self.profile)
+
+class RunMetrics:
+    """Время стадий обработки (число замеров, сумма, максимум, гистограмма) и счетчики"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            count, total, peak, buckets = self.stages.get(stage) or (0, 0.0, 0.0, [0] * len(LATENCY_BUCKETS))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            self.stages[stage] = (count + 1, total + seconds, max(peak, seconds), buckets)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def take(self):
+        """Накопленные значения для передачи в другой процесс (merge); сами метрики обнуляются"""
+        with self._lock:
+            state = {'stages': self.stages, 'counters': self.counters}
+            self.stages = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            return state
+
+    def merge(self, state):
+        """Добавляет значения, полученные take() в процессе-обработчике"""
+        with self._lock:
+            for name, n in state['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for stage, (count, total, peak, buckets) in state['stages'].items():
+                own = self.stages.get(stage) or (0, 0.0, 0.0, [0] * len(LATENCY_BUCKETS))
+                self.stages[stage] = (own[0] + count, own[1] + total, max(own[2], peak),
+                                      [a + b for a, b in zip(own[3], buckets)])
+
+    def summary(self):
+        """Словарь стадия -> {count, total_seconds, mean_ms, max_ms}"""
+        with self._lock:
+            return {stage: {'count': count,
+                            'total_seconds': total,
+                            'mean_ms': total / count * 1000,
+                            'max_ms': peak * 1000}
+                    for stage, (count, total, peak, _) in self.stages.items()}
+
+    def snapshot(self):
+        """Все метрики одним словарем (для JSON): время работы, счетчики, стадии с гистограммами"""
+        stages = self.summary()
+        with self._lock:
+            for stage, (_, _, _, buckets) in self.stages.items():
+                stages[stage]['buckets'] = dict(zip(map(str, LATENCY_BUCKETS), buckets))
+            counters = dict(self.counters)
+        return {'uptime_seconds': time.time() - self.started, 'counters': counters, 'stages': stages}
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            counters = dict(self.counters)
+            stages = {stage: (count, total, list(buckets)) for stage, (count, total, _, buckets) in self.stages.items()}
+
+        lines = []
+        for name, value in counters.items():
+            metric = f"{PROMETHEUS_PREFIX}{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+
+        metric = f"{PROMETHEUS_PREFIX}stage_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, (count, total, buckets) in stages.items():
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines += [f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}',
+                      f'{metric}_sum{{stage="{stage}"}} {total}',
+                      f'{metric}_count{{stage="{stage}"}} {count}']
+        return '\n'.join(lines) + '\n'
+
+# Метрики включаются на время запуска; без них timed() и count() ничего не делают
+_metrics = None
+
+def start_metrics():
+    """Включает сбор метрик в процессе и возвращает новый RunMetrics"""
+    global _metrics
+    _metrics = RunMetrics()
+    return _metrics
+
+def stop_metrics():
+    """Выключает сбор метрик и возвращает накопленный RunMetrics (или None)"""
+    global _metrics
+    metrics, _metrics = _metrics, None
+    return metrics
+
+def current_metrics():
+    """Включенный RunMetrics процесса или None"""
+    return _metrics
+
+@contextmanager
+def timed(stage):
+    """Замер времени блока как стадии stage, если сбор метрик включен"""
+    metrics = _metrics
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(stage, time.perf_counter() - started)
+
+def count(name, n=1):
+    """Увеличивает счетчик name, если сбор метрик включен"""
+    metrics = _metrics
+    if metrics is not None:
+        metrics.count(name, n)
+
+def write_metrics_file(metrics, path):
+    """Записывает метрики в файл (.json - JSON, иначе формат Prometheus) с атомарной заменой"""
+    if path.lower().endswith('.json'):
+        text = json.dumps(metrics.snapshot(), ensure_ascii=False, indent=2)
+    else:
+        text = metrics.to_prometheus()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def _handler(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = metrics.to_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(metrics.snapshot(), ensure_ascii=False), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+class MetricsExporter(threading.Thread):
+    """
+    Выгрузка метрик во время обработки: файл settings.path перезаписывается каждые
+    settings.interval_seconds и при остановке, HTTP-сервер на 127.0.0.1:settings.port
+    отвечает текущими значениями.
+    """
+
+    def __init__(self, metrics, settings):
+        super().__init__(daemon=True, name="metrics-exporter")
+        self.metrics = metrics
+        self.settings = settings
+        self._stop_event = threading.Event()
+        self.server = None
+        if settings.port:
+            self.server = ThreadingHTTPServer(('127.0.0.1', settings.port), _handler(metrics))
+            threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-http").start()
+
+    def _write(self):
+        try:
+            write_metrics_file(self.metrics, self.settings.path)
+        except OSError as e:
+            print(f"Ошибка записи файла метрик: {str(e)}")
+
+    def run(self):
+        if not self.settings.path:
+            return
+        while not self._stop_event.wait(self.settings.interval_seconds):
+            self._write()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        if self.settings.path:
+            self._write()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+@contextmanager
+def profiled(kind, path=None):
+    """Профилирование блока: 'cprofile' - статистика pstats, 'torch' - трасса chrome://tracing"""
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path or 'run.pstats')
+    elif kind == 'torch':
+        # Отложенный импорт: профилировщик torch нужен только при явном включении
+        from torch.profiler import ProfilerActivity, profile
+
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as profiler:
+            yield
+        profiler.export_chrome_trace(path or 'run_trace.json')
+    else:
+        raise ValueError(f"Неизвестный профилировщик: {kind}")
+
+@contextmanager
+def metrics_session(settings):
+    """
+    Сбор и выгрузка метрик на время запуска обработки по настройкам MetricsSettings.
+    Если метрики уже включены (например, замером производительности), используются они.
+    Возвращает RunMetrics или None, если метрики не собираются.
+    """
+    own = current_metrics() is None and settings.enabled
+    metrics = start_metrics() if own else current_metrics()
+    exporter = None
+    if metrics is not None and (settings.path or settings.port):
+        exporter = MetricsExporter(metrics, settings)
+        exporter.start()
+    try:
+        if settings.profile:
+            with profiled(settings.profile, settings.profile_path):
+                yield metrics
+        else:
+            yield metrics
+    finally:
+        if exporter:
+            exporter.stop()
+        if own:
+            stop_metrics()
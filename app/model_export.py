@@ -0,0 +1,183 @@
+# model_export.py
+"""
+Экспорт оптимизированных вариантов модели СИЗ для CPU.
+
+Пример:
+    python -m app.model_export siz.pt --quantization static --samples samples/
+создает siz.int8.pt рядом с исходной моделью и сравнивает его точность с исходной
+на размеченной выборке (samples/labels.csv: filename,helmet,uniform).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import cv2
+import numpy as np
+import torch
+from .model_utils import load_siz_model, preprocess_frames, variant_model_path, VARIANT_METADATA_FILE
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+LABELS_FILE = 'labels.csv'
+CALIBRATION_BATCH_SIZE = 16
+
+def load_samples(samples_dir):
+    """Изображения выборки: список (имя файла, кадр BGR)"""
+    samples = []
+    for filename in sorted(os.listdir(samples_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(samples_dir, filename))
+        if image is not None:
+            samples.append((filename, image))
+    return samples
+
+def load_labels(samples_dir):
+    """Разметка выборки из labels.csv: имя файла -> (каска есть, спецовка есть)"""
+    labels = {}
+    path = os.path.join(samples_dir, LABELS_FILE)
+    if not os.path.exists(path):
+        return labels
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            labels[row['filename']] = (int(row['helmet']) == 1, int(row['uniform']) == 1)
+    return labels
+
+def _batches(images, batch_size=CALIBRATION_BATCH_SIZE):
+    """Тензоры пакетов изображений (копии: буфер предобработки переиспользуется)"""
+    return [preprocess_frames(images[i:i + batch_size]).clone() for i in range(0, len(images), batch_size)]
+
+def _calibrate(model, batches):
+    with torch.no_grad():
+        for batch in batches:
+            model(batch)
+
+def quantize_model(model, mode, calibration_images=None, engine='fbgemm'):
+    """
+    INT8-квантование модели TorchScript.
+    dynamic - веса линейных слоев, без калибровки;
+    static - веса и активации всех слоев, диапазоны берутся из калибровочных кадров.
+    """
+    torch.backends.quantized.engine = engine
+    if mode == 'dynamic':
+        return torch.quantization.quantize_dynamic_jit(
+            model, {'': torch.quantization.default_dynamic_qconfig})
+
+    if not calibration_images:
+        raise ValueError("Для статического квантования нужны калибровочные кадры (--samples)")
+    qconfig = torch.quantization.get_default_qconfig(engine)
+    return torch.quantization.quantize_jit(
+        model, {'': qconfig}, _calibrate, [_batches(calibration_images)])
+
+def freeze_model(model, channels_last=True):
+    """
+    Заморозка модели: веса становятся константами графа.
+    Граф после optimize_for_inference не загружается из файла, поэтому оптимизация
+    для инференса выполняется при загрузке варианта (load_siz_model).
+    """
+    if channels_last:
+        try:
+            model = model.to(memory_format=torch.channels_last)
+        except (RuntimeError, TypeError):
+            print("Модель не поддерживает channels_last, используется исходный формат")
+    return torch.jit.freeze(model.eval())
+
+def export_siz_variant(model_path, quantization='static', samples_dir=None, engine='fbgemm',
+                       channels_last=True, output_path=None):
+    """
+    Создает оптимизированный вариант модели СИЗ и сохраняет его рядом с исходной.
+    quantization: 'static', 'dynamic' (вариант 'int8') или 'none' (вариант 'frozen').
+    Возвращает путь к созданному файлу.
+    """
+    model = load_siz_model(model_path)
+    images = [image for _, image in load_samples(samples_dir)] if samples_dir else []
+
+    if quantization == 'none':
+        variant = 'frozen'
+        optimized = freeze_model(model, channels_last)
+    else:
+        variant = 'int8'
+        optimized = quantize_model(model, quantization, images, engine)
+
+    output_path = output_path or variant_model_path(model_path, variant)
+    metadata = {
+        'source': os.path.basename(model_path),
+        'variant': variant,
+        'quantization': quantization,
+        'quantized_engine': engine if quantization != 'none' else None,
+        'channels_last': channels_last and quantization == 'none',
+    }
+    torch.jit.save(optimized, output_path, _extra_files={VARIANT_METADATA_FILE: json.dumps(metadata)})
+    return output_path
+
+def _predict(model, images):
+    """Вероятности (каска, спецовка) для списка изображений"""
+    outputs = []
+    with torch.no_grad():
+        for batch in _batches(images):
+            outputs.append(np.asarray(model(batch))[:, :2])
+    return np.concatenate(outputs) if outputs else np.zeros((0, 2), dtype=np.float32)
+
+def evaluate_variant(model_path, variant_path, samples_dir):
+    """
+    Сравнение оптимизированного варианта с исходной моделью на выборке.
+    Возвращает словарь: доля совпадающих решений, максимальное расхождение вероятностей
+    и точность обеих моделей по разметке (если есть labels.csv).
+    """
+    samples = load_samples(samples_dir)
+    if not samples:
+        raise ValueError(f"В {samples_dir} нет изображений")
+    names = [name for name, _ in samples]
+    images = [image for _, image in samples]
+
+    reference = _predict(load_siz_model(model_path), images)
+    candidate = _predict(load_siz_model(variant_path), images)
+
+    result = {
+        'samples': len(images),
+        'agreement': float(np.mean(np.all((reference > 0.5) == (candidate > 0.5), axis=1))),
+        'max_probability_diff': float(np.abs(reference - candidate).max()),
+    }
+
+    labels = load_labels(samples_dir)
+    labelled = [i for i, name in enumerate(names) if name in labels]
+    if labelled:
+        truth = np.array([labels[names[i]] for i in labelled])
+        result['labelled'] = len(labelled)
+        result['float_accuracy'] = float(np.mean(np.all((reference[labelled] > 0.5) == truth, axis=1)))
+        result['variant_accuracy'] = float(np.mean(np.all((candidate[labelled] > 0.5) == truth, axis=1)))
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт оптимизированного варианта модели СИЗ")
+    parser.add_argument('model', help="Исходная модель СИЗ (TorchScript .pt)")
+    parser.add_argument('--quantization', choices=('static', 'dynamic', 'none'), default='static')
+    parser.add_argument('--samples', help="Директория с изображениями для калибровки и проверки")
+    parser.add_argument('--engine', choices=('fbgemm', 'qnnpack'), default='fbgemm',
+                        help="Движок квантования: fbgemm для x86, qnnpack для ARM")
+    parser.add_argument('--no-channels-last', action='store_true')
+    parser.add_argument('--output', help="Путь результата (по умолчанию model.<variant>.pt)")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.02,
+                        help="Допустимое снижение точности относительно исходной модели")
+    args = parser.parse_args(argv)
+    if args.quantization == 'static' and not args.samples:
+        parser.error("для --quantization static нужна выборка калибровочных кадров (--samples)")
+
+    output_path = export_siz_variant(
+        args.model, args.quantization, args.samples, args.engine,
+        not args.no_channels_last, args.output)
+    print(f"Вариант модели сохранен: {output_path}")
+
+    if not args.samples:
+        return 0
+
+    result = evaluate_variant(args.model, output_path, args.samples)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if 'variant_accuracy' in result and \
+            result['float_accuracy'] - result['variant_accuracy'] > args.max_accuracy_drop:
+        print("Точность варианта ниже допустимой")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# model_registry.py
+import os
+import threading
+import numpy as np
+import torch
+from .model_utils import SIZ_INPUT_SIZE
+from .backends import InferenceSettings, load_classifier, load_detector
+
+# Загруженные модели процесса: ключ (вид, абсолютный путь, время изменения файла, настройки инференса)
+_models = {}
+_lock = threading.Lock()
+
+def _cache_key(kind, model_path, settings):
+    path = os.path.abspath(model_path)
+    return kind, path, os.path.getmtime(path), settings
+
+def _get_model(kind, model_path, settings, loader, warmup):
+    """Возвращает модель из кэша или загружает ее, прогревает и кэширует"""
+    settings = settings or InferenceSettings()
+    key = _cache_key(kind, model_path, settings)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = loader(model_path, settings)
+            warmup(model)
+            # Устаревшие версии того же файла больше не нужны
+            for stale in [k for k in _models if k[:2] == key[:2] and k[2] != key[2]]:
+                del _models[stale]
+            _models[key] = model
+        return model
+
+def _warmup_siz(model):
+    width, height = SIZ_INPUT_SIZE
+    model(torch.zeros((1, 3, height, width), dtype=torch.float32))
+
+def _warmup_detector(detector):
+    detector.detect([np.zeros((640, 640, 3), dtype=np.uint8)])
+
+def get_siz_model(model_path, settings=None):
+    """Модель СИЗ из реестра; повторная загрузка только при изменении файла или настроек"""
+    return _get_model('siz', model_path, settings, load_classifier, _warmup_siz)
+
+def get_yolo_model(model_path, settings=None):
+    """Детектор людей YOLO из реестра; повторная загрузка только при изменении файла или настроек"""
+    return _get_model('yolo', model_path, settings, load_detector, _warmup_detector)
+
+def clear_models():
+    """Очистка реестра загруженных моделей"""
+    with _lock:
+        _models.clear()
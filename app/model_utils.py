@@ -1,9 +1,11 @@
 import torch
 import cv2
 import numpy as np
-from PIL import Image
 from datetime import datetime
+import json
+import os
 import re
+import threading
 
 VIOLATION_TYPES = {
     "no_helmet": "Отсутствует каска",
@@ -11,63 +13,132 @@ VIOLATION_TYPES = {
     "both": "Отсутствует каска и спецовка"
 }
 
-def load_siz_model(model_path):
-    """Загрузка модели для детекции СИЗ"""
-    model = torch.jit.load(model_path, map_location='cpu')
+# Размер входа модели СИЗ (ширина, высота) и параметры нормализации ImageNet
+SIZ_INPUT_SIZE = (128, 128)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Нормализация (x / 255 - mean) / std сводится к x * scale - offset по каналам RGB
+_CHANNEL_SCALE = 1.0 / (255.0 * IMAGENET_STD)
+_CHANNEL_OFFSET = IMAGENET_MEAN / IMAGENET_STD
+
+# Переиспользуемые буферы предобработки, свои у каждого потока (поток наблюдения за камерами
+# и поток обработки видео классифицируют одновременно); растут по мере увеличения размера пакета
+_buffers = threading.local()
+
+# Файл метаданных, который экспорт сохраняет внутри архива TorchScript оптимизированного варианта
+VARIANT_METADATA_FILE = 'siz_variant.json'
+
+def variant_model_path(model_path, variant):
+    """Путь к оптимизированному варианту модели: model.pt -> model.<variant>.pt"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext or '.pt'}"
+
+def load_siz_model(model_path, variant=None):
+    """
+    Загрузка модели для детекции СИЗ.
+    variant - имя оптимизированного варианта ('int8', 'frozen'), созданного app.model_export;
+    если файла варианта нет, загружается исходная модель.
+    """
+    if variant:
+        candidate = variant_model_path(model_path, variant)
+        if os.path.exists(candidate):
+            model_path = candidate
+        else:
+            print(f"Вариант модели СИЗ '{variant}' не найден ({candidate}), используется исходная модель")
+    
+    extra_files = {VARIANT_METADATA_FILE: ''}
+    model = torch.jit.load(model_path, map_location='cpu', _extra_files=extra_files)
+    if extra_files[VARIANT_METADATA_FILE]:
+        metadata = json.loads(extra_files[VARIANT_METADATA_FILE])
+        # Квантованные модели выполняются только движком, для которого они подготовлены
+        engine = metadata.get('quantized_engine')
+        if engine and torch.backends.quantized.engine != engine:
+            torch.backends.quantized.engine = engine
+        if metadata.get('variant') == 'frozen':
+            model.eval()
+            return torch.jit.optimize_for_inference(model)
     model.eval()
     return model
 
-def detect_gear_presence(model, image):
+def _get_buffers(batch_size):
+    """Возвращает буферы потока (uint8 NHWC, float32 NCHW) не меньше заданного размера пакета"""
+    width, height = SIZ_INPUT_SIZE
+    input_buffer = getattr(_buffers, 'input', None)
+    if input_buffer is None or input_buffer.shape[0] < batch_size:
+        _buffers.resize = np.empty((batch_size, height, width, 3), dtype=np.uint8)
+        _buffers.input = np.empty((batch_size, 3, height, width), dtype=np.float32)
+    return _buffers.resize[:batch_size], _buffers.input[:batch_size]
+
+def preprocess_frames(images):
     """
-    Проверяет наличие СИЗ на изображении.
-    Возвращает True, если все СИЗ присутствуют, иначе False.
+    Предобработка пакета кадров BGR (OpenCV) для модели СИЗ.
+    Масштабирование выполняется OpenCV прямо в общий буфер, перестановка каналов
+    BGR -> RGB, нормализация и переход к NCHW - одной векторной операцией numpy.
+    Возвращает тензор (N, 3, 128, 128) поверх переиспользуемого буфера потока (без копирования),
+    поэтому он действителен только до следующего вызова в том же потоке.
     """
-    # Конвертируем BGR (OpenCV) в RGB
-    img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    img = Image.fromarray(img)
-    img = img.resize((128, 128))
+    resized, batch = _get_buffers(len(images))
     
-    # Преобразование в numpy array и нормализация
-    img_array = np.array(img).astype(np.float32) / 255.0
-    mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-    std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-    img_array = (img_array - mean) / std
+    for i, image in enumerate(images):
+        if image.shape[1::-1] == SIZ_INPUT_SIZE:
+            resized[i] = image
+        else:
+            cv2.resize(image, SIZ_INPUT_SIZE, dst=resized[i], interpolation=cv2.INTER_AREA)
     
-    img_tensor = torch.tensor(img_array, dtype=torch.float32).permute(2, 0, 1).unsqueeze(0)
-    
-    with torch.no_grad():
-        outputs = model(img_tensor)
+    # Канал c тензора (RGB) берется из канала 2 - c кадра (BGR)
+    for c in range(3):
+        np.multiply(resized[..., 2 - c], _CHANNEL_SCALE[c], out=batch[:, c])
+        batch[:, c] -= _CHANNEL_OFFSET[c]
     
-    helmet_present = outputs[0, 0].item() > 0.5
-    uniform_present = outputs[0, 1].item() > 0.5
-    
-    return helmet_present and uniform_present
+    return torch.from_numpy(batch)
 
-def get_violation_type(model, image):
+def classify_gear_batch(model, images):
     """
-    Определяет тип нарушения на изображении.
-    Возвращает строку с описанием нарушения или None, если нарушений нет.
+    Пакетная классификация СИЗ на нескольких кадрах за один вызов модели.
+    Принимает список кадров BGR (OpenCV) или массив формы (N, H, W, 3).
+    Возвращает список кортежей (вероятность каски, вероятность спецовки, нарушение),
+    где нарушение - строка с описанием или None, если нарушений нет.
     """
-    # Конвертируем BGR (OpenCV) в RGB
-    img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    img = Image.fromarray(img)
-    img = img.resize((128, 128))
+    if len(images) == 0:
+        return []
     
-    # Преобразование в numpy array и нормализация
-    img_array = np.array(img).astype(np.float32) / 255.0
-    mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-    std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-    img_array = (img_array - mean) / std
-    
-    # Преобразование в тензор
-    img_tensor = torch.tensor(img_array, dtype=torch.float32).permute(2, 0, 1).unsqueeze(0)
+    batch = preprocess_frames(images)
     
     with torch.no_grad():
-        outputs = model(img_tensor)
-    
-    helmet_present = outputs[0, 0].item() > 0.5
-    uniform_present = outputs[0, 1].item() > 0.5
+        outputs = model(batch)
     
+    results = []
+    for helmet_prob, uniform_prob in outputs[:, :2].tolist():
+        violation = violation_from_presence(helmet_prob > 0.5, uniform_prob > 0.5)
+        results.append((helmet_prob, uniform_prob, violation))
+    return results
+
+def crop_boxes(image, boxes, padding=0.0):
+    """
+    Вырезает из кадра области по рамкам (x1, y1, x2, y2).
+    padding - доля ширины/высоты рамки, добавляемая с каждой стороны.
+    Возвращает список вырезок (представления кадра без копирования)
+    и список рамок, обрезанных по границам кадра.
+    """
+    height, width = image.shape[:2]
+    crops = []
+    clipped = []
+    for x1, y1, x2, y2 in boxes:
+        pad_x = (x2 - x1) * padding
+        pad_y = (y2 - y1) * padding
+        left = max(0, int(round(x1 - pad_x)))
+        top = max(0, int(round(y1 - pad_y)))
+        right = min(width, int(round(x2 + pad_x)))
+        bottom = min(height, int(round(y2 + pad_y)))
+        if right <= left or bottom <= top:
+            continue
+        crops.append(image[top:bottom, left:right])
+        clipped.append((left, top, right, bottom))
+    return crops, clipped
+
+def violation_from_presence(helmet_present, uniform_present):
+    """Формирует описание нарушения по наличию каски и спецовки (None, если нарушений нет)"""
     if helmet_present and uniform_present:
         return None
     
@@ -79,6 +150,20 @@ def get_violation_type(model, image):
     
     return ", ".join(violations)
 
+def detect_gear_presence(model, image):
+    """
+    Проверяет наличие СИЗ на изображении.
+    Возвращает True, если все СИЗ присутствуют, иначе False.
+    """
+    return classify_gear_batch(model, [image])[0][2] is None
+
+def get_violation_type(model, image):
+    """
+    Определяет тип нарушения на изображении.
+    Возвращает строку с описанием нарушения или None, если нарушений нет.
+    """
+    return classify_gear_batch(model, [image])[0][2]
+
 def parse_video_filename(filename):
     """Парсинг информации из имени видеофайла"""
     #CAMERA1_08:07:19.06.04.2025.mp4
@@ -0,0 +1,70 @@
+# motion.py
+import cv2
+from dataclasses import dataclass
+
+@dataclass
+class MotionSettings:
+    """Настройки фильтра движения перед детекцией YOLO"""
+    enabled: bool = True
+    # Доля изменившихся пикселей уменьшенного кадра, при которой кадр считается с движением
+    threshold: float = 0.002
+    # Минимальное изменение яркости пикселя (0-255), которое считается изменением
+    pixel_threshold: int = 25
+    # Ширина уменьшенного кадра для сравнения
+    width: int = 160
+    # 'diff' - разность с предыдущим проанализированным кадром, 'mog2' - вычитание фона
+    method: str = 'diff'
+    # Даже без движения YOLO запускается не реже, чем раз в столько секунд
+    max_skip_seconds: float = 30.0
+
+    def create_gate(self):
+        return MotionGate(self) if self.enabled else None
+
+class MotionGate:
+    """
+    Дешевый фильтр кадров перед YOLO: сравнивает уменьшенные полутоновые кадры
+    и пропускает к детектору только кадры с движением.
+    Пока в кадре есть люди, фильтр не применяется, чтобы не пропустить стоящего человека.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.previous = None
+        self.last_passed_time = None
+        self.passed = 0
+        self.gated = 0
+        self.subtractor = None
+        if settings.method == 'mog2':
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+
+    def _motion_ratio(self, frame):
+        """Доля изменившихся пикселей по сравнению с предыдущим кадром (или фоном)"""
+        height, width = frame.shape[:2]
+        size = (self.settings.width, max(1, int(height * self.settings.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.subtractor is not None:
+            mask = self.subtractor.apply(gray)
+            return cv2.countNonZero(mask) / mask.size
+
+        previous, self.previous = self.previous, gray
+        if previous is None:
+            return 1.0
+        diff = cv2.absdiff(gray, previous)
+        _, mask = cv2.threshold(diff, self.settings.pixel_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / mask.size
+
+    def should_detect(self, frame, current_time, people_in_view=False):
+        """Нужно ли запускать YOLO на кадре; отсеянные кадры учитываются в счетчике gated"""
+        ratio = self._motion_ratio(frame)
+        stale = (self.last_passed_time is None
+                 or current_time - self.last_passed_time >= self.settings.max_skip_seconds)
+
+        if people_in_view or stale or ratio >= self.settings.threshold:
+            self.passed += 1
+            self.last_passed_time = current_time
+            return True
+
+        self.gated += 1
+        return False
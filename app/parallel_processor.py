@@ -0,0 +1,205 @@
+# parallel_processor.py
+import os
+import multiprocessing
+from dataclasses import replace
+from datetime import timedelta
+from .model_registry import get_siz_model, get_yolo_model
+from .video_processor import (list_video_files, iter_file_violations, encode_report_images, new_frame_stats,
+                              plan_videos, reset_time_range, video_info, RunStatus, FRAME_STATS)
+from .sampling import VideoReadError
+from .database import ReportWriter
+from .ledger import FilePlan
+from .metrics import count, current_metrics, start_metrics
+
+# Модели, загруженные в процессе-обработчике один раз при его запуске
+_worker_state = {}
+
+def _init_worker(yolo_model_path, siz_model_path, options, collect_metrics=False):
+    """Инициализация процесса-обработчика: загрузка моделей и, если нужно, сбор метрик"""
+    if collect_metrics:
+        start_metrics()
+    settings = options.inference
+    if settings.intra_op_threads <= 0:
+        settings = replace(settings, intra_op_threads=options.threads_per_worker)
+    _worker_state['yolo_model'] = get_yolo_model(yolo_model_path, settings)
+    _worker_state['siz_model'] = get_siz_model(siz_model_path, settings)
+    _worker_state['options'] = options
+
+def _process_segment(task):
+    """
+    Обработка одного отрезка видео в процессе-обработчике.
+    Снимки кодируются в JPEG здесь, чтобы в основной процесс передавались байты, а не кадры.
+    Метрики отрезка и текст ошибки чтения видео (или None) передаются в основной процесс
+    вместе с результатом.
+    """
+    filename, video_path, camera_id, video_start_time, start_frame, end_frame = task
+    options = _worker_state['options']
+    records = []
+    stats = new_frame_stats()
+    read_error = None
+    try:
+        for current_time, violation, snapshot, box in iter_file_violations(
+                _worker_state['yolo_model'], _worker_state['siz_model'], video_path,
+                options, start_frame, end_frame, stats):
+            photo_data, thumbnail = encode_report_images(snapshot, options)
+            if photo_data is None:
+                print(f"Не удалось закодировать снимок из {filename}")
+                continue
+            frame_time = video_start_time + timedelta(seconds=current_time)
+            records.append((frame_time, violation, photo_data, thumbnail, box))
+    except VideoReadError as e:
+        read_error = str(e)
+    metrics = current_metrics()
+    return task, records, stats, metrics.take() if metrics else None, read_error
+
+def _iter_results(results, cancel_event, poll_seconds=0.5):
+    """
+    Результаты пула по мере готовности; при установке cancel_event выдает None,
+    не дожидаясь окончания обрабатываемых отрезков.
+    """
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            yield None
+            return
+        try:
+            yield results.next(timeout=poll_seconds)
+        except multiprocessing.TimeoutError:
+            continue
+        except StopIteration:
+            return
+
+def plan_segments(video_dir, segment_seconds, camera_workshops=None, plans=None):
+    """
+    Разбивает видеофайлы директории на задания
+    (имя файла, путь, камера, время начала, первый кадр, кадр окончания).
+    Файлы камер, отсутствующих в справочнике camera_workshops, не планируются.
+    plans - готовый список FilePlan (например, по журналу обработки): файлы делятся
+    на отрезки начиная с кадра plan.start_frame.
+    """
+    if plans is None:
+        plans = [FilePlan(filename, camera_id, video_start_time, 0, None)
+                 for filename, camera_id, video_start_time in list_video_files(video_dir, camera_workshops)]
+    tasks = []
+    for plan in plans:
+        video_path = os.path.join(video_dir, plan.filename)
+        fps, frame_total = video_info(video_path)
+        segment_frames = max(1, int(segment_seconds * fps))
+        task = (plan.filename, video_path, plan.camera_id, plan.video_start_time)
+
+        if frame_total - plan.start_frame <= segment_frames:
+            tasks.append(task + (plan.start_frame, None))
+            continue
+
+        for start_frame in range(plan.start_frame, frame_total, segment_frames):
+            end_frame = start_frame + segment_frames
+            if end_frame >= frame_total:
+                end_frame = None
+            tasks.append(task + (start_frame, end_frame))
+    return tasks
+
+def process_videos_parallel(yolo_model_path, siz_model_path, video_dir, conn, options, progress=None,
+                            photo_store=None, cancel_event=None, on_status=None):
+    """
+    Параллельная обработка видеофайлов пулом процессов.
+    Каждый процесс загружает модели один раз; нарушения записываются в БД
+    только основным процессом, поэтому соединение не разделяется между процессами.
+    Прогресс файла отмечается в журнале по отрезкам, обработанным подряд с его начала;
+    файл с ошибкой чтения в каком-либо отрезке завершенным не отмечается.
+    После установки cancel_event новые отрезки не принимаются, а обрабатываемые прерываются.
+    Возвращает сводку {'files', 'segments', 'skipped', 'failed_files', 'violations', 'failed_reports',
+    'cancelled'} (violations - отчеты, записанные в БД) и счетчики кадров FRAME_STATS.
+    """
+    plans, skipped = plan_videos(conn, yolo_model_path, siz_model_path, video_dir, options)
+    tasks = plan_segments(video_dir, options.segment_seconds, plans=plans)
+    files = {task[0] for task in tasks}
+    total_stats = new_frame_stats()
+
+    # Начала еще не отмеченных отрезков каждого файла по порядку и обработанные отрезки.
+    # Каждый отрезок начинается без окна ожидания, поэтому время проверки в отметках не хранится
+    entries = {plan.filename: replace(plan.entry, last_check_time=None) for plan in plans if plan.entry}
+    pending_segments = {filename: sorted(task[4] for task in tasks if task[0] == filename)
+                        for filename in entries}
+    done_segments = {filename: set() for filename in entries}
+    failed_files = set()
+    cancelled = False
+
+    status = None
+    if on_status:
+        frame_totals = {plan.filename: video_info(os.path.join(video_dir, plan.filename))[1] for plan in plans}
+        status = RunStatus(sum(max(frame_totals[plan.filename] - plan.start_frame, 0) for plan in plans),
+                           on_status)
+
+    # spawn: дочерние процессы не наследуют состояние torch и соединение с БД
+    context = multiprocessing.get_context('spawn')
+    metrics = current_metrics()
+    report_writer = ReportWriter(conn, options.write_batch_rows, options.write_flush_seconds, photo_store)
+    for plan in plans:
+        if plan.reset:
+            time_range = reset_time_range(plan, *video_info(os.path.join(video_dir, plan.filename)))
+            if time_range:
+                report_writer.delete_reports(plan.camera_id, *time_range)
+
+    with report_writer, context.Pool(
+            processes=options.workers,
+            initializer=_init_worker,
+            initargs=(yolo_model_path, siz_model_path, options, metrics is not None)) as pool:
+        for done, result in enumerate(_iter_results(pool.imap_unordered(_process_segment, tasks), cancel_event), 1):
+            if result is None:
+                # Выход из пула завершает процессы; их незаписанные отрезки будут обработаны заново
+                cancelled = True
+                print("Обработка остановлена")
+                break
+            task, records, stats, segment_metrics, read_error = result
+            filename, camera_id = task[0], task[2]
+            saved_violations = 0
+            for key in FRAME_STATS:
+                total_stats[key] += stats[key]
+            if metrics and segment_metrics:
+                metrics.merge(segment_metrics)
+
+            for frame_time, violation, photo_data, thumbnail, box in records:
+                report_writer.add(
+                    camera_id=camera_id,
+                    violation_time=frame_time,
+                    violation_type=violation,
+                    photo_data=photo_data,
+                    thumbnail=thumbnail,
+                    box=box
+                )
+                saved_violations += 1
+
+            if read_error:
+                # Отрезок не считается обработанным: отметка файла не сдвинется дальше его начала
+                failed_files.add(filename)
+                print(f"Ошибка чтения видео: {read_error}")
+            elif filename in entries:
+                # Отметка сдвигается, только когда обработаны все отрезки до нее
+                pending, finished = pending_segments[filename], done_segments[filename]
+                finished.add(task[4])
+                advanced = False
+                while pending and pending[0] in finished:
+                    pending.pop(0)
+                    advanced = True
+                if not pending:
+                    report_writer.checkpoint(entries[filename].row(completed=True))
+                elif advanced:
+                    report_writer.checkpoint(entries[filename].row(pending[0]))
+            report_writer.flush_if_due()
+
+            count('violations', saved_violations)
+            if status:
+                status.finish_part((task[5] or frame_totals[filename]) - task[4], saved_violations)
+            print(f"[{done}/{len(tasks)}] Обработан отрезок {filename} "
+                  f"(кадры {task[4]}-{task[5] or 'конец'}). Найдено нарушений: {saved_violations}")
+            if progress:
+                progress(done, len(tasks), filename)
+
+    print(f"Обработка завершена: файлов {len(files)}, отрезков {len(tasks)}, нарушений {report_writer.written}")
+    if report_writer.failed:
+        print(f"Не записано отчетов: {report_writer.failed}")
+    if skipped:
+        print(f"Пропущено ранее обработанных файлов: {skipped}")
+    print(f"Кадров выбрано: {total_stats['sampled_frames']}, отсеяно фильтром движения: {total_stats['gated_frames']}")
+    return {'files': len(files), 'segments': len(tasks), 'skipped': skipped, 'failed_files': len(failed_files),
+            'violations': report_writer.written, 'failed_reports': report_writer.failed, 'cancelled': cancelled,
+            **total_stats}
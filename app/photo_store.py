@@ -0,0 +1,79 @@
+# photo_store.py
+import hashlib
+import mmap
+import os
+import tempfile
+
+class PhotoStore:
+    """
+    Хранилище снимков нарушений на диске с адресацией по содержимому.
+    Файл снимка называется SHA-256 его байтов и лежит в root/ab/cd/<hash>.jpg,
+    поэтому одинаковые снимки хранятся один раз, а запись файла идемпотентна.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def for_database(cls, db_path):
+        """Хранилище снимков рядом с файлом БД: <путь к БД>.photos"""
+        return cls(os.path.abspath(db_path) + '.photos')
+
+    def path_for(self, photo_hash):
+        return os.path.join(self.root, photo_hash[:2], photo_hash[2:4], f"{photo_hash}.jpg")
+
+    def put(self, data):
+        """Сохраняет снимок и возвращает его хэш"""
+        photo_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(photo_hash)
+        if os.path.exists(path):
+            try:
+                # Повторно использованный снимок не должен попасть под удаление как давно не нужный
+                os.utime(path)
+                return photo_hash
+            except FileNotFoundError:
+                pass
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Запись во временный файл и переименование: читатели не увидят недописанный снимок
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return photo_hash
+
+    def get(self, photo_hash):
+        """Читает снимок через отображение файла в память; None, если снимка нет"""
+        path = self.path_for(photo_hash)
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b''
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return mapped[:]
+        except FileNotFoundError:
+            return None
+
+    def delete(self, photo_hash):
+        """Удаляет снимок; возвращает число освобожденных байт"""
+        path = self.path_for(photo_hash)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def iter_hashes(self):
+        """Хэши всех снимков хранилища"""
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.jpg'):
+                    yield filename[:-len('.jpg')]
@@ -0,0 +1,174 @@
+# pipeline.py
+import queue
+import threading
+import cv2
+from .sampling import skip_frames, truncated_read_error
+from .metrics import count, timed
+
+# Признак окончания потока данных в очереди
+_END = object()
+
+class FrameDecoder(threading.Thread):
+    """
+    Поток декодирования видео.
+    Кадры между выбранными политикой выборки пропускаются через cap.grab() или перемотку
+    без декодирования изображения, выбранные кладутся в ограниченную очередь
+    кортежами (номер кадра, секунда видео, кадр). При заполненной очереди поток ждет.
+    Стадия инференса сообщает о проверках и людях в кадре через update(),
+    чтобы декодер сразу перескакивал окно ожидания и снижал частоту без людей.
+    """
+
+    def __init__(self, video_path, policy, start_frame=0, end_frame=None, queue_size=32):
+        super().__init__(daemon=True)
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        self.policy = policy
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self._stop_event = threading.Event()
+        self._last_check_time = -policy.cooldown_seconds
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+        self.fps = fps if fps > 0 else 30.0
+        self._last_seen_time = start_frame / self.fps
+
+    def update(self, last_check_time, last_seen_time):
+        """Передает декодеру время последней проверки СИЗ и последнего появления людей"""
+        self._last_check_time = last_check_time
+        self._last_seen_time = last_seen_time
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def stop(self):
+        """Останавливает декодирование и освобождает место в очереди"""
+        self._stop_event.set()
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                break
+
+    def _put(self, item):
+        """Кладет элемент в очередь; возвращает False, если декодирование остановлено"""
+        while not self._stop_event.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        try:
+            seek_threshold = self.policy.seek_threshold(self.fps)
+            position = 0
+            frame_index = self.start_frame
+            while not self._stop_event.is_set():
+                if self.end_frame is not None and frame_index >= self.end_frame:
+                    break
+                with timed('decode'):
+                    ret = skip_frames(self.cap, position, frame_index, seek_threshold)
+                    if ret:
+                        ret, frame = self.cap.read()
+                if not ret:
+                    # Оборванный файл передается стадии инференса как ошибка (см. batches)
+                    self.error = truncated_read_error(self.cap, frame_index, self.fps, self.video_path)
+                    break
+                count('decoded_frames')
+                position = frame_index + 1
+                if not self._put((frame_index, frame_index / self.fps, frame)):
+                    break
+
+                frame_index = self.policy.next_frame(
+                    frame_index, self.fps, self._last_check_time, self._last_seen_time)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.cap.release()
+            self._put(_END)
+
+    def batches(self, batch_size):
+        """Генератор пакетов (списков) декодированных кадров размером до batch_size"""
+        finished = False
+        while not finished:
+            batch = [self.frames.get()]
+            if batch[0] is _END:
+                break
+            # Добираем пакет тем, что уже готово, не дожидаясь новых кадров
+            while len(batch) < batch_size:
+                try:
+                    item = self.frames.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    finished = True
+                    break
+                batch.append(item)
+            yield batch
+
+        if self.error is not None:
+            raise self.error
+
+class ViolationWriter(threading.Thread):
+    """
+    Асинхронная стадия записи нарушений.
+    Принимает кортежи аргументов для handler и вызывает его в отдельном потоке,
+    чтобы кодирование снимков и запросы к БД не задерживали инференс.
+    Если новых нарушений нет idle_seconds секунд, вызывается idle (например, сброс буфера записи).
+    Через call в тот же поток передаются другие операции с БД (отметки прогресса),
+    которые выполняются строго после ранее переданных нарушений.
+    """
+
+    def __init__(self, handler, queue_size=64, idle=None, idle_seconds=1.0):
+        super().__init__(daemon=True)
+        self.handler = handler
+        self.idle = idle
+        self.idle_seconds = idle_seconds
+        self.records = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.failed = 0
+
+    def submit(self, *record):
+        self.records.put((None, record))
+
+    def call(self, func, *args):
+        self.records.put((func, args))
+
+    def close(self):
+        """Дожидается записи всех переданных нарушений и завершает поток"""
+        self.records.put(_END)
+        self.join()
+
+    def run(self):
+        while True:
+            try:
+                record = self.records.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                if self.idle:
+                    # Ошибка сброса не должна останавливать поток: иначе submit заблокируется
+                    # на заполненной очереди
+                    try:
+                        self.idle()
+                    except Exception as e:
+                        print(f"Ошибка записи в БД: {str(e)}")
+                continue
+            if record is _END:
+                break
+            func, record = record
+            if func is not None:
+                try:
+                    func(*record)
+                except Exception as e:
+                    print(f"Ошибка записи в БД: {str(e)}")
+                continue
+            try:
+                if self.handler(*record):
+                    self.written += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Ошибка записи нарушения: {str(e)}")
@@ -6,17 +6,36 @@ from reportlab.platypus import Paragraph
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from io import BytesIO
+import multiprocessing
+import multiprocessing.util
 import os
+import threading
+from .database import connect_database, get_reports_page, get_report_photo
+from .photo_store import PhotoStore
 
 RUSSIAN_FONT_PATH = '/usr/share/fonts/liberation/LiberationMono-Regular.ttf'
 RUSSIAN_FONT_BOLD_PATH = '/usr/share/fonts/liberation/LiberationMono-Bold.ttf'
 
+# Число отчетов, читаемых из БД за один запрос при выгрузке
+EXPORT_PAGE_SIZE = 200
+
+# Шрифты и стили настраиваются один раз на процесс
+_styles = None
+_styles_lock = threading.Lock()
+
+# Процесс пакетной выгрузки: соединение с БД и хранилище снимков
+_export_state = {}
+
 def register_russian_fonts():
-    """Регистрация русских шрифтов для использования в отчетах"""
+    """Регистрация русских шрифтов для использования в отчетах; False, если файлов шрифтов нет"""
+    if not (os.path.exists(RUSSIAN_FONT_PATH) and os.path.exists(RUSSIAN_FONT_BOLD_PATH)):
+        print("Русские шрифты не найдены, используются стандартные шрифты PDF")
+        return False
     try:
         if os.path.exists(RUSSIAN_FONT_PATH):
             pdfmetrics.registerFont(TTFont('RussianFont', RUSSIAN_FONT_PATH))
-        
+
         if os.path.exists(RUSSIAN_FONT_BOLD_PATH):
             pdfmetrics.registerFont(TTFont('RussianFont-Bold', RUSSIAN_FONT_BOLD_PATH))
         return True
@@ -24,100 +43,215 @@ def register_russian_fonts():
         print(f"Ошибка регистрации шрифтов: {str(e)}")
         return False
 
-def generate_report_pdf(image_path, workshop_number, camera_id, violation_time, violation_type, output_path):
+def get_report_styles():
+    """Шрифты и стили отчета: (обычный шрифт, жирный шрифт, стиль заголовка, стиль текста)"""
+    global _styles
+    with _styles_lock:
+        if _styles is not None:
+            return _styles
+
+        russian_fonts_registered = register_russian_fonts()
+        font_normal = 'RussianFont' if russian_fonts_registered else 'Helvetica'
+        font_bold = 'RussianFont-Bold' if russian_fonts_registered else 'Helvetica-Bold'
+
+        styles = getSampleStyleSheet()
+
+        title_style = ParagraphStyle(
+            'TitleStyle',
+            parent=styles['Heading1'],
+            fontName=font_bold,
+            textColor=colors.red,
+            fontSize=18,
+            alignment=1,
+            leading=20
+        )
+
+        body_style = ParagraphStyle(
+            'BodyStyle',
+            parent=styles['BodyText'],
+            fontName=font_normal,
+            textColor=colors.black,
+            fontSize=12,
+            leading=14
+        )
+
+        _styles = (font_normal, font_bold, title_style, body_style)
+        return _styles
+
+def draw_report_page(c, photo_data, workshop_number, camera_id, violation_time, violation_type):
     """
-    Генерация PDF отчета о нарушении
-    
-    Параметры:
-    image_path - путь к изображению с нарушением
-    workshop_number - номер цеха
-    camera_id - ID камеры
-    violation_time - время нарушения (строка)
-    violation_type - тип нарушения
-    output_path - путь для сохранения PDF
+    Рисует страницу отчета о нарушении на холсте c.
+    photo_data - байты JPEG снимка (читаются из памяти, без временного файла) или путь к изображению;
+    None - снимка нет.
     """
-    russian_fonts_registered = register_russian_fonts()
-    
-    font_normal = 'RussianFont' if russian_fonts_registered else 'Helvetica'
-    font_bold = 'RussianFont-Bold' if russian_fonts_registered else 'Helvetica-Bold'
-    
-    c = canvas.Canvas(output_path, pagesize=A4)
+    font_normal, _, title_style, body_style = get_report_styles()
     width, height = A4
-    
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'TitleStyle',
-        parent=styles['Heading1'],
-        fontName=font_bold,
-        textColor=colors.red,
-        fontSize=18,
-        alignment=1,
-        leading=20
-    )
-    
-    body_style = ParagraphStyle(
-        'BodyStyle',
-        parent=styles['BodyText'],
-        fontName=font_normal,
-        textColor=colors.black,
-        fontSize=12,
-        leading=14
-    )
-    
+
     # Заголовок отчета
     title = Paragraph("ОТЧЕТ О НАРУШЕНИИ СИЗ", title_style)
     title.wrap(width - 100, 50)
     title.drawOn(c, 50, height - 70)
-    
+
     c.line(50, height - 90, width - 50, height - 90)
-    
+
     info_items = [
         f"Цех: {workshop_number}",
         f"Камера: {camera_id}",
         f"Дата и время нарушения: {violation_time}",
         f"Тип нарушения: {violation_type}"
     ]
-    
+
     y_position = height - 120
     for text in info_items:
         p = Paragraph(text, body_style)
         p.wrap(width - 100, 40)
         p.drawOn(c, 50, y_position)
         y_position -= 30
-    
-    try:
-        img = ImageReader(image_path)
-        img_width, img_height = img.getSize()
-        aspect = img_height / float(img_width)
-        
-        display_width = min(400, width - 100)
-        display_height = min(300, display_width * aspect)
-        
-        # Позиционируем изображение по центру
-        x_pos = (width - display_width) / 2
-        y_pos = y_position - display_height - 20
-        
-        if y_pos < 50:
-            display_height = y_position - 70
-            display_width = display_height / aspect
-            x_pos = (width - display_width) / 2
-        
-        c.drawImage(
-            img, 
-            x_pos, 
-            y_pos,
-            width=display_width,
-            height=display_height,
-            mask='auto'
-        )
-    except Exception as e:
-        print(f"Ошибка при добавлении изображения: {str(e)}")
+
+    if photo_data is None:
+        # Полноразмерный снимок удален по сроку хранения, а миниатюры у отчета нет
         c.setFont(font_normal, 12)
         c.drawString(50, y_position - 30, "Изображение недоступно")
-    
+    else:
+        try:
+            image = photo_data
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                image = BytesIO(image)
+            img = ImageReader(image)
+            img_width, img_height = img.getSize()
+            aspect = img_height / float(img_width)
+
+            display_width = min(400, width - 100)
+            display_height = min(300, display_width * aspect)
+
+            # Позиционируем изображение по центру
+            x_pos = (width - display_width) / 2
+            y_pos = y_position - display_height - 20
+
+            if y_pos < 50:
+                display_height = y_position - 70
+                display_width = display_height / aspect
+                x_pos = (width - display_width) / 2
+
+            c.drawImage(
+                img,
+                x_pos,
+                y_pos,
+                width=display_width,
+                height=display_height,
+                mask='auto'
+            )
+        except Exception as e:
+            print(f"Ошибка при добавлении изображения: {str(e)}")
+            c.setFont(font_normal, 12)
+            c.drawString(50, y_position - 30, "Изображение недоступно")
+
     c.setFont(font_normal, 10)
     c.setFillColor(colors.grey)
     c.drawCentredString(width/2, 30, "Сгенерировано системой контроля СИЗ")
-    
-    c.save()
\ No newline at end of file
+
+def generate_report_pdf(photo_data, workshop_number, camera_id, violation_time, violation_type, output_path):
+    """
+    Генерация PDF отчета о нарушении
+
+    Параметры:
+    photo_data - байты JPEG снимка нарушения (или путь к изображению)
+    workshop_number - номер цеха
+    camera_id - ID камеры
+    violation_time - время нарушения (строка)
+    violation_type - тип нарушения
+    output_path - путь для сохранения PDF
+    """
+    c = canvas.Canvas(output_path, pagesize=A4)
+    draw_report_page(c, photo_data, workshop_number, camera_id, violation_time, violation_type)
+    c.save()
+
+def _report_fields(report):
+    """Поля страницы из строки get_reports_page: (цех, камера, время строкой, тип нарушения)"""
+    return report[4], report[1], report[2].strftime('%Y-%m-%d %H:%M:%S'), report[3]
+
+def iter_reports(conn, page_size=EXPORT_PAGE_SIZE, **filters):
+    """Все отчеты, подходящие под фильтры get_reports_page, постранично (новые сначала)"""
+    after = None
+    while True:
+        page = get_reports_page(conn, page_size, after, **filters)
+        yield from page
+        if len(page) < page_size:
+            return
+        after = (page[-1][2], page[-1][0])
+
+def export_reports_pdf(conn, output_path, photo_store=None, progress=None, **filters):
+    """
+    Выгрузка отчетов, подходящих под фильтры get_reports_page (период, цех, камера, тип),
+    в один многостраничный PDF: страница на нарушение.
+    progress - необязательный обработчик progress(выгружено отчетов).
+    Возвращает число выгруженных отчетов.
+    """
+    c = canvas.Canvas(output_path, pagesize=A4)
+    exported = 0
+    for report in iter_reports(conn, **filters):
+        photo_data = get_report_photo(conn, report[0], photo_store)
+        draw_report_page(c, photo_data, *_report_fields(report))
+        c.showPage()
+        exported += 1
+        if progress:
+            progress(exported)
+    if exported:
+        c.save()
+    return exported
+
+def _close_export_worker():
+    conn = _export_state.pop('conn', None)
+    if conn is not None:
+        conn.close()
+
+def _init_export_worker(db_path, user, password, photo_store_root):
+    """Процесс выгрузки открывает свое соединение с БД и настраивает шрифты один раз"""
+    _export_state['conn'] = connect_database(db_path, user, password)
+    # Процессы пула завершаются через os._exit, поэтому atexit в них не срабатывает:
+    # соединение закрывается финализатором multiprocessing при штатном завершении процесса
+    multiprocessing.util.Finalize(None, _close_export_worker, exitpriority=10)
+    _export_state['photo_store'] = PhotoStore(photo_store_root) if photo_store_root else None
+    get_report_styles()
+
+def _export_chunk(task):
+    """Выгрузка группы отчетов в отдельные файлы report_<id>.pdf; возвращает пути"""
+    reports, output_dir = task
+    paths = []
+    for report in reports:
+        photo_data = get_report_photo(_export_state['conn'], report[0], _export_state['photo_store'])
+        path = os.path.join(output_dir, f"report_{report[0]}.pdf")
+        generate_report_pdf(photo_data, *_report_fields(report), path)
+        paths.append(path)
+    return paths
+
+def export_reports_parallel(db_path, user, password, output_dir, photo_store_root=None, workers=None,
+                            chunk_size=50, **filters):
+    """
+    Выгрузка отчетов, подходящих под фильтры, в отдельные PDF (report_<id>.pdf)
+    пулом процессов. Список отчетов читается основным процессом, каждый процесс
+    выгрузки открывает свое соединение с БД и читает снимки сам.
+    Возвращает список путей созданных файлов.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    conn = connect_database(db_path, user, password)
+    try:
+        reports = list(iter_reports(conn, **filters))
+    finally:
+        conn.close()
+    if not reports:
+        return []
+
+    tasks = [(reports[i:i + chunk_size], output_dir) for i in range(0, len(reports), chunk_size)]
+    context = multiprocessing.get_context('spawn')
+    paths = []
+    with context.Pool(
+            processes=workers or os.cpu_count(),
+            initializer=_init_export_worker,
+            initargs=(db_path, user, password, photo_store_root)) as pool:
+        for chunk_paths in pool.imap_unordered(_export_chunk, tasks):
+            paths.extend(chunk_paths)
+        # Штатное завершение процессов (а не terminate при выходе из with): закрываются их соединения
+        pool.close()
+        pool.join()
+    return paths
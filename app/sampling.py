@@ -0,0 +1,81 @@
+# sampling.py
+import math
+import os
+import cv2
+from dataclasses import dataclass
+
+@dataclass
+class SamplingPolicy:
+    """Политика выборки кадров для анализа"""
+    # Число анализируемых кадров в секунду видео
+    samples_per_second: float = 6.0
+    # После проверки СИЗ следующая возможна не раньше чем через столько секунд
+    cooldown_seconds: float = 10.0
+    # Частота выборки, когда в кадре давно нет людей (None - не снижать)
+    idle_samples_per_second: float = None
+    # Через сколько секунд без людей включается пониженная частота
+    idle_after_seconds: float = 5.0
+    # Пропуски длиннее этого (секунды) выполняются перемоткой, короче - через cap.grab()
+    seek_threshold_seconds: float = 2.0
+
+    def frame_step(self, fps, idle=False):
+        """Шаг между анализируемыми кадрами"""
+        rate = self.samples_per_second
+        if idle and self.idle_samples_per_second:
+            rate = self.idle_samples_per_second
+        return max(1, int(round(fps / rate)))
+
+    def next_frame(self, frame_index, fps, last_check_time, last_seen_time):
+        """
+        Номер следующего анализируемого кадра.
+        Кадры внутри окна ожидания после проверки СИЗ пропускаются целиком:
+        нарушение в них все равно не может быть записано.
+        """
+        current_time = frame_index / fps
+        idle = current_time - last_seen_time >= self.idle_after_seconds
+        next_index = frame_index + self.frame_step(fps, idle)
+
+        cooldown_end = last_check_time + self.cooldown_seconds
+        if next_index / fps < cooldown_end:
+            next_index = math.ceil(cooldown_end * fps)
+        return next_index
+
+    def next_sample_time(self, current_time, last_check_time, last_seen_time):
+        """Время (секунды) следующего анализируемого кадра живого потока; аналог next_frame"""
+        idle = current_time - last_seen_time >= self.idle_after_seconds
+        rate = self.samples_per_second
+        if idle and self.idle_samples_per_second:
+            rate = self.idle_samples_per_second
+        return max(current_time + 1.0 / rate, last_check_time + self.cooldown_seconds)
+
+    def seek_threshold(self, fps):
+        """Порог перемотки в кадрах"""
+        return max(1, int(self.seek_threshold_seconds * fps))
+
+class VideoReadError(Exception):
+    """Видеофайл не открывается или обрывается раньше заявленной длины (например, недокопирован)"""
+
+def truncated_read_error(cap, frame_index, fps, video_path):
+    """
+    Ошибка для кадра frame_index, который не удалось прочитать, если до заявленного конца
+    видео больше секунды (число кадров в заголовке приблизительное); None - видео прочитано до конца.
+    """
+    frame_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_total > 0 and frame_index < frame_total - fps:
+        return VideoReadError(
+            f"Чтение {os.path.basename(video_path)} оборвалось на кадре {frame_index} из {frame_total}")
+    return None
+
+def skip_frames(cap, position, target, seek_threshold):
+    """
+    Переводит захват с кадра position на кадр target без декодирования промежуточных:
+    короткие пропуски - через cap.grab(), длинные - перемоткой.
+    Возвращает False, если видео закончилось.
+    """
+    if target - position > seek_threshold:
+        return cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+
+    for _ in range(target - position):
+        if not cap.grab():
+            return False
+    return True
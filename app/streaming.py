@@ -0,0 +1,266 @@
+# streaming.py
+"""
+Обработка живых потоков камер (RTSP, HTTP, устройства захвата).
+
+Каждую камеру читает свой поток CameraCapture: он постоянно забирает кадры из источника,
+чтобы не копилась задержка, и публикует в общий набор слотов только кадры, выбранные
+политикой выборки. В слоте камеры хранится один последний кадр: если инференс не успевает,
+старый кадр заменяется новым (счетчик dropped). Один поток инференса StreamProcessor
+забирает кадры всех камер и обрабатывает их общими пакетами YOLO и модели СИЗ.
+Вместо камеры можно указать видеофайл: он читается в темпе записи и при окончании
+открывается заново, как переподключившийся поток.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+import cv2
+from .model_registry import get_siz_model, get_yolo_model
+from .database import ReportWriter, get_camera_workshops
+from .pipeline import ViolationWriter
+from .metrics import timed
+from .video_processor import ProcessingOptions, find_violations_batch, draw_violation_box, save_violation
+
+# Пауза перед первым переподключением и ее предел (удваивается после каждой неудачи)
+RECONNECT_INITIAL_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 60.0
+
+def load_camera_sources(path):
+    """
+    Список камер из JSON-файла {"номер камеры": источник}.
+    Источник - адрес потока (rtsp://..., http://...), путь к видеофайлу
+    или номер устройства захвата (целое число).
+    """
+    with open(path, encoding='utf-8') as f:
+        sources = json.load(f)
+    return {int(camera_id): source for camera_id, source in sources.items()}
+
+def _open_source(source):
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+class FrameSlots:
+    """Последние выбранные кадры камер: не больше одного ожидающего кадра на камеру"""
+
+    def __init__(self):
+        self._frames = {}
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, camera_id, item):
+        with self._condition:
+            if camera_id in self._frames:
+                # Инференс не успевает: устаревший кадр заменяется, задержка не растет
+                self.dropped += 1
+            self._frames[camera_id] = item
+            self._condition.notify()
+
+    def take(self, timeout):
+        """Забирает все ожидающие кадры: список (камера, кадр); пустой, если за timeout ничего нет"""
+        with self._condition:
+            if not self._frames:
+                self._condition.wait(timeout)
+            items = list(self._frames.items())
+            self._frames.clear()
+            return items
+
+class CameraCapture(threading.Thread):
+    """
+    Поток чтения одной камеры с переподключением.
+    Публикует в slots кортежи (секунда потока, время кадра, кадр) для кадров,
+    выбранных политикой выборки; остальные кадры читаются и отбрасываются.
+    При обрыве или ошибке открытия ждет паузу, удваивая ее до RECONNECT_MAX_SECONDS.
+    """
+
+    def __init__(self, camera_id, source, slots, policy, stop_event):
+        super().__init__(daemon=True, name=f"camera-{camera_id}")
+        self.camera_id = camera_id
+        self.source = source
+        self.slots = slots
+        self.policy = policy
+        self.stop_event = stop_event
+        self.started_at = time.monotonic()
+        self.frames_read = 0
+        self.frames_published = 0
+        self.reconnects = 0
+        self.connected = False
+        self._last_check_time = -policy.cooldown_seconds
+        self._last_seen_time = 0.0
+
+    def update(self, last_check_time, last_seen_time):
+        """Передает время последней проверки СИЗ и последнего появления людей (секунды потока)"""
+        self._last_check_time = last_check_time
+        self._last_seen_time = last_seen_time
+
+    def _read_stream(self, cap):
+        """Читает источник до обрыва или остановки"""
+        # Видеофайл вместо камеры читается в темпе записи, а не с максимальной скоростью
+        file_fps = cap.get(cv2.CAP_PROP_FPS) if cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0 else 0
+        opened_at = time.monotonic()
+        last_published = None
+        while not self.stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                return
+            self.frames_read += 1
+            if file_fps > 0:
+                delay = opened_at + cap.get(cv2.CAP_PROP_POS_FRAMES) / file_fps - time.monotonic()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+
+            current_time = time.monotonic() - self.started_at
+            # Срок пересчитывается на каждом кадре: инференс мог сообщить о новой проверке СИЗ
+            if last_published is not None and current_time < self.policy.next_sample_time(
+                    last_published, self._last_check_time, self._last_seen_time):
+                continue
+            self.slots.put(self.camera_id, (current_time, datetime.now(), frame))
+            self.frames_published += 1
+            last_published = current_time
+
+    def run(self):
+        backoff = RECONNECT_INITIAL_SECONDS
+        while not self.stop_event.is_set():
+            cap = _open_source(self.source)
+            try:
+                if cap.isOpened():
+                    self.connected = True
+                    backoff = RECONNECT_INITIAL_SECONDS
+                    self._read_stream(cap)
+            except Exception as e:
+                print(f"Ошибка чтения камеры {self.camera_id}: {str(e)}")
+            finally:
+                self.connected = False
+                cap.release()
+
+            if self.stop_event.is_set():
+                break
+            print(f"Поток камеры {self.camera_id} недоступен, переподключение через {backoff:.0f} с")
+            self.reconnects += 1
+            self.stop_event.wait(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+class StreamProcessor:
+    """
+    Наблюдение за камерами в реальном времени.
+    camera_sources - {номер камеры: источник}; камеры без цеха в справочнике не запускаются.
+    Нарушения записываются в БД пакетами в отдельном потоке (соединение conn используется
+    только им) и передаются в on_alert(камера, время, нарушение, снимок) сразу после обнаружения.
+    """
+
+    def __init__(self, yolo_model_path, siz_model_path, camera_sources, conn, options=None,
+                 photo_store=None, on_alert=None):
+        self.options = options or ProcessingOptions()
+        self.yolo_model = get_yolo_model(yolo_model_path, self.options.inference)
+        self.siz_model = get_siz_model(siz_model_path, self.options.inference)
+        self.on_alert = on_alert
+        self.slots = FrameSlots()
+        self.stop_event = threading.Event()
+
+        camera_workshops = get_camera_workshops(conn)
+        self.captures = {}
+        for camera_id, source in camera_sources.items():
+            if camera_id not in camera_workshops:
+                print(f"Не найден цех для камеры {camera_id}, поток не запускается")
+                continue
+            self.captures[camera_id] = CameraCapture(
+                camera_id, source, self.slots, self.options.sampling, self.stop_event)
+
+        self.report_writer = ReportWriter(
+            conn, self.options.write_batch_rows, self.options.write_flush_seconds, photo_store)
+        self.writer = ViolationWriter(save_violation, self.options.queue_size,
+                                      idle=self.report_writer.flush_if_due)
+        self._inference = threading.Thread(target=self._run_inference, daemon=True, name="stream-inference")
+        self._state = {camera_id: {'last_check_time': -self.options.sampling.cooldown_seconds,
+                                   'last_seen_time': 0.0,
+                                   'people_in_view': False,
+                                   'gate': self.options.motion.create_gate()}
+                       for camera_id in self.captures}
+        self.stats = {'processed_frames': 0, 'gated_frames': 0, 'detected_frames': 0, 'violations': 0}
+
+    def start(self):
+        self.writer.start()
+        self._inference.start()
+        for capture in self.captures.values():
+            capture.start()
+
+    def stop(self):
+        """Останавливает чтение камер, дожидается записи найденных нарушений"""
+        self.stop_event.set()
+        # После неудачного start() часть потоков может быть не запущена
+        for capture in self.captures.values():
+            if capture.is_alive():
+                # Чтение сетевого потока может зависнуть до таймаута источника; поток-демон не держит выход
+                capture.join(timeout=5.0)
+        if self._inference.is_alive():
+            self._inference.join()
+        if self.writer.is_alive():
+            self.writer.close()
+        self.report_writer.close()
+
+    def status(self):
+        """Счетчики по камерам и общие: прочитанные, выбранные и отброшенные кадры, нарушения"""
+        cameras = {camera_id: {'connected': capture.connected,
+                               'frames_read': capture.frames_read,
+                               'frames_published': capture.frames_published,
+                               'reconnects': capture.reconnects}
+                   for camera_id, capture in self.captures.items()}
+        return {'cameras': cameras, 'dropped_frames': self.slots.dropped, **self.stats}
+
+    def _select(self, items):
+        """Отбор кадров для YOLO: окно ожидания после проверки СИЗ и фильтр движения камеры"""
+        selected = []
+        for camera_id, (current_time, frame_time, frame) in items:
+            state = self._state[camera_id]
+            if current_time - state['last_check_time'] < self.options.sampling.cooldown_seconds:
+                continue
+            gate = state['gate']
+            if gate and not gate.should_detect(frame, current_time, state['people_in_view']):
+                self.stats['gated_frames'] += 1
+                continue
+            selected.append((camera_id, current_time, frame_time, frame))
+        return selected
+
+    def _process_batch(self, batch):
+        with timed('yolo'):
+            detections_list = self.yolo_model.detect([frame for _, _, _, frame in batch])
+        self.stats['processed_frames'] += len(batch)
+
+        checked = []
+        for (camera_id, current_time, frame_time, frame), detections in zip(batch, detections_list):
+            state = self._state[camera_id]
+            state['people_in_view'] = len(detections) > 0
+            if state['people_in_view']:
+                self.stats['detected_frames'] += 1
+                state['last_seen_time'] = current_time
+                state['last_check_time'] = current_time
+                checked.append((camera_id, frame_time, frame, detections))
+            self.captures[camera_id].update(state['last_check_time'], state['last_seen_time'])
+
+        if not checked:
+            return
+        violations = find_violations_batch(
+            self.siz_model,
+            [frame for _, _, frame, _ in checked],
+            [detections for _, _, _, detections in checked],
+            self.options
+        )
+        for (camera_id, frame_time, frame, _), frame_violations in zip(checked, violations):
+            for violation, box in frame_violations:
+                snapshot = frame if box is None else draw_violation_box(frame, box)
+                self.writer.submit(self.report_writer, camera_id, frame_time, violation, snapshot, self.options,
+                                   box)
+                self.stats['violations'] += 1
+                print(f"Нарушение: камера {camera_id}, {frame_time}: {violation}")
+                if self.on_alert:
+                    self.on_alert(camera_id, frame_time, violation, snapshot)
+
+    def _run_inference(self):
+        batch_size = self.options.batch_size
+        while not self.stop_event.is_set():
+            selected = self._select(self.slots.take(timeout=0.5))
+            for start in range(0, len(selected), batch_size):
+                try:
+                    self._process_batch(selected[start:start + batch_size])
+                except Exception as e:
+                    print(f"Ошибка обработки кадров камер: {str(e)}")
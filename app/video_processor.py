@@ -1,96 +1,598 @@
 # video_processor.py
 import os
+import time
 import cv2
-import tempfile
-import torch
 import numpy as np
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from .model_utils import load_siz_model, get_violation_type, detect_gear_presence, parse_video_filename
-from .database import add_report, get_workshop_by_camera
+from .model_utils import classify_gear_batch, crop_boxes, parse_video_filename
+from .model_registry import get_siz_model, get_yolo_model
+from .database import ReportWriter, get_camera_workshops
+from .pipeline import FrameDecoder, ViolationWriter
+from .sampling import SamplingPolicy, VideoReadError, skip_frames, truncated_read_error
+from .motion import MotionSettings
+from .backends import InferenceSettings
+from .ledger import FilePlan, model_version, plan_files
+from .metrics import MetricsSettings, count, metrics_session, timed
 
-def process_videos(yolo_model_path, siz_model_path, video_dir, conn):
-    """Обработка видеофайлов и сохранение нарушений с использованием YOLO для детекции людей"""
-    yolo_model = torch.hub.load('ultralytics/yolov5', 'custom', path=yolo_model_path)
-    siz_model = load_siz_model(siz_model_path)
-    
-    # Установка параметров для YOLO
-    yolo_model.conf = 0.5
-    yolo_model.classes = [0]
-    
-    for filename in os.listdir(video_dir):
-        if not filename.lower().endswith(('.mp4', '.avi', '.mov')):
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+
+# Счетчики кадров, накапливаемые при обработке: выбранные политикой выборки,
+# отсеянные фильтром движения и кадры, на которых YOLO нашла людей
+FRAME_STATS = ('sampled_frames', 'gated_frames', 'detected_frames')
+
+# Цвет рамки нарушителя на снимке (BGR)
+VIOLATION_BOX_COLOR = (0, 0, 255)
+
+@dataclass
+class ProcessingOptions:
+    """Настройки обработки видео"""
+    # Классифицировать СИЗ по вырезкам людей из рамок YOLO, а не по всему кадру
+    crop_people: bool = False
+    # Доля размера рамки, добавляемая к вырезке с каждой стороны
+    crop_padding: float = 0.1
+    # Число процессов-обработчиков (1 - обработка в текущем процессе)
+    workers: int = 1
+    # Длинные файлы делятся на отрезки такой длины (секунды) для параллельной обработки
+    segment_seconds: float = 600.0
+    # Число потоков torch в каждом процессе-обработчике
+    threads_per_worker: int = 1
+    # Конвейер: декодирование в отдельном потоке, пакетный инференс и асинхронная запись в БД
+    pipelined: bool = False
+    # Размер очереди декодированных кадров
+    queue_size: int = 32
+    # Максимальное число кадров в одном пакете YOLO
+    batch_size: int = 8
+    # Частота выборки кадров и окно ожидания между проверками СИЗ
+    sampling: SamplingPolicy = field(default_factory=SamplingPolicy)
+    # Фильтр движения: YOLO не запускается на статичных кадрах без людей
+    motion: MotionSettings = field(default_factory=MotionSettings)
+    # Движок инференса (TorchScript / ONNX Runtime) и число потоков
+    inference: InferenceSettings = field(default_factory=InferenceSettings)
+    # Отчеты записываются в БД пакетами: каждые write_batch_rows строк или write_flush_seconds секунд
+    write_batch_rows: int = 50
+    write_flush_seconds: float = 5.0
+    # Качество JPEG снимков нарушений (0-100) и максимальная ширина снимка (None - без уменьшения)
+    jpeg_quality: int = 90
+    snapshot_max_width: int = None
+    # Ширина миниатюры для быстрого просмотра (0 - не сохранять)
+    thumbnail_width: int = 160
+    # Журнал обработанных файлов: неизмененные файлы пропускаются, прерванные продолжаются
+    incremental: bool = True
+    # Заново обрабатывать файлы, обработанные другой версией моделей
+    reprocess_outdated: bool = False
+    # Интервал (секунды) между отметками прогресса файла в журнале
+    checkpoint_seconds: float = 30.0
+    # Выгрузка метрик (файл, HTTP) и профилирование запуска
+    metrics: MetricsSettings = field(default_factory=MetricsSettings)
+
+def list_video_files(video_dir, camera_workshops=None):
+    """
+    Список (имя файла, номер камеры, время начала записи) видеофайлов директории.
+    Если передан справочник камер, файлы камер без цеха пропускаются до декодирования.
+    """
+    videos = []
+    for filename in sorted(os.listdir(video_dir)):
+        if not filename.lower().endswith(VIDEO_EXTENSIONS):
             continue
             
         camera_id, video_start_time = parse_video_filename(filename)
         if camera_id is None:
             print(f"Неверный формат имени файла: {filename}")
             continue
-            
-        video_path = os.path.join(video_dir, filename)
-        cap = cv2.VideoCapture(video_path)
-        
-        if not cap.isOpened():
-            print(f"Не удалось открыть видео: {filename}")
+        if camera_workshops is not None and camera_id not in camera_workshops:
+            print(f"Не найден цех для камеры {camera_id}, файл пропущен: {filename}")
             continue
-            
-        # Получаем FPS видео
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0:
-            fps = 30.0
-        
-        saved_violations = 0
-        last_check_time = -10
-        frame_count = 0
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
+        videos.append((filename, camera_id, video_start_time))
+    return videos
+
+def video_info(video_path):
+    """FPS и число кадров видеофайла (число кадров 0, если контейнер его не сообщает)"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if fps <= 0:
+        fps = 30.0
+    return fps, max(frame_total, 0)
+
+def plan_videos(conn, yolo_model_path, siz_model_path, video_dir, options):
+    """
+    Файлы директории к обработке (список FilePlan) и число пропущенных по журналу.
+    Камеры без цеха отсеиваются по справочнику до декодирования первого кадра.
+    """
+    videos = list_video_files(video_dir, get_camera_workshops(conn))
+    if not options.incremental:
+        return [FilePlan(filename, camera_id, start_time, 0, None)
+                for filename, camera_id, start_time in videos], 0
+    version = model_version(yolo_model_path, siz_model_path, options.inference)
+    return plan_files(conn, video_dir, videos, version, options.reprocess_outdated)
+
+def reset_time_range(plan, fps, frame_total):
+    """
+    Период отчетов файла от кадра plan.start_frame до конца записи, которые
+    удаляются перед повторной обработкой; None, если длительность записи неизвестна.
+    """
+    if frame_total <= 0:
+        print(f"Длительность {plan.filename} неизвестна, прежние отчеты не удаляются")
+        return None
+    time_from = plan.video_start_time + timedelta(seconds=plan.start_frame / fps)
+    time_to = plan.video_start_time + timedelta(seconds=frame_total / fps + 1)
+    return time_from, time_to
+
+class FileCheckpoints:
+    """
+    Отметки прогресса обработки файла в журнале не чаще раза в interval секунд.
+    Отметки передаются в запись отчетов (write - прямой вызов или очередь ViolationWriter)
+    после нарушений предыдущих кадров и фиксируются в одной транзакции с ними.
+    """
+
+    def __init__(self, write, report_writer, entry, interval):
+        self.write = write
+        self.report_writer = report_writer
+        self.entry = entry
+        self.interval = interval
+        self.position = entry.last_frame
+        self.last_check_time = entry.last_check_time
+        self.saved_at = time.monotonic()
+
+    def __call__(self, position, last_check_time=None):
+        self.position = position
+        self.last_check_time = last_check_time
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        self.saved_at = time.monotonic()
+        row = self.entry.row(self.position, last_check_time=self.last_check_time)
+        self.write(self.report_writer.checkpoint, row)
+
+    def complete(self, position=None):
+        if position is not None:
+            self.position = position
+        self.write(self.report_writer.checkpoint, self.entry.row(self.position, completed=True))
+
+class RunStatus:
+    """
+    Ход обработки для отображения: пройденные кадры видео из общего числа, нарушения,
+    скорость (кадров видео в секунду) и оценка оставшегося времени.
+    callback(словарь) вызывается не чаще раза в interval секунд.
+    """
+
+    def __init__(self, frames_total, callback, interval=0.5):
+        self.frames_total = frames_total
+        self.callback = callback
+        self.interval = interval
+        self.frames_done = 0
+        self.current = 0
+        self.violations = 0
+        self.started = time.monotonic()
+        self.reported_at = 0.0
+
+    def file_position(self, frames):
+        """Пройдено frames кадров текущего файла"""
+        self.current = frames
+        self.report()
+
+    def finish_part(self, frames, violations=0):
+        """Завершен файл или отрезок длиной frames кадров"""
+        self.frames_done += frames
+        self.current = 0
+        self.violations += violations
+        self.report(force=True)
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.reported_at < self.interval:
+            return
+        self.reported_at = now
+        elapsed = now - self.started
+        done = min(self.frames_done + self.current, self.frames_total)
+        fps = done / elapsed if elapsed > 0 else 0.0
+        self.callback({
+            'frames_done': done,
+            'frames_total': self.frames_total,
+            'violations': self.violations,
+            'elapsed_seconds': elapsed,
+            'fps': fps,
+            'eta_seconds': (self.frames_total - done) / fps if fps > 0 else None,
+        })
+
+def find_violations_batch(siz_model, frames, detections_list, options):
+    """
+    Классифицирует СИЗ на пакете кадров с найденными людьми одним вызовом модели СИЗ.
+    Возвращает для каждого кадра список пар (нарушение, рамка); рамка равна None
+    при классификации всего кадра.
+    """
+    if not options.crop_people:
+        with timed('siz'):
+            predictions = classify_gear_batch(siz_model, frames)
+        return [[(violation, None)] if violation else [] for _, _, violation in predictions]
+
+    # Вырезки людей со всех кадров пакета классифицируются вместе
+    crops = []
+    owners = []
+    for index, (frame, detections) in enumerate(zip(frames, detections_list)):
+        frame_crops, boxes = crop_boxes(frame, detections[:, :4].tolist(), options.crop_padding)
+        crops.extend(frame_crops)
+        owners.extend((index, box) for box in boxes)
+
+    with timed('siz'):
+        predictions = classify_gear_batch(siz_model, crops)
+    violations = [[] for _ in frames]
+    for (_, _, violation), (index, box) in zip(predictions, owners):
+        if violation:
+            violations[index].append((violation, box))
+    return violations
+
+def find_violations(siz_model, frame, detections, options):
+    """
+    Классифицирует СИЗ на кадре с найденными людьми.
+    Возвращает список пар (нарушение, рамка); рамка равна None
+    при классификации всего кадра.
+    """
+    return find_violations_batch(siz_model, [frame], [detections], options)[0]
+
+def draw_violation_box(frame, box):
+    """Возвращает копию кадра с выделенной рамкой нарушителя"""
+    snapshot = frame.copy()
+    cv2.rectangle(snapshot, box[:2], box[2:], VIOLATION_BOX_COLOR, 2)
+    return snapshot
+
+def new_frame_stats():
+    """Пустой словарь счетчиков кадров"""
+    return dict.fromkeys(FRAME_STATS, 0)
+
+def encode_snapshot(image, quality=90, max_width=None):
+    """
+    Кодирование снимка нарушения в JPEG в памяти (без временного файла).
+    При заданной max_width более широкие снимки пропорционально уменьшаются.
+    Возвращает байты JPEG или None при ошибке кодирования.
+    """
+    height, width = image.shape[:2]
+    if max_width and width > max_width:
+        size = (max_width, max(1, int(round(height * max_width / width))))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return encoded.tobytes() if ok else None
+
+def encode_report_images(snapshot, options):
+    """Снимок и миниатюра нарушения в JPEG: (снимок, миниатюра или None); снимок None при ошибке"""
+    with timed('encode'):
+        photo_data = encode_snapshot(snapshot, options.jpeg_quality, options.snapshot_max_width)
+        thumbnail = None
+        if photo_data is not None and options.thumbnail_width:
+            thumbnail = encode_snapshot(snapshot, 70, options.thumbnail_width)
+    return photo_data, thumbnail
+
+def iter_file_violations(yolo_model, siz_model, video_path, options, start_frame=0, end_frame=None, stats=None,
+                         on_progress=None, cancel_event=None, last_check_time=None):
+    """
+    Обрабатывает видеофайл (или его отрезок [start_frame, end_frame)) и по мере
+    обнаружения выдает кортежи (секунда видео, нарушение, снимок, рамка).
+    Если передан словарь stats, в нем накапливаются счетчики FRAME_STATS.
+    on_progress(кадр, секунда последней проверки СИЗ или None) вызывается, когда все
+    нарушения кадров до указанного уже выданы.
+    last_check_time - секунда видео последней проверки СИЗ перед start_frame (из отметки
+    журнала): окно ожидания продолженной обработки не сбрасывается.
+    При установленном cancel_event обработка завершается после текущего кадра (пакета).
+    Если видео не открывается или обрывается раньше заявленной длины, выдается VideoReadError.
+    """
+    if stats is None:
+        stats = new_frame_stats()
+    if options.pipelined:
+        yield from iter_file_violations_pipelined(
+            yolo_model, siz_model, video_path, options, start_frame, end_frame, stats, on_progress, cancel_event,
+            last_check_time)
+        return
+
+    cap = cv2.VideoCapture(video_path)
+    
+    if not cap.isOpened():
+        raise VideoReadError(f"Не удалось открыть видео: {os.path.basename(video_path)}")
+
+    # Получаем FPS видео
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0:
+        fps = 30.0
+
+    policy = options.sampling
+    seek_threshold = policy.seek_threshold(fps)
+    checked = last_check_time is not None
+    if not checked:
+        last_check_time = -policy.cooldown_seconds
+    last_seen_time = start_frame / fps
+    people_in_view = False
+    gate = options.motion.create_gate()
+    position = 0
+    frame_index = start_frame
+
+    try:
+        while cap.isOpened() and (end_frame is None or frame_index < end_frame):
+            if on_progress:
+                on_progress(frame_index, last_check_time if checked else None)
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            # Кадры до следующего выбранного не декодируются
+            with timed('decode'):
+                ret = skip_frames(cap, position, frame_index, seek_threshold)
+                if ret:
+                    ret, frame = cap.read()
             if not ret:
+                error = truncated_read_error(cap, frame_index, fps, video_path)
+                if error:
+                    raise error
                 break
-                
+            count('decoded_frames')
+            position = frame_index + 1
+
             # Вычисляем текущее время в видео (секунды)
-            current_time = frame_count / fps
-            
-            if frame_count % 5 != 0:
-                frame_count += 1
+            current_time = frame_index / fps
+            stats['sampled_frames'] += 1
+            count('sampled_frames')
+
+            if gate and not gate.should_detect(frame, current_time, people_in_view):
+                stats['gated_frames'] += 1
+                count('gated_frames')
+                frame_index = policy.next_frame(frame_index, fps, last_check_time, last_seen_time)
                 continue
                 
             # Детекция людей с помощью YOLO
-            results = yolo_model(frame)
-            people_detected = len(results.xyxy[0]) > 0
-            
-            if people_detected and (current_time - last_check_time >= 10):
-                gear_ok = detect_gear_presence(siz_model, frame)
-                
-                if not gear_ok:
-                    violation = get_violation_type(siz_model, frame)
-                    
-                    if violation:
-                        # Создаем временное изображение
-                        _, temp_img = tempfile.mkstemp(suffix=f'_{saved_violations}.jpg')
-                        cv2.imwrite(temp_img, frame)
-                        
-                        workshop_number = get_workshop_by_camera(conn, camera_id)
-                        if workshop_number is None:
-                            os.remove(temp_img)
-                            print(f"Не найден цех для камеры {camera_id}")
-                        else:
-                            # Рассчитываем время кадра
-                            frame_time = video_start_time + timedelta(seconds=current_time)
-                            
-                            add_report(
-                                conn=conn,
-                                camera_id=camera_id,
-                                violation_time=frame_time,
-                                violation_type=violation,
-                                photo_path=temp_img
-                            )
-                            
-                            saved_violations += 1
-                            print(f"Нарушение {saved_violations} в {filename} на {frame_time}: {violation}")
-                
+            with timed('yolo'):
+                detections = yolo_model.detect([frame])[0]
+            people_in_view = len(detections) > 0
+
+            if people_in_view:
+                stats['detected_frames'] += 1
+                count('detected_frames')
+                last_seen_time = current_time
+                for violation, box in find_violations(siz_model, frame, detections, options):
+                    snapshot = frame if box is None else draw_violation_box(frame, box)
+                    yield current_time, violation, snapshot, box
+
                 last_check_time = current_time
-            
-            frame_count += 1
-                
+                checked = True
+
+            frame_index = policy.next_frame(frame_index, fps, last_check_time, last_seen_time)
+    finally:
         cap.release()
-        print(f"Обработка завершена: {filename}. Найдено нарушений: {saved_violations}")
\ No newline at end of file
+
+def iter_file_violations_pipelined(yolo_model, siz_model, video_path, options, start_frame=0, end_frame=None,
+                                   stats=None, on_progress=None, cancel_event=None, last_check_time=None):
+    """
+    Конвейерный вариант iter_file_violations: кадры декодируются в отдельном потоке
+    FrameDecoder, а YOLO и модель СИЗ обрабатывают их пакетами из очереди.
+    """
+    policy = options.sampling
+    decoder = FrameDecoder(video_path, policy, start_frame, end_frame, options.queue_size)
+    if not decoder.is_opened():
+        raise VideoReadError(f"Не удалось открыть видео: {os.path.basename(video_path)}")
+
+    checked = last_check_time is not None
+    if not checked:
+        last_check_time = -policy.cooldown_seconds
+    last_seen_time = start_frame / decoder.fps
+    decoder.update(last_check_time, last_seen_time)
+    decoder.start()
+    people_in_view = False
+    gate = options.motion.create_gate()
+    if stats is None:
+        stats = new_frame_stats()
+
+    position = None
+
+    try:
+        for batch in decoder.batches(options.batch_size):
+            # Нарушения предыдущего пакета к этому моменту выданы и приняты вызывающим
+            if on_progress and position is not None:
+                on_progress(position, last_check_time if checked else None)
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            position = batch[-1][0] + 1
+            # Кадры, декодированные до того, как декодер узнал о новой проверке,
+            # отбрасываются без запуска YOLO
+            batch = [item for item in batch if item[1] - last_check_time >= policy.cooldown_seconds]
+            stats['sampled_frames'] += len(batch)
+            count('sampled_frames', len(batch))
+            if gate:
+                # Пока в кадре есть люди, фильтр движения пропускает все кадры
+                passed = [item for item in batch if gate.should_detect(item[2], item[1], people_in_view)]
+                stats['gated_frames'] += len(batch) - len(passed)
+                count('gated_frames', len(batch) - len(passed))
+                batch = passed
+            if not batch:
+                continue
+
+            frames = [frame for _, _, frame in batch]
+            with timed('yolo'):
+                detections_list = yolo_model.detect(frames)
+            people_in_view = len(detections_list[-1]) > 0
+
+            # Окно ожидания зависит только от времени кадров, поэтому кадры для проверки СИЗ
+            # отбираются до вызова модели, и весь отбор классифицируется одним пакетом
+            selected = []
+            for (_, current_time, frame), detections in zip(batch, detections_list):
+                if len(detections) == 0:
+                    continue
+                stats['detected_frames'] += 1
+                count('detected_frames')
+                last_seen_time = current_time
+                if current_time - last_check_time >= policy.cooldown_seconds:
+                    selected.append((current_time, frame, detections))
+                    last_check_time = current_time
+                    checked = True
+            decoder.update(last_check_time, last_seen_time)
+
+            if not selected:
+                continue
+
+            violations = find_violations_batch(
+                siz_model,
+                [frame for _, frame, _ in selected],
+                [detections for _, _, detections in selected],
+                options
+            )
+            for (current_time, frame, _), frame_violations in zip(selected, violations):
+                for violation, box in frame_violations:
+                    snapshot = frame if box is None else draw_violation_box(frame, box)
+                    yield current_time, violation, snapshot, box
+    finally:
+        decoder.stop()
+        decoder.join()
+
+def save_violation(report_writer, camera_id, frame_time, violation, snapshot, options, box=None):
+    """
+    Кодирование снимка нарушения и передача отчета в буферизованную запись report_writer.
+    box - рамка нарушителя, сохраняемая в отчете (None при классификации всего кадра).
+    Возвращает True, если отчет принят к записи.
+    """
+    photo_data, thumbnail = encode_report_images(snapshot, options)
+    if photo_data is None:
+        print(f"Не удалось закодировать снимок нарушения камеры {camera_id} на {frame_time}")
+        return False
+
+    return report_writer.add(
+        camera_id=camera_id,
+        violation_time=frame_time,
+        violation_type=violation,
+        photo_data=photo_data,
+        thumbnail=thumbnail,
+        box=box
+    )
+
+def process_videos(yolo_model_path, siz_model_path, video_dir, conn, options=None, progress=None,
+                   photo_store=None, cancel_event=None, on_status=None):
+    """
+    Обработка видеофайлов и сохранение нарушений с использованием YOLO для детекции людей.
+    progress - необязательный обработчик progress(обработано, всего, имя файла).
+    photo_store - хранилище снимков (PhotoStore); без него снимки пишутся в BLOB отчетов.
+    cancel_event - threading.Event; после его установки обработка останавливается
+    по окончании текущего пакета, а прогресс файла сохраняется в журнале.
+    on_status - обработчик хода обработки (см. RunStatus), вызывается из потока обработки.
+    Файлы, уже обработанные по журналу PROCESSED_FILES, пропускаются (options.incremental).
+    Нечитаемые и оборванные файлы не отмечаются в журнале завершенными (сводка 'failed_files').
+    Метрики выгружаются и запуск профилируется по настройкам options.metrics.
+    Возвращает сводку {'files', 'segments', 'skipped', 'failed_files', 'violations', 'failed_reports',
+    'cancelled'} (violations - отчеты, записанные в БД) и счетчики кадров FRAME_STATS.
+    """
+    options = options or ProcessingOptions()
+    with metrics_session(options.metrics):
+        if options.workers > 1:
+            # Отложенный импорт: parallel_processor сам импортирует этот модуль
+            from .parallel_processor import process_videos_parallel
+            return process_videos_parallel(
+                yolo_model_path, siz_model_path, video_dir, conn, options, progress, photo_store,
+                cancel_event, on_status)
+        return _process_videos_sequential(
+            yolo_model_path, siz_model_path, video_dir, conn, options, progress, photo_store,
+            cancel_event, on_status)
+
+def _process_videos_sequential(yolo_model_path, siz_model_path, video_dir, conn, options, progress,
+                               photo_store, cancel_event, on_status):
+    """Обработка видеофайлов в текущем процессе (см. process_videos)"""
+    # Модели берутся из реестра процесса: повторные запуски не загружают их заново
+    yolo_model = get_yolo_model(yolo_model_path, options.inference)
+    siz_model = get_siz_model(siz_model_path, options.inference)
+
+    plans, skipped = plan_videos(conn, yolo_model_path, siz_model_path, video_dir, options)
+    failed_files = 0
+    stats = new_frame_stats()
+    cancelled = False
+
+    status = None
+    if on_status:
+        part_frames = [max(video_info(os.path.join(video_dir, plan.filename))[1] - plan.start_frame, 0)
+                       for plan in plans]
+        status = RunStatus(sum(part_frames), on_status)
+
+    # Отчеты пишутся пакетами; в конвейерном режиме запись идет в отдельном потоке,
+    # и на время обработки соединение используется только им
+    report_writer = ReportWriter(conn, options.write_batch_rows, options.write_flush_seconds, photo_store)
+    writer = None
+    if options.pipelined:
+        writer = ViolationWriter(save_violation, options.queue_size, idle=report_writer.flush_if_due)
+        writer.start()
+    write = writer.call if writer else (lambda func, *args: func(*args))
+
+    try:
+        for index, plan in enumerate(plans, 1):
+            filename, camera_id, video_start_time = plan.filename, plan.camera_id, plan.video_start_time
+            video_path = os.path.join(video_dir, filename)
+            saved_violations = 0
+
+            if plan.reset:
+                time_range = reset_time_range(plan, *video_info(video_path))
+                if time_range:
+                    write(report_writer.delete_reports, camera_id, *time_range)
+            checkpoints = None
+            if plan.entry:
+                checkpoints = FileCheckpoints(write, report_writer, plan.entry, options.checkpoint_seconds)
+
+            def on_progress(position, last_check_time):
+                if checkpoints:
+                    checkpoints(position, last_check_time)
+                if status:
+                    status.file_position(position - plan.start_frame)
+
+            read_error = None
+            try:
+                for current_time, violation, snapshot, box in iter_file_violations(
+                        yolo_model, siz_model, video_path, options, plan.start_frame, stats=stats,
+                        on_progress=on_progress, cancel_event=cancel_event,
+                        last_check_time=plan.entry.last_check_time if plan.entry else None):
+                    # Рассчитываем время кадра
+                    frame_time = video_start_time + timedelta(seconds=current_time)
+
+                    if writer:
+                        writer.submit(report_writer, camera_id, frame_time, violation, snapshot, options, box)
+                    elif not save_violation(report_writer, camera_id, frame_time, violation, snapshot, options, box):
+                        continue
+
+                    saved_violations += 1
+                    count('violations')
+                    if status:
+                        status.violations += 1
+                    location = f" (рамка {box})" if box is not None else ""
+                    print(f"Нарушение {saved_violations} в {filename} на {frame_time}: {violation}{location}")
+            except VideoReadError as e:
+                read_error = e
+
+            if cancel_event is not None and cancel_event.is_set():
+                # Файл не завершен: следующий запуск продолжит его с сохраненной отметки
+                if checkpoints:
+                    checkpoints.save()
+                cancelled = True
+                print(f"Обработка остановлена: {filename}. Найдено нарушений: {saved_violations}")
+                break
+
+            if read_error:
+                # Файл не отмечается завершенным: после докопирования или замены он будет обработан заново
+                if checkpoints:
+                    checkpoints.save()
+                failed_files += 1
+                print(f"Ошибка чтения видео: {str(read_error)}. Найдено нарушений: {saved_violations}")
+            else:
+                if checkpoints:
+                    checkpoints.complete()
+                print(f"Обработка завершена: {filename}. Найдено нарушений: {saved_violations}")
+            if status:
+                status.finish_part(part_frames[index - 1])
+            if progress:
+                progress(index, len(plans), filename)
+    finally:
+        # Буферизованные отчеты и отметки журнала записываются и при ошибке обработки
+        if writer:
+            writer.close()
+        report_writer.close()
+
+    if skipped:
+        print(f"Пропущено ранее обработанных файлов: {skipped}")
+    print(f"Кадров выбрано: {stats['sampled_frames']}, отсеяно фильтром движения: {stats['gated_frames']}")
+    # В сводку попадают записанные в БД отчеты, а не переданные в очередь записи
+    failed_reports = report_writer.failed + (writer.failed if writer else 0)
+    if failed_reports:
+        print(f"Не записано отчетов: {failed_reports}")
+    return {'files': len(plans), 'segments': len(plans), 'skipped': skipped, 'failed_files': failed_files,
+            'violations': report_writer.written, 'failed_reports': failed_reports, 'cancelled': cancelled,
+            **stats}
@@ -0,0 +1,24 @@
+import pytest
+
+from app.database import add_camera, add_workshop, create_memory_database, get_all_workshops
+
+@pytest.fixture
+def conn():
+    """БД SQLite в памяти с цехом 1 и камерами 1 и 2"""
+    conn = create_memory_database()
+    add_workshop(conn, 1)
+    workshop_id = get_all_workshops(conn)[0][0]
+    for camera_id in (1, 2):
+        add_camera(conn, camera_id, workshop_id)
+    yield conn
+    conn.close()
+
+@pytest.fixture(scope='session')
+def stub_models(tmp_path_factory):
+    """Пути (YOLO, СИЗ) к моделям-заглушкам из app.benchmark"""
+    pytest.importorskip("torch")
+    from app.benchmark import create_stub_models
+    from app.model_registry import clear_models
+
+    yield create_stub_models(str(tmp_path_factory.mktemp('models')))
+    clear_models()
@@ -0,0 +1,52 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("cv2")
+pytest.importorskip("onnxruntime")
+
+from app.backends import check_backend_parity
+
+class TinyClassifier(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.features = torch.nn.Conv2d(3, 4, 3, stride=2)
+        self.head = torch.nn.Linear(4, 2)
+
+    def forward(self, x):
+        return torch.sigmoid(self.head(self.features(x).mean(dim=(2, 3))))
+
+class TinyDetector(torch.nn.Module):
+    """Выход экспорта YOLOv5 (N, K, 85): рамки зависят от входа, уверенность выше порога"""
+
+    def __init__(self):
+        super().__init__()
+        self.features = torch.nn.Conv2d(3, 4, 3, stride=8)
+
+    def forward(self, x):
+        features = self.features(x).mean(dim=(2, 3))
+        boxes = torch.stack([320 + features[:, 0], 320 + features[:, 1],
+                             100 + features[:, 2].abs(), 200 + features[:, 3].abs()], dim=1)
+        scores = torch.full((x.shape[0], 81), 0.9)
+        return torch.cat([boxes, scores], dim=1).unsqueeze(1)
+
+def _export(module, example, tmp_path, name):
+    torch.manual_seed(0)
+    module = module.eval()
+    torchscript_path = str(tmp_path / f"{name}.torchscript")
+    onnx_path = str(tmp_path / f"{name}.onnx")
+    torch.jit.trace(module, example).save(torchscript_path)
+    torch.onnx.export(module, (example,), onnx_path, input_names=['images'], output_names=['output'],
+                      dynamic_axes={'images': {0: 'batch'}, 'output': {0: 'batch'}}, dynamo=False)
+    return torchscript_path, onnx_path
+
+def test_siz_parity(tmp_path):
+    torch.manual_seed(0)
+    paths = _export(TinyClassifier(), torch.rand(2, 3, 128, 128), tmp_path, 'siz')
+    ok, max_diff = check_backend_parity(*paths, kind='siz')
+    assert ok, max_diff
+
+def test_detector_parity(tmp_path):
+    torch.manual_seed(0)
+    paths = _export(TinyDetector(), torch.rand(2, 3, 640, 640), tmp_path, 'yolo')
+    ok, max_diff = check_backend_parity(*paths, kind='yolo')
+    assert ok, max_diff
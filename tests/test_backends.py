@@ -0,0 +1,73 @@
+import threading
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("cv2")
+
+from app import backends
+from app.backends import ExportedYoloDetector, TorchHubDetector
+from app.model_registry import _warmup_detector
+from app.model_utils import preprocess_frames
+
+class CountingDetector(ExportedYoloDetector):
+    """Детектор без модели: считает вызовы _run и размеры пакетов"""
+
+    def __init__(self, max_supported=None):
+        super().__init__(image_size=64)
+        self.max_supported = max_supported
+        self.calls = []
+
+    def _run(self, batch):
+        if self.max_supported is not None and len(batch) > self.max_supported:
+            raise RuntimeError("фиксированный размер пакета")
+        self.calls.append(len(batch))
+        return np.zeros((len(batch), 1, 85), dtype=np.float32)
+
+def _frames(count):
+    return [np.zeros((48, 64, 3), dtype=np.uint8) for _ in range(count)]
+
+def test_batch_after_warmup_is_single_call():
+    detector = CountingDetector()
+    _warmup_detector(detector)
+    detector.calls.clear()
+
+    detections = detector.detect(_frames(4))
+
+    assert detector.calls == [4]
+    assert len(detections) == 4
+
+def test_fixed_batch_export_falls_back_to_single_frames():
+    detector = CountingDetector(max_supported=1)
+    detector.detect(_frames(3))
+    assert detector.max_batch == 1
+
+    detector.calls.clear()
+    detector.detect(_frames(2))
+    assert detector.calls == [1, 1]
+
+def test_preprocess_buffers_are_per_thread():
+    main_batch = preprocess_frames(_frames(2))
+    expected = main_batch.clone()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(
+        preprocess_frames([np.full((48, 64, 3), 255, dtype=np.uint8)] * 2)))
+    thread.start()
+    thread.join()
+
+    # Предобработка в другом потоке не перезаписывает тензор этого потока
+    assert torch.equal(main_batch, expected)
+    assert not torch.equal(other[0], expected)
+
+def test_detector_without_run_is_abstract():
+    with pytest.raises(TypeError):
+        ExportedYoloDetector()
+
+def test_torch_hub_checkpoint_without_local_repo(tmp_path, monkeypatch):
+    monkeypatch.delenv(backends.YOLOV5_REPO_ENV, raising=False)
+    monkeypatch.setattr(torch.hub, 'get_dir', lambda: str(tmp_path))
+    monkeypatch.setattr(torch.hub, 'load', lambda *args, **kwargs: pytest.fail("загрузка из сети"))
+
+    with pytest.raises(RuntimeError, match="TorchScript или ONNX"):
+        TorchHubDetector(str(tmp_path / 'yolov5s.pt'))
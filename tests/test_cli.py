@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.__main__ import EXIT_OK, EXIT_USAGE, main
+from app.database import (add_camera, add_reports_batch, add_workshop, connect_database, create_database,
+                          get_all_workshops, get_report_photo)
+from app.photo_store import PhotoStore
+
+def test_compact_moves_legacy_blobs_to_store(tmp_path):
+    path = f"sqlite:///{tmp_path / 'reports.db'}"
+    assert create_database(path, None, None)
+    conn = connect_database(path, None, None)
+    add_workshop(conn, 1)
+    add_camera(conn, 1, get_all_workshops(conn)[0][0])
+    # Отчеты, записанные до хранилища снимков: фото в BLOB отчета
+    now = datetime.now()
+    assert add_reports_batch(conn, [(1, now, "Отсутствует каска", b'photo-1', b'thumb-1'),
+                                    (1, now - timedelta(days=100), "Отсутствует каска", b'photo-2', b'thumb-2')])
+    conn.close()
+
+    store_dir = str(tmp_path / 'photos')
+    assert main(['compact', '--db', path, '--photo-store', store_dir, '--retention-days', '30']) == EXIT_OK
+
+    conn = connect_database(path, None, None)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT REPORT_ID, PHOTO, PHOTO_HASH FROM REPORTS ORDER BY VIOLATION_TIME DESC")
+        (new_id, new_blob, new_hash), (old_id, old_blob, old_hash) = cur.fetchall()
+        store = PhotoStore(store_dir)
+        assert new_blob is None and new_hash
+        assert get_report_photo(conn, new_id, store) == b'photo-1'
+        # Снимок старше срока хранения удален, остается миниатюра
+        assert old_blob is None and old_hash is None
+        assert get_report_photo(conn, old_id, store) == b'thumb-2'
+    finally:
+        conn.close()
+
+def test_compact_without_database(tmp_path):
+    assert main(['compact', '--db', f"sqlite:///{tmp_path / 'missing.db'}"]) == EXIT_USAGE
+
+def test_export_writes_pdf_per_report(tmp_path):
+    pytest.importorskip("reportlab")
+    path = f"sqlite:///{tmp_path / 'reports.db'}"
+    assert create_database(path, None, None)
+    conn = connect_database(path, None, None)
+    add_workshop(conn, 1)
+    add_camera(conn, 1, get_all_workshops(conn)[0][0])
+    now = datetime.now()
+    assert add_reports_batch(conn, [(1, now, "Отсутствует каска", None),
+                                    (1, now - timedelta(days=3), "Отсутствует каска", None)])
+    conn.close()
+
+    output_dir = tmp_path / 'pdf'
+    assert main(['export', '--db', path, '--output-dir', str(output_dir), '--workers', '2',
+                 '--date-from', (now - timedelta(days=1)).strftime('%Y-%m-%d')]) == EXIT_OK
+    assert len(list(output_dir.glob('report_*.pdf'))) == 1
+
+def test_export_rejects_bad_date(tmp_path):
+    path = f"sqlite:///{tmp_path / 'reports.db'}"
+    assert create_database(path, None, None)
+    assert main(['export', '--db', path, '--output-dir', str(tmp_path), '--date-from', '06.04.2025']) == EXIT_USAGE
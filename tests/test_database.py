@@ -0,0 +1,232 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from app import database
+from app.database import (ReportWriter, add_camera, add_workshop, add_reports_batch, compact_photo_store,
+                          connect_database, create_database, create_memory_database, delete_reports_by_type,
+                          get_all_workshops, get_camera_workshops, get_processed_files, get_report_photo,
+                          migrate_database)
+from app.db_backends import FirebirdBackend
+from app.photo_store import PhotoStore
+
+START = datetime(2025, 4, 6, 8, 0, 0)
+LEDGER_ROW = ('CAMERA1_08:00:00.06.04.2025.mp4', 100, 1.0, 'hash', 250, 0, 'v1', START, None)
+
+def _add(writer, camera_id, minutes):
+    writer.add(camera_id, START + timedelta(minutes=minutes), "Отсутствует каска", photo_data=b'jpeg')
+
+def _report_count(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM REPORTS")
+    return cur.fetchone()[0]
+
+def test_bad_row_does_not_drop_batch(conn, monkeypatch):
+    monkeypatch.setattr(database, 'FLUSH_RETRY_SECONDS', 0)
+    writer = ReportWriter(conn, batch_rows=10)
+    for camera_id, minutes in [(1, 0), (99, 1), (2, 2)]:
+        _add(writer, camera_id, minutes)
+    writer.checkpoint(LEDGER_ROW)
+
+    # Камеры 99 нет в справочнике: отбрасывается только ее отчет
+    assert writer.close() is False
+    assert _report_count(conn) == 2
+    assert (writer.written, writer.failed) == (2, 1)
+    assert get_processed_files(conn)[LEDGER_ROW[0]][4] == 250
+
+def test_failed_flush_keeps_buffer_for_retry(conn, monkeypatch):
+    calls = []
+    add_reports_batch = database.add_reports_batch
+
+    def flaky(*args, **kwargs):
+        # Первая запись пакета и по одному отчету не проходит (например, блокировка)
+        calls.append(args)
+        if len(calls) <= 3:
+            return False
+        return add_reports_batch(*args, **kwargs)
+
+    monkeypatch.setattr(database, 'add_reports_batch', flaky)
+    writer = ReportWriter(conn, batch_rows=2, flush_seconds=3600)
+    _add(writer, 1, 0)
+    _add(writer, 2, 1)
+    writer.checkpoint(LEDGER_ROW)
+
+    assert len(writer.pending) == 2 and writer.checkpoints
+    assert _report_count(conn) == 0
+
+    assert writer.close() is True
+    assert _report_count(conn) == 2
+    assert (writer.written, writer.failed) == (2, 0)
+    assert LEDGER_ROW[0] in get_processed_files(conn)
+
+def test_person_box_is_stored(conn):
+    writer = ReportWriter(conn)
+    writer.add(1, START, "Отсутствует каска", photo_data=b'jpeg', box=(10, 20, 110, 220))
+    _add(writer, 2, 1)
+    writer.close()
+
+    cur = conn.cursor()
+    cur.execute("SELECT CAMERA_ID, BOX_X1, BOX_Y1, BOX_X2, BOX_Y2 FROM REPORTS ORDER BY CAMERA_ID")
+    assert cur.fetchall() == [(1, 10, 20, 110, 220), (2, None, None, None, None)]
+
+def test_expired_photo_falls_back_to_thumbnail(conn, tmp_path):
+    store = PhotoStore(str(tmp_path / 'photos'))
+    assert add_reports_batch(conn, [(1, START, "Отсутствует каска", b'photo', b'thumb'),
+                                    (2, datetime.now(), "Отсутствует каска", b'photo', b'thumb')], store)
+    compact_photo_store(conn, store, retention_days=30)
+
+    cur = conn.cursor()
+    cur.execute("SELECT REPORT_ID FROM REPORTS ORDER BY VIOLATION_TIME")
+    old_id, new_id = (row[0] for row in cur.fetchall())
+    assert get_report_photo(conn, old_id, store) == b'thumb'
+    assert get_report_photo(conn, new_id, store) == b'photo'
+
+def test_dedup_hit_refreshes_photo_mtime(tmp_path):
+    store = PhotoStore(str(tmp_path))
+    path = store.path_for(store.put(b'photo'))
+    os.utime(path, (0, 0))
+
+    store.put(b'photo')
+    assert os.path.getmtime(path) > 0
+
+def test_sqlite_timestamps_do_not_change_global_sqlite3(conn):
+    writer = ReportWriter(conn)
+    _add(writer, 1, 0)
+    writer.close()
+    cur = conn.cursor()
+    cur.execute("SELECT VIOLATION_TIME FROM REPORTS WHERE VIOLATION_TIME >= ?", (START,))
+    assert cur.fetchall() == [(START,)]
+
+    # Адаптеры и конвертеры модуля sqlite3 остаются стандартными
+    adapter = sqlite3.adapters.get((datetime, sqlite3.PrepareProtocol))
+    converter = sqlite3.converters.get('TIMESTAMP')
+    assert adapter is None or adapter.__module__ == 'sqlite3.dbapi2'
+    assert converter is None or converter.__module__ == 'sqlite3.dbapi2'
+
+def test_sqlite_converts_only_timestamp_columns(conn):
+    # Тип нарушения вводится пользователем и может выглядеть как время
+    violation_type = "2025-04-06 08:00:00"
+    assert add_reports_batch(conn, [(1, START, violation_type, b'jpeg')])
+    cur = conn.cursor()
+    cur.execute("SELECT VIOLATION_TIME, VIOLATION_TYPE FROM REPORTS")
+    assert cur.fetchall() == [(START, violation_type)]
+    cur.execute("SELECT PERIOD_START, VIOLATION_TYPE FROM VIOLATION_STATS_DAILY")
+    assert cur.fetchall() == [(START.replace(hour=0), violation_type)]
+
+def test_camera_directory_cache_is_per_database(conn, tmp_path):
+    other = create_memory_database()
+    try:
+        assert get_camera_workshops(conn) == {1: 1, 2: 1}
+        assert get_camera_workshops(other) == {}
+    finally:
+        other.close()
+
+    path = f"sqlite:///{tmp_path / 'reports.db'}"
+    assert create_database(path, None, None)
+    first, second = connect_database(path, None, None), connect_database(path, None, None)
+    try:
+        add_workshop(first, 7)
+        add_camera(first, 3, get_all_workshops(first)[0][0])
+        # Соединения одной базы пользуются одной записью кэша
+        assert get_camera_workshops(first) is get_camera_workshops(second)
+        assert get_camera_workshops(second) == {3: 7}
+    finally:
+        first.close()
+        second.close()
+
+class FakeFirebirdConnection:
+    """Соединение Firebird без сервера: считает запросы к MON$DATABASE"""
+
+    def __init__(self, path):
+        self.path = path
+        self.queries = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.queries += 1
+
+    def fetchone(self):
+        return (self.path.ljust(255),)
+
+def test_firebird_database_path_is_read_once_per_connection():
+    backend = FirebirdBackend()
+    first, second = FakeFirebirdConnection('/data/a.fdb'), FakeFirebirdConnection('/data/b.fdb')
+    assert [backend.database_path(conn) for conn in (first, second, first, second)] == \
+        ['/data/a.fdb', '/data/b.fdb', '/data/a.fdb', '/data/b.fdb']
+    assert (first.queries, second.queries) == (1, 1)
+
+def _hourly_counts(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT CAMERA_ID, VIOLATION_COUNT FROM VIOLATION_STATS_HOURLY ORDER BY CAMERA_ID")
+    return cur.fetchall()
+
+def test_stats_upsert_and_delete(conn):
+    writer = ReportWriter(conn)
+    for minutes in (0, 10, 20):
+        _add(writer, 1, minutes)
+    _add(writer, 2, 30)
+    writer.close()
+    assert _hourly_counts(conn) == [(1, 3), (2, 1)]
+
+    delete_reports_by_type(conn, "Отсутствует каска")
+    assert _hourly_counts(conn) == [(1, 0), (2, 0)]
+
+def test_interrupted_stats_migration_is_rerun(conn):
+    writer = ReportWriter(conn)
+    _add(writer, 1, 0)
+    writer.close()
+
+    # Прерванная миграция 4: таблицы созданы, агрегаты заполнены частично, версия не записана
+    cur = conn.cursor()
+    cur.execute("DELETE FROM SCHEMA_VERSION WHERE VERSION >= 4")
+    cur.execute("UPDATE VIOLATION_STATS_HOURLY SET VIOLATION_COUNT = 7")
+    conn.commit()
+
+    # Столбцы миграции 5 уже существуют: повторная миграция их пропускает
+    migrate_database(conn)
+    assert database.get_schema_version(conn) == database.SCHEMA_MIGRATIONS[-1][0]
+    assert _hourly_counts(conn) == [(1, 1)]
+
+def test_interrupted_index_migration_is_rerun(conn):
+    # Миграции прерваны после DDL (в SQLite он фиксируется сразу): индексы уже созданы, версии не записаны
+    cur = conn.cursor()
+    cur.execute("DELETE FROM SCHEMA_VERSION WHERE VERSION >= 1")
+    conn.commit()
+
+    migrate_database(conn)
+    assert database.get_schema_version(conn) == database.SCHEMA_MIGRATIONS[-1][0]
+
+def test_concurrent_writers_update_same_aggregate(tmp_path):
+    path = f"sqlite:///{tmp_path / 'reports.db'}"
+    assert create_database(path, None, None)
+    conn = connect_database(path, None, None)
+    add_workshop(conn, 1)
+    add_camera(conn, 1, get_all_workshops(conn)[0][0])
+    conn.close()
+
+    results = []
+
+    def write():
+        conn = connect_database(path, None, None)
+        try:
+            for minutes in range(20):
+                report = (1, START + timedelta(minutes=minutes), "Отсутствует каска", b'jpeg')
+                results.append(add_reports_batch(conn, [report]))
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=write) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conn = connect_database(path, None, None)
+    try:
+        assert all(results)
+        assert _hourly_counts(conn) == [(1, 40)]
+    finally:
+        conn.close()
@@ -0,0 +1,31 @@
+import os
+from contextlib import contextmanager
+import pytest
+
+pytest.importorskip("PyQt5.QtWidgets")
+pytest.importorskip("reportlab")
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+from app.gui import ReportsModel
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+class BrokenPool:
+    @contextmanager
+    def connection(self):
+        raise ConnectionError("сервер БД недоступен")
+        yield
+
+def test_fetch_error_stops_loading(app):
+    model = ReportsModel(BrokenPool())
+    errors = []
+    model.failed.connect(errors.append)
+
+    model.fetchMore()
+
+    assert errors == ["сервер БД недоступен"]
+    assert not model.canFetchMore()
+    assert model.rowCount() == 0
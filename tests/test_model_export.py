@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.model_export import export_siz_variant, main
+from app.model_utils import load_siz_model, preprocess_frames
+
+class TinySiz(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.features = torch.nn.Conv2d(3, 4, 3, stride=2)
+        self.norm = torch.nn.BatchNorm2d(4)
+        self.head = torch.nn.Linear(4, 2)
+
+    def forward(self, x):
+        features = torch.relu(self.norm(self.features(x))).mean(dim=(2, 3))
+        return torch.sigmoid(self.head(features))
+
+@pytest.fixture
+def model_path(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / 'siz.pt')
+    torch.jit.script(TinySiz().eval()).save(path)
+    return path
+
+@pytest.fixture
+def samples_dir(tmp_path):
+    directory = tmp_path / 'samples'
+    directory.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(4):
+        cv2.imwrite(str(directory / f"{i}.jpg"), rng.integers(0, 255, (96, 64, 3), dtype=np.uint8))
+    return str(directory)
+
+@pytest.mark.parametrize('quantization, variant', [('none', 'frozen'), ('dynamic', 'int8'), ('static', 'int8')])
+def test_exported_variant_loads(model_path, samples_dir, quantization, variant):
+    output_path = export_siz_variant(model_path, quantization, samples_dir)
+    assert output_path.endswith(f".{variant}.pt")
+
+    frames = [np.full((96, 64, 3), 128, dtype=np.uint8)] * 2
+    with torch.no_grad():
+        reference = load_siz_model(model_path)(preprocess_frames(frames).clone())
+        outputs = load_siz_model(model_path, variant)(preprocess_frames(frames).clone())
+    assert outputs.shape == (2, 2)
+    assert torch.allclose(outputs, reference, atol=0.1)
+
+def test_static_without_samples_is_usage_error(model_path):
+    with pytest.raises(SystemExit) as error:
+        main([model_path])
+    assert error.value.code == 2
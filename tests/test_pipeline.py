@@ -0,0 +1,28 @@
+import threading
+import pytest
+
+pytest.importorskip("cv2")
+
+from app.pipeline import ViolationWriter
+
+def test_writer_survives_failing_idle_flush():
+    flushes = threading.Event()
+
+    def flush():
+        flushes.set()
+        raise RuntimeError("блокировка БД")
+
+    written = []
+    writer = ViolationWriter(lambda record: written.append(record) or True, queue_size=1,
+                             idle=flush, idle_seconds=0.01)
+    writer.start()
+    assert flushes.wait(5.0)
+
+    # Поток записи продолжает работу: очередь из одного места не блокирует отправку
+    submitter = threading.Thread(target=lambda: [writer.submit(i) for i in range(5)], daemon=True)
+    submitter.start()
+    submitter.join(timeout=5.0)
+    assert not submitter.is_alive()
+    writer.close()
+    assert written == list(range(5))
+    assert writer.written == 5
@@ -0,0 +1,65 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+from app.database import (add_camera, add_reports_batch, add_workshop, connect_database, create_database,
+                          get_all_workshops)
+from app.photo_store import PhotoStore
+from app.report_generator import export_reports_parallel
+
+START = datetime(2025, 4, 6, 8, 0, 0)
+
+def _jpeg():
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+    ok, data = cv2.imencode('.jpg', np.full((48, 64, 3), 128, dtype=np.uint8))
+    assert ok
+    return data.tobytes()
+
+def _report_ids(path):
+    conn = connect_database(path, None, None)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT REPORT_ID FROM REPORTS ORDER BY REPORT_ID")
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+@pytest.fixture
+def reports_db(tmp_path):
+    path = f"sqlite:///{tmp_path / 'reports.db'}"
+    assert create_database(path, None, None)
+    store = PhotoStore(str(tmp_path / 'photos'))
+    conn = connect_database(path, None, None)
+    try:
+        add_workshop(conn, 1)
+        add_camera(conn, 1, get_all_workshops(conn)[0][0])
+        # Второй отчет без снимка: в PDF выводится "Изображение недоступно"
+        assert add_reports_batch(conn, [(1, START, "Отсутствует каска", _jpeg()),
+                                        (1, START + timedelta(minutes=1), "Отсутствует жилет", None),
+                                        (1, START + timedelta(minutes=2), "Отсутствует каска", _jpeg())], store)
+    finally:
+        conn.close()
+    return path, store
+
+def test_parallel_export_writes_pdf_per_report(reports_db, tmp_path):
+    path, store = reports_db
+    output_dir = str(tmp_path / 'pdf')
+
+    paths = export_reports_parallel(path, None, None, output_dir, photo_store_root=store.root,
+                                    workers=2, chunk_size=1)
+
+    expected = [os.path.join(output_dir, f"report_{report_id}.pdf") for report_id in _report_ids(path)]
+    assert sorted(paths) == sorted(expected)
+    for pdf in expected:
+        with open(pdf, 'rb') as f:
+            assert f.read(5) == b'%PDF-'
+
+def test_parallel_export_filters(reports_db, tmp_path):
+    path, store = reports_db
+    paths = export_reports_parallel(path, None, None, str(tmp_path / 'pdf'), photo_store_root=store.root,
+                                    workers=2, violation_type="жилет")
+    assert [os.path.basename(p) for p in paths] == [f"report_{_report_ids(path)[1]}.pdf"]
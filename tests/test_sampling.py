@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("cv2")
+
+from app.sampling import SamplingPolicy
+
+def test_idle_rate_is_off_by_default():
+    policy = SamplingPolicy()
+    assert policy.frame_step(30, idle=True) == policy.frame_step(30) == 5
+    assert policy.next_frame(300, 30, last_check_time=0, last_seen_time=0) == 305
+
+def test_idle_rate_when_enabled():
+    policy = SamplingPolicy(idle_samples_per_second=2.0)
+    assert policy.frame_step(30, idle=True) == 15
+    assert policy.next_frame(300, 30, last_check_time=0, last_seen_time=0) == 315
+    assert policy.next_frame(300, 30, last_check_time=0, last_seen_time=9) == 305
@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("cv2")
+
+from app import streaming
+from app.benchmark import generate_synthetic_videos
+from app.sampling import SamplingPolicy
+from app.streaming import CameraCapture, FrameSlots, StreamProcessor
+
+def _wait(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+@pytest.fixture
+def video_path(tmp_path):
+    # Секунда записи: яркий "человек" в кадре с первого кадра
+    return generate_synthetic_videos(str(tmp_path), cameras=1, seconds=1, fps=10)[0]
+
+def test_frame_slots_keep_latest_frame():
+    slots = FrameSlots()
+    slots.put(1, 'old')
+    slots.put(1, 'new')
+    slots.put(2, 'other')
+
+    assert slots.dropped == 1
+    assert sorted(slots.take(timeout=0)) == [(1, 'new'), (2, 'other')]
+    assert slots.take(timeout=0) == []
+
+def test_capture_reconnects_after_end_of_file_and_drops_stale_frames(video_path, monkeypatch):
+    monkeypatch.setattr(streaming, 'RECONNECT_INITIAL_SECONDS', 0.05)
+    slots = FrameSlots()
+    stop_event = threading.Event()
+    capture = CameraCapture(1, video_path, slots, SamplingPolicy(cooldown_seconds=0), stop_event)
+    capture.start()
+    try:
+        assert _wait(lambda: capture.reconnects >= 1 and capture.frames_read > 10)
+    finally:
+        stop_event.set()
+        capture.join(timeout=5.0)
+
+    # Кадры никто не забирал: в слоте остается один последний, остальные отброшены
+    assert capture.frames_published >= 2
+    assert slots.dropped == capture.frames_published - 1
+    assert len(slots.take(timeout=0)) == 1
+
+def test_stream_processor_writes_reports(video_path, conn, stub_models):
+    processor = StreamProcessor(*stub_models, {1: video_path}, conn)
+    alerts = []
+    processor.on_alert = lambda *alert: alerts.append(alert)
+    processor.start()
+    try:
+        assert _wait(lambda: processor.stats['violations'] >= 1)
+    finally:
+        processor.stop()
+
+    assert processor.report_writer.written == processor.stats['violations']
+    assert len(alerts) == processor.stats['violations']
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM REPORTS WHERE CAMERA_ID = 1")
+    assert cur.fetchone()[0] == processor.stats['violations']
+
+def test_stop_without_start(video_path, conn, stub_models):
+    processor = StreamProcessor(*stub_models, {1: video_path}, conn)
+    processor.stop()
@@ -0,0 +1,97 @@
+import os
+import threading
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("cv2")
+
+from app.benchmark import generate_synthetic_videos
+from app.database import add_camera, add_workshop, create_memory_database, get_all_workshops, get_processed_files
+from app.sampling import SamplingPolicy
+from app.video_processor import ProcessingOptions, process_videos
+
+BROKEN_VIDEO = "CAMERA2_08:00:00.06.04.2025.mp4"
+
+@pytest.fixture
+def video_dir(tmp_path):
+    video_dir = str(tmp_path / 'videos')
+    os.makedirs(video_dir)
+    generate_synthetic_videos(video_dir, cameras=1, seconds=2, fps=10)
+    # Недокопированный файл: заголовок без данных
+    with open(os.path.join(video_dir, BROKEN_VIDEO), 'wb') as f:
+        f.write(b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 64)
+    return video_dir
+
+@pytest.mark.parametrize('options', [
+    ProcessingOptions(),
+    ProcessingOptions(pipelined=True),
+    ProcessingOptions(workers=2, threads_per_worker=1),
+], ids=['sequential', 'pipelined', 'parallel'])
+def test_unreadable_file_is_not_completed(video_dir, conn, stub_models, options):
+    summary = process_videos(*stub_models, video_dir, conn, options)
+
+    assert summary['failed_files'] == 1
+    ledger = get_processed_files(conn)
+    completed = {name for name, row in ledger.items() if row[5]}
+    assert BROKEN_VIDEO not in completed
+    assert len(completed) == 1
+
+    # Повторный запуск пропускает только прочитанный файл
+    summary = process_videos(*stub_models, video_dir, conn, options)
+    assert summary['skipped'] == 1
+    assert summary['failed_files'] == 1
+
+def _report_count(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM REPORTS")
+    return cur.fetchone()[0]
+
+@pytest.mark.parametrize('pipelined', [False, True], ids=['sequential', 'pipelined'])
+def test_buffered_reports_are_written_on_error(video_dir, conn, stub_models, pipelined):
+    os.remove(os.path.join(video_dir, BROKEN_VIDEO))
+
+    def progress(done, total, filename):
+        raise RuntimeError("ошибка после первого файла")
+
+    with pytest.raises(RuntimeError):
+        process_videos(*stub_models, video_dir, conn, ProcessingOptions(pipelined=pipelined), progress)
+    assert _report_count(conn) == 1
+
+@pytest.mark.parametrize('pipelined', [False, True], ids=['sequential', 'pipelined'])
+def test_summary_counts_written_reports(video_dir, conn, stub_models, pipelined):
+    summary = process_videos(*stub_models, video_dir, conn, ProcessingOptions(pipelined=pipelined))
+    assert summary['violations'] == _report_count(conn) == 1
+    assert summary['failed_reports'] == 0
+
+class CancelAfter(threading.Event):
+    """Отмена, срабатывающая на checks-й проверке (после обработки первых кадров)"""
+
+    def __init__(self, checks):
+        super().__init__()
+        self.checks = checks
+
+    def is_set(self):
+        self.checks -= 1
+        if self.checks <= 0:
+            self.set()
+        return super().is_set()
+
+@pytest.mark.parametrize('pipelined', [False, True], ids=['sequential', 'pipelined'])
+def test_resumed_file_keeps_cooldown(video_dir, conn, stub_models, pipelined):
+    os.remove(os.path.join(video_dir, BROKEN_VIDEO))
+    options = ProcessingOptions(pipelined=pipelined, batch_size=2, checkpoint_seconds=0,
+                                sampling=SamplingPolicy(cooldown_seconds=1.5))
+    clean_conn = create_memory_database()
+    add_workshop(clean_conn, 1)
+    add_camera(clean_conn, 1, get_all_workshops(clean_conn)[0][0])
+    try:
+        clean = process_videos(*stub_models, video_dir, clean_conn, options)['violations']
+    finally:
+        clean_conn.close()
+
+    # Прерванный и продолженный с отметки журнала файл дает те же отчеты, что и обработка без остановки
+    assert process_videos(*stub_models, video_dir, conn, options, cancel_event=CancelAfter(2))['cancelled']
+    (row,) = get_processed_files(conn).values()
+    assert row[4] > 0 and not row[5]
+    process_videos(*stub_models, video_dir, conn, options)
+    assert _report_count(conn) == clean > 1